@@ -1,32 +1,119 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.core.database import get_db
+from app.core.database import AsyncSessionLocal, get_async_db
 from app.models.user import RepositorySyncTask
 from app.schemas.log import SyncLogResponse
+import base64
+import csv
+import io
+import json
+from datetime import datetime
 
 router = APIRouter()
 
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FIELDS = ["id", "github_repo_url", "gitee_repo_url", "status", "error_message", "created_at", "updated_at"]
+
+
+def encode_cursor(task: RepositorySyncTask) -> str:
+    raw = json.dumps([task.created_at.isoformat(), task.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, task_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(task_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _logs_query(user_id: int, status: Optional[str]):
+    # Newest first, with id breaking ties between tasks created in the same second;
+    # served by the (user_id, created_at) / (user_id, status, created_at) indexes
+    query = select(RepositorySyncTask).where(RepositorySyncTask.user_id == user_id)
+    if status:
+        query = query.where(RepositorySyncTask.status == status)
+    return query.order_by(RepositorySyncTask.created_at.desc(), RepositorySyncTask.id.desc())
+
+
 @router.get("/{user_id}", response_model=List[SyncLogResponse])
-def get_sync_logs(
-    user_id: int, 
-    status: Optional[str] = Query(None, description="Filter by status (completed, failed, syncing, pending)"),
-    limit: int = 50,
-    offset: int = 0,
-    db: Session = Depends(get_db)
+async def get_sync_logs(
+    user_id: int,
+    response: Response,
+    status: Optional[str] = Query(None, description="Filter by status (completed, up_to_date, failed, cancelled, syncing, pending)"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    offset: int = Query(0, ge=0, deprecated=True),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    print(f"📋 [DEBUG] API Hit: get_sync_logs for user {user_id} (status={status})")
-    try:
-        print(f"📋 [DEBUG] Starting DB query for user_id={user_id}")
-        query = db.query(RepositorySyncTask).filter(RepositorySyncTask.user_id == user_id)
-        if status:
-            query = query.filter(RepositorySyncTask.status == status)
-        
-        tasks = query.order_by(RepositorySyncTask.created_at.desc()).offset(offset).limit(limit).all()
-        print(f"📋 [DEBUG] DB query finished. Found {len(tasks)} tasks.")
-        return tasks
-    except Exception as e:
-        print(f"❌ [DEBUG] Error in get_sync_logs: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+    """
+    One page of a user's sync history. When more rows exist the response carries an opaque
+    `X-Next-Cursor` header; pass it back as `cursor` for the next page.
+    """
+    query = _logs_query(user_id, status)
+    if cursor:
+        created_at, task_id = decode_cursor(cursor)
+        query = query.where(or_(
+            RepositorySyncTask.created_at < created_at,
+            and_(RepositorySyncTask.created_at == created_at, RepositorySyncTask.id < task_id)
+        ))
+    elif offset:
+        query = query.offset(offset)
+
+    # One extra row tells whether there is a next page
+    tasks = (await db.execute(query.limit(limit + 1))).scalars().all()
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(tasks[-1])
+    return tasks
+
+
+async def _export_rows(user_id: int, status: Optional[str]):
+    # The response outlives the request's dependencies, so the stream owns its session.
+    # AsyncSession.stream() reads through a server-side cursor
+    async with AsyncSessionLocal() as db:
+        query = _logs_query(user_id, status).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        result = await db.stream(query)
+        async for task in result.scalars():
+            yield SyncLogResponse.model_validate(task).model_dump(mode="json")
+
+
+async def _ndjson(rows):
+    async for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+async def _csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    i = 0
+    async for row in rows:
+        i += 1
+        writer.writerow(row)
+        if i % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+@router.get("/{user_id}/export")
+async def export_sync_logs(
+    user_id: int,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status: Optional[str] = Query(None, description="Filter by status (completed, up_to_date, failed, cancelled, syncing, pending)"),
+):
+    """Streams a user's full sync history as NDJSON or CSV without loading it into memory."""
+    rows = _export_rows(user_id, status)
+    if format == "csv":
+        body, media_type = _csv(rows), "text/csv"
+    else:
+        body, media_type = _ndjson(rows), "application/x-ndjson"
+    filename = f"sync-logs-{user_id}.{format}"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
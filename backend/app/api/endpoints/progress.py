@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import AsyncSessionLocal, get_async_db
+from app.core.redis import async_redis_client
+from app.models.user import RepositorySyncTask
+from app.services.progress import TERMINAL_STATUSES, active_key, status_event, task_channel, user_channel
+import json
+import redis
+
+router = APIRouter()
+
+KEEPALIVE_SECONDS = 15
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+async def _event_stream(request: Request, channel: str, user_id: int, task_id: int = None):
+    """
+    Relays a progress channel as SSE. Subscribes before reading the snapshot of running
+    tasks, so no event falls between the two. A task stream ends with the task's final status,
+    right away for a task that had already finished.
+    """
+    pubsub = async_redis_client.pubsub()
+    try:
+        await pubsub.subscribe(channel)
+        if task_id is None:
+            snapshot = list((await async_redis_client.hgetall(active_key(user_id))).values())
+        else:
+            # Workers commit the final status before announcing it, so a task that finishes
+            # after this read still reaches the subscription
+            async with AsyncSessionLocal() as db:
+                task = await db.get(RepositorySyncTask, task_id)
+            if task is not None and task.status in TERMINAL_STATUSES:
+                yield f"data: {json.dumps(status_event(task, task.status, task.error_message))}\n\n"
+                return
+            current = await async_redis_client.hget(active_key(user_id), task_id)
+            snapshot = [current] if current else []
+        for payload in snapshot:
+            yield f"data: {payload}\n\n"
+
+        while not await request.is_disconnected():
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=KEEPALIVE_SECONDS)
+            if message is None:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                continue
+            yield f"data: {message['data']}\n\n"
+            if task_id is not None and json.loads(message["data"]).get("status") in TERMINAL_STATUSES:
+                break
+    except redis.RedisError as e:
+        print(f"❌ Progress stream for {channel} failed: {e}")
+        yield f"event: error\ndata: {json.dumps({'detail': 'progress stream unavailable'})}\n\n"
+    finally:
+        await pubsub.aclose()
+
+
+@router.get("/{user_id}")
+async def stream_user_progress(user_id: int, request: Request):
+    """Server-Sent Events with status changes and transfer progress of all of a user's syncs."""
+    return StreamingResponse(
+        _event_stream(request, user_channel(user_id), user_id),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@router.get("/{user_id}/tasks/{task_id}")
+async def stream_task_progress(user_id: int, task_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Server-Sent Events for a single task, closed once it completes or fails."""
+    task = await db.get(RepositorySyncTask, task_id)
+    if task is None or task.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return StreamingResponse(
+        _event_stream(request, task_channel(task_id), user_id, task_id),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
@@ -1,64 +1,84 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import get_async_db
 from app.models.user import User, RepositorySyncTask
-from app.worker.tasks import sync_repository
+from app.services.bulk_sync import enqueue_repo_async
+from app.services.coalesce import mark_dirty_async, claim_dirty_async, record_ref_update_async
+from app.services.webhook_events import append_async, push_event, verify_signature
+import json
 
 router = APIRouter()
 
 @router.post("/github/{user_id}")
-async def github_webhook(user_id: int, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def github_webhook(user_id: int, request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)):
     """
     Webhook endpoint for receiving GitHub push events.
+    In stream mode (WEBHOOK_INGEST_MODE=stream) the push is only appended to the ingest stream
+    and answered with 202; `app.worker.webhook_consumer` plans the sync.
     """
+    body = await request.body()
+    if settings.GITHUB_WEBHOOK_SECRET and not verify_signature(
+        settings.GITHUB_WEBHOOK_SECRET, body, request.headers.get("X-Hub-Signature-256")
+    ):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
     event_type = request.headers.get("X-GitHub-Event")
     
     if event_type != "push":
         return {"message": "Ignored non-push event"}
 
-    # In a real-world scenario, you should verify the webhook signature here using X-Hub-Signature-256
-    # To keep it simple, we trust the incoming webhook if user_id is valid.
-    
-    payload = await request.json()
-    repository = payload.get("repository", {})
-    github_repo_url = repository.get("clone_url")
-    repo_name = repository.get("name")
-    
-    if not github_repo_url or not repo_name:
-        raise HTTPException(status_code=400, detail="Invalid payload: missing repository details")
+    try:
+        payload = json.loads(body)
+        event = push_event(user_id, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    github_repo_url = event["github_repo_url"]
+    repo_name = event["repo_name"]
+
+    if settings.WEBHOOK_INGEST_MODE == "stream":
+        accepted = await append_async(event, request.headers.get("X-GitHub-Delivery"))
+        return JSONResponse(status_code=202, content={"message": "Push accepted" if accepted else "Duplicate delivery ignored"})
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user or not user.github_access_token or not user.gitee_access_token:
         # Ignore if user not completely set up
         raise HTTPException(status_code=400, detail="User account not fully linked")
 
+    # Remember which ref moved so the worker can sync just that ref
+    ref = payload.get("ref")
+    if ref and payload.get("before") and payload.get("after"):
+        await record_ref_update_async(
+            user.id, github_repo_url, ref,
+            before=payload["before"],
+            after=payload["after"],
+            deleted=bool(payload.get("deleted")),
+            forced=bool(payload.get("forced"))
+        )
+
     # Check for existing pending/syncing task
-    existing_task = db.query(RepositorySyncTask).filter(
+    existing_task = (await db.execute(select(RepositorySyncTask).where(
         RepositorySyncTask.user_id == user.id,
         RepositorySyncTask.github_repo_url == github_repo_url,
         RepositorySyncTask.status.in_(["pending", "syncing"])
-    ).first()
+    ).order_by(RepositorySyncTask.id.desc()).limit(1))).scalars().first()
     
+    if existing_task and existing_task.status == "pending":
+        # The queued sync fetches GitHub when it starts, so it already covers this push
+        return {"message": "Push coalesced into queued sync", "task_id": existing_task.id}
+
     if existing_task:
-        return {"message": "Sync already in progress or queued"}
+        # A sync is running and may have fetched before this push: flag a follow-up run
+        await mark_dirty_async(user.id, github_repo_url)
+        await db.commit()  # end the read snapshot so the re-check sees the worker's latest status
+        await db.refresh(existing_task)
+        if existing_task.status in ("pending", "syncing") or not await claim_dirty_async(user.id, github_repo_url):
+            return {"message": "Sync in progress, follow-up sync scheduled", "task_id": existing_task.id}
+        # The sync finished before it could see the flag, so the follow-up is ours to queue
 
-    task_record = RepositorySyncTask(
-        user_id=user.id,
-        github_repo_url=github_repo_url,
-        gitee_repo_url=f"https://gitee.com/{user.gitee_username}/{repo_name}.git",
-        status="pending"
-    )
-    db.add(task_record)
-    db.commit()
-    db.refresh(task_record)
-    
-    # Trigger celery task
-    sync_repository.delay(
-        task_id=task_record.id,
-        github_repo_url=task_record.github_repo_url,
-        gitee_repo_url=task_record.gitee_repo_url,
-        github_pat=user.github_access_token,
-        gitee_pat=user.gitee_access_token
-    )
+    # Delay the start so a burst of pushes lands in this one queued sync
+    task_id = await enqueue_repo_async(db, user, github_repo_url, repo_name, countdown=settings.WEBHOOK_DEBOUNCE_SECONDS, scoped=True)
 
-    return {"message": "Sync task queued from webhook", "task_id": task_record.id}
+    return {"message": "Sync task queued from webhook", "task_id": task_id}
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -19,6 +20,18 @@ class Settings(BaseSettings):
     GITEE_CLIENT_ID: str = os.getenv("GITEE_CLIENT_ID", "")
     GITEE_CLIENT_SECRET: str = os.getenv("GITEE_CLIENT_SECRET", "")
 
+    # Provider API endpoints and shared HTTP client behaviour
+    GITHUB_API_URL: str = os.getenv("GITHUB_API_URL", "https://api.github.com")
+    GITHUB_OAUTH_URL: str = os.getenv("GITHUB_OAUTH_URL", "https://github.com")
+    GITEE_URL: str = os.getenv("GITEE_URL", "https://gitee.com")
+    # Base of the Gitee clone URLs syncs push to (a file:// directory in the offline benchmarks)
+    GITEE_GIT_URL: str = os.getenv("GITEE_GIT_URL", os.getenv("GITEE_URL", "https://gitee.com"))
+    PROVIDER_TIMEOUT: float = float(os.getenv("PROVIDER_TIMEOUT", "10"))
+    PROVIDER_MAX_RETRIES: int = int(os.getenv("PROVIDER_MAX_RETRIES", "3"))
+    PROVIDER_POOL_SIZE: int = int(os.getenv("PROVIDER_POOL_SIZE", "10"))
+    # How long ETag-validated listings are kept in Redis for conditional requests
+    PROVIDER_ETAG_TTL: int = int(os.getenv("PROVIDER_ETAG_TTL", str(7 * 24 * 3600)))
+
     # MySQL configurations
     MYSQL_USER: str = os.getenv("MYSQL_USER", "root")
     MYSQL_PASSWORD: str = os.getenv("MYSQL_PASSWORD", "")
@@ -26,14 +39,88 @@ class Settings(BaseSettings):
     MYSQL_PORT: str = os.getenv("MYSQL_PORT", "3306")
     MYSQL_DB: str = os.getenv("MYSQL_DB", "github_sync")
 
+    # Full SQLAlchemy URL override (e.g. sqlite:///./dev.db for local runs and migrations)
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+
     @property
     def DATABASE_URI(self) -> str:
+        if self.DATABASE_URL:
+            return self.DATABASE_URL
         return f"mysql+pymysql://{self.MYSQL_USER}:{self.MYSQL_PASSWORD}@{self.MYSQL_SERVER}:{self.MYSQL_PORT}/{self.MYSQL_DB}"
 
+    @property
+    def ASYNC_DATABASE_URI(self) -> str:
+        """The same database through an asyncio driver (aiomysql / aiosqlite) for the API."""
+        url = self.DATABASE_URI
+        for sync_prefix, async_prefix in (("mysql+pymysql://", "mysql+aiomysql://"), ("mysql://", "mysql+aiomysql://"), ("sqlite://", "sqlite+aiosqlite://")):
+            if url.startswith(sync_prefix):
+                return async_prefix + url[len(sync_prefix):]
+        return url
+
     # Redis / Celery configurations
     CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
     CELERY_RESULT_BACKEND: str = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 
+    # Seconds before an unacknowledged (acks_late) task is handed to another worker
+    CELERY_VISIBILITY_TIMEOUT: int = int(os.getenv("CELERY_VISIBILITY_TIMEOUT", str(6 * 3600)))
+    # Bulk syncs of repos larger than this (GitHub's `size`, KiB) go to the sync.large queue
+    LARGE_REPO_SIZE_KB: int = int(os.getenv("LARGE_REPO_SIZE_KB", str(200 * 1024)))
+
+    # Fleet-wide provider rate limiting (token buckets in requests/second, git transfer slots)
+    PROVIDER_HOST_RATE: float = float(os.getenv("PROVIDER_HOST_RATE", "10"))
+    PROVIDER_HOST_BURST: int = int(os.getenv("PROVIDER_HOST_BURST", "20"))
+    PROVIDER_TOKEN_RATE: float = float(os.getenv("PROVIDER_TOKEN_RATE", "1"))
+    PROVIDER_TOKEN_BURST: int = int(os.getenv("PROVIDER_TOKEN_BURST", "10"))
+    GITHUB_GIT_CONCURRENCY: int = int(os.getenv("GITHUB_GIT_CONCURRENCY", "8"))
+    GITEE_GIT_CONCURRENCY: int = int(os.getenv("GITEE_GIT_CONCURRENCY", "4"))
+    GIT_TOKEN_CONCURRENCY: int = int(os.getenv("GIT_TOKEN_CONCURRENCY", "2"))
+    # Seconds before the git transfer slots of a dead worker free up; running syncs renew theirs
+    GIT_SLOT_TTL: int = int(os.getenv("GIT_SLOT_TTL", "300"))
+    RATE_LIMIT_MAX_WAIT: float = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+    RATE_LIMIT_DEFAULT_BACKOFF: float = float(os.getenv("RATE_LIMIT_DEFAULT_BACKOFF", "60"))
+    SYNC_RATE_LIMIT_MAX_RETRIES: int = int(os.getenv("SYNC_RATE_LIMIT_MAX_RETRIES", "8"))
+
+    # Running syncs renew a lease on their task every SYNC_HEARTBEAT_SECONDS. Every
+    # SYNC_REAPER_INTERVAL seconds, syncs whose lease ran out (worker killed or redeployed) are
+    # queued again, or failed once SYNC_LEASE_MAX_RECOVERIES runs of them were lost
+    SYNC_LEASE_SECONDS: int = int(os.getenv("SYNC_LEASE_SECONDS", "120"))
+    SYNC_HEARTBEAT_SECONDS: int = int(os.getenv("SYNC_HEARTBEAT_SECONDS", "30"))
+    SYNC_REAPER_INTERVAL: int = int(os.getenv("SYNC_REAPER_INTERVAL", "60"))
+    SYNC_LEASE_MAX_RECOVERIES: int = int(os.getenv("SYNC_LEASE_MAX_RECOVERIES", "2"))
+
+    # Webhook pushes arriving within this window are merged into one queued sync
+    WEBHOOK_DEBOUNCE_SECONDS: float = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", "10"))
+    # X-Hub-Signature-256 is required when a secret is configured
+    GITHUB_WEBHOOK_SECRET: str = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+    # "direct": plan the sync inside the request; "stream": append to a Redis stream and reply 202,
+    # `python -m app.worker.webhook_consumer` plans the syncs in batches
+    WEBHOOK_INGEST_MODE: str = os.getenv("WEBHOOK_INGEST_MODE", "direct")
+    WEBHOOK_STREAM_MAXLEN: int = int(os.getenv("WEBHOOK_STREAM_MAXLEN", "100000"))
+    WEBHOOK_BATCH_SIZE: int = int(os.getenv("WEBHOOK_BATCH_SIZE", "500"))
+
+    # Nightly auto sync: users per planning shard, and shard starts per second across all workers
+    # (a Redis token bucket shared by the fleet, with room for a short burst)
+    AUTO_SYNC_SHARD_SIZE: int = int(os.getenv("AUTO_SYNC_SHARD_SIZE", "20"))
+    AUTO_SYNC_SHARD_RATE: float = float(os.getenv("AUTO_SYNC_SHARD_RATE", "0.5"))
+    AUTO_SYNC_SHARD_BURST: int = int(os.getenv("AUTO_SYNC_SHARD_BURST", "2"))
+    # Nightly runs skip repos without a push since their last successful sync, except for a full
+    # sweep of every repo once this many days have passed since the last one (0: always full)
+    AUTO_SYNC_FULL_SWEEP_DAYS: int = int(os.getenv("AUTO_SYNC_FULL_SWEEP_DAYS", "7"))
+
+    # Known Gitee repos per owner (see app.services.gitee_repos) and parallel creates in bulk provisioning
+    GITEE_REPO_CACHE_TTL: int = int(os.getenv("GITEE_REPO_CACHE_TTL", str(6 * 3600)))
+    GITEE_PROVISION_CONCURRENCY: int = int(os.getenv("GITEE_PROVISION_CONCURRENCY", "4"))
+
+    # Worker-side persistent mirror cache (one bare mirror per user/repo, LRU-evicted)
+    MIRROR_CACHE_DIR: str = os.getenv("MIRROR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "syncpulse-mirrors"))
+    MIRROR_CACHE_MAX_BYTES: int = int(os.getenv("MIRROR_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+    # Watchdog for git commands: overall limit, and seconds without transfer progress before a
+    # clone/fetch/push/ls-remote is considered stalled; both kill the command's whole process group
+    GIT_TIMEOUT: int = int(os.getenv("GIT_TIMEOUT", str(4 * 3600)))
+    GIT_STALL_TIMEOUT: int = int(os.getenv("GIT_STALL_TIMEOUT", "600"))
+    # Pushes that would send more than this (packed bytes) go to Gitee in batches of about this size (0: never)
+    GIT_PUSH_CHUNK_BYTES: int = int(os.getenv("GIT_PUSH_CHUNK_BYTES", str(512 * 1024 ** 2)))
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,125 @@
+"""
+Prometheus metrics for the API and the Celery workers.
+
+With PROMETHEUS_MULTIPROC_DIR set (a directory shared by the API and worker processes of a
+host, emptied before they start) every process writes its samples there and `/metrics`
+aggregates them all; without it `/metrics` only reports the API process itself.
+"""
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+# Git phases and whole syncs run from milliseconds (up-to-date checks) to many minutes
+SYNC_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+SYNC_PHASE_SECONDS = Histogram(
+    "syncpulse_sync_phase_seconds", "Time spent in each sync_repository phase",
+    ["phase"], buckets=SYNC_BUCKETS,
+)
+SYNC_SECONDS = Histogram(
+    "syncpulse_sync_seconds", "Wall time of sync_repository runs by final status",
+    ["status"], buckets=SYNC_BUCKETS,
+)
+SYNC_QUEUE_WAIT_SECONDS = Histogram(
+    "syncpulse_sync_queue_wait_seconds", "Time from a task being queued (or its countdown ending) to a worker starting it",
+    buckets=SYNC_BUCKETS,
+)
+SYNC_LEASES_EXPIRED = Counter(
+    "syncpulse_sync_leases_expired", "Syncs found with an expired lease (their worker died), by what happened to them",
+    ["outcome"],
+)
+GIT_TRANSFER_BYTES = Counter(
+    "syncpulse_git_transfer_bytes", "Bytes git received from GitHub (fetch) or sent to Gitee (push)",
+    ["direction"],
+)
+GIT_TRANSFER_OBJECTS = Counter(
+    "syncpulse_git_transfer_objects", "Objects git received from GitHub (fetch) or sent to Gitee (push)",
+    ["direction"],
+)
+PROVIDER_REQUEST_SECONDS = Histogram(
+    "syncpulse_provider_request_seconds", "Outbound GitHub/Gitee API calls by host, method and status code",
+    ["host", "method", "status"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "syncpulse_db_query_seconds", "Database statement execution time by statement type",
+    ["operation"], buckets=DB_BUCKETS,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "syncpulse_http_request_seconds", "API request handling time by route template (time to response start for streams)",
+    ["method", "route", "status"],
+)
+
+# git's progress stages -> transfer direction
+TRANSFER_DIRECTIONS = {"Receiving objects": "fetch", "Writing objects": "push"}
+
+
+def observe_provider(host: str, method: str, status, started: float):
+    PROVIDER_REQUEST_SECONDS.labels(host or "unknown", method, str(status)).observe(time.perf_counter() - started)
+
+
+def observe_transfers(totals: dict):
+    """Adds a finished sync's {stage: (bytes, objects)} git totals."""
+    for stage, (size, objects) in totals.items():
+        direction = TRANSFER_DIRECTIONS.get(stage)
+        if direction:
+            GIT_TRANSFER_BYTES.labels(direction).inc(size)
+            GIT_TRANSFER_OBJECTS.labels(direction).inc(objects)
+
+
+def route_template(scope: dict) -> str:
+    """
+    The full path template of the matched route ("/api/v1/logs/{user_id}"), so requests for
+    different ids share a series. Routes of included routers only know their own part of it.
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    template = route.path
+    try:
+        rendered = template.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    path = scope.get("path", "")
+    prefix = path[:len(path) - len(rendered)] if path.endswith(rendered) else ""
+    return prefix + template
+
+
+def instrument_engine(engine):
+    """Times every statement a (sync) Engine runs; pass `async_engine.sync_engine` for the async one."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        DB_QUERY_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(context):
+        # No after_cursor_execute for a failed statement; drop its start time
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def render() -> tuple:
+    """(body, content type) of the current samples, across processes in multiprocess mode."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Drops a finished process's live gauges from the multiprocess directory."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,227 @@
+"""
+Redis-backed rate limiting shared by every API process and Celery worker.
+
+- Token buckets pace request *starts* per scope (a provider host, or a user's token on that host).
+- Semaphores cap how many long-running git transfers run at once per scope. Held slots expire
+  unless renewed (`renew_slots`, from the running sync's lease heartbeat), so a dead worker's
+  slots free up within GIT_SLOT_TTL.
+- A scope can be blocked until a provider-announced time (`Retry-After`, `X-RateLimit-Reset`).
+
+Callers that cannot get capacity within a short wait get `RateLimited` with a suggested delay
+(`SlotBusy` when only the transfer slots are taken, which is ordinary contention rather than
+provider throttling), so Celery tasks can be rescheduled instead of holding a worker slot or failing.
+If Redis is unreachable the limiter fails open.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import async_redis_client, redis_client
+
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+_TOKEN_BUCKET = redis_client.register_script(_TOKEN_BUCKET_LUA)
+_TOKEN_BUCKET_ASYNC = async_redis_client.register_script(_TOKEN_BUCKET_LUA)
+
+_SEMAPHORE = redis_client.register_script("""
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+""")
+
+
+# (key, holder) of the slots this process holds, for `renew_slots`
+_held_slots = set()
+_held_lock = threading.Lock()
+
+
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Rate limited on {scope}, retry in {retry_after:.0f}s")
+        self.scope = scope
+        self.retry_after = max(1.0, retry_after)
+
+
+class SlotBusy(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"All transfer slots on {scope} are busy, retry in {retry_after:.0f}s")
+        self.scope = scope
+        self.retry_after = max(1.0, retry_after)
+
+
+def token_scope(host: str, token: str) -> str:
+    """Scope for one user's credential on a host, without putting the token in a Redis key."""
+    return f"{host}:{hashlib.sha256(token.encode()).hexdigest()[:16]}"
+
+
+def block(scope: str, seconds: float):
+    """Makes every acquire on `scope` fail fast until the provider's reset time."""
+    if seconds <= 0:
+        return
+    try:
+        redis_client.set(f"ratelimit:blocked:{scope}", time.time() + seconds, px=int(seconds * 1000))
+    except redis.RedisError:
+        pass
+
+
+def blocked_for(scope: str) -> float:
+    try:
+        until = redis_client.get(f"ratelimit:blocked:{scope}")
+    except redis.RedisError:
+        return 0
+    return max(0.0, float(until) - time.time()) if until else 0
+
+
+def reserve(scope: str, rate: float, burst: int) -> float:
+    """Takes a token if one is available. Returns 0, or how long to wait before trying again."""
+    remaining = blocked_for(scope)
+    if remaining:
+        raise RateLimited(scope, remaining)
+    try:
+        return float(_TOKEN_BUCKET(keys=[f"ratelimit:bucket:{scope}"], args=[rate, burst, time.time()]))
+    except redis.RedisError:
+        return 0
+
+
+def acquire(scope: str, rate: float, burst: int, max_wait: float = None):
+    """Blocks until a token is available, or raises `RateLimited` after `max_wait` seconds."""
+    max_wait = settings.RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+    deadline = time.monotonic() + max_wait
+    while True:
+        wait = reserve(scope, rate, burst)
+        if wait <= 0:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimited(scope, wait)
+        time.sleep(wait)
+
+
+@contextmanager
+def concurrency_slot(scope: str, limit: int, ttl: int = None, max_wait: float = None):
+    """
+    Holds one of `limit` slots on `scope` for the duration of the block. Slots of crashed
+    holders expire after `ttl` seconds, unless renewed with `renew_slots`. Raises `SlotBusy`
+    when none frees up within `max_wait`, and `RateLimited` while the scope is blocked.
+    """
+    ttl = ttl or settings.GIT_SLOT_TTL
+    max_wait = settings.RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+    key = f"ratelimit:sem:{scope}"
+    holder = uuid.uuid4().hex
+    deadline = time.monotonic() + max_wait
+    delay = 0.2
+
+    while True:
+        remaining = blocked_for(scope)
+        if remaining:
+            raise RateLimited(scope, remaining)
+        try:
+            now = time.time()
+            if _SEMAPHORE(keys=[key], args=[now, limit, now + ttl, holder, ttl]):
+                break
+        except redis.RedisError:
+            holder = None
+            break
+        if time.monotonic() + delay > deadline:
+            raise SlotBusy(scope, settings.RATE_LIMIT_DEFAULT_BACKOFF)
+        time.sleep(delay)
+        delay = min(delay * 2, 5)
+
+    if holder:
+        with _held_lock:
+            _held_slots.add((key, holder))
+    try:
+        yield
+    finally:
+        if holder:
+            with _held_lock:
+                _held_slots.discard((key, holder))
+            try:
+                redis_client.zrem(key, holder)
+            except redis.RedisError:
+                pass
+
+
+def renew_slots(ttl: int = None):
+    """Pushes the expiry of every slot this process holds `ttl` seconds into the future."""
+    ttl = ttl or settings.GIT_SLOT_TTL
+    with _held_lock:
+        held = list(_held_slots)
+    if not held:
+        return
+    expires = time.time() + ttl
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for key, holder in held:
+            # XX: a slot released (or expired) meanwhile is not taken again
+            pipe.zadd(key, {holder: expires}, xx=True)
+            pipe.expire(key, ttl)
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+# --- Asyncio variants for the API's event loop (same keys, same scripts) ---
+
+async def block_async(scope: str, seconds: float):
+    if seconds <= 0:
+        return
+    try:
+        await async_redis_client.set(f"ratelimit:blocked:{scope}", time.time() + seconds, px=int(seconds * 1000))
+    except redis.RedisError:
+        pass
+
+
+async def blocked_for_async(scope: str) -> float:
+    try:
+        until = await async_redis_client.get(f"ratelimit:blocked:{scope}")
+    except redis.RedisError:
+        return 0
+    return max(0.0, float(until) - time.time()) if until else 0
+
+
+async def reserve_async(scope: str, rate: float, burst: int) -> float:
+    remaining = await blocked_for_async(scope)
+    if remaining:
+        raise RateLimited(scope, remaining)
+    try:
+        return float(await _TOKEN_BUCKET_ASYNC(keys=[f"ratelimit:bucket:{scope}"], args=[rate, burst, time.time()]))
+    except redis.RedisError:
+        return 0
+
+
+async def acquire_async(scope: str, rate: float, burst: int, max_wait: float = None):
+    max_wait = settings.RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+    deadline = time.monotonic() + max_wait
+    while True:
+        wait = await reserve_async(scope, rate, burst)
+        if wait <= 0:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimited(scope, wait)
+        await asyncio.sleep(wait)
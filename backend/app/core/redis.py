@@ -1,9 +1,16 @@
 import redis
+import redis.asyncio
 from app.core.config import settings
 
 # Create a redis client instance
 # We'll use the same URL as the celery broker for simplicity
 redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
 
+# Asyncio client for long-lived subscriptions (SSE) inside the event loop
+async_redis_client = redis.asyncio.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+
 def get_redis():
     return redis_client
+
+def get_async_redis():
+    return async_redis_client
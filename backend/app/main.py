@@ -1,17 +1,30 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import time
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from .core.config import settings
-from .core.database import engine, Base
+from .core import metrics
+from .core.database import async_engine
+from .core.redis import async_redis_client
 from .api.router import api_router
-from .models import user
+from .services.providers import close_async_client
+from . import models
 
-# Initialize database tables
-Base.metadata.create_all(bind=engine)
+# The schema is managed by Alembic (`alembic upgrade head`), not on API start
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release the pooled async connections (provider HTTP, database, Redis) on shutdown
+    await close_async_client()
+    await async_engine.dispose()
+    await async_redis_client.aclose()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="Sync GitHub repositories to Gitee",
     openapi_url="/api/v1/openapi.json",
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -22,14 +35,28 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Retry-After"],
     )
 
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = metrics.route_template(request.scope)
+    metrics.HTTP_REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(time.perf_counter() - started)
+    return response
+
 app.include_router(api_router, prefix="/api/v1")
 
 @app.get("/health")
 def health_check():
     return {"status": "ok", "message": "Service is running."}
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/ping")
 def ping():
     print("🔔 [DEBUG] Ping hit!")
@@ -1,2 +1,4 @@
 # To expose models to Alembic or Base.metadata
 from .user import User, RepositorySyncTask
+from .stats import SyncTaskDailyStat
+from .mirror import RepoMirror
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, BigInteger, Float, String, DateTime, JSON, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class RepoMirror(Base):
+    """
+    Current mirror state of one GitHub repository of a user, written together with its
+    sync tasks (`app.services.mirror_state`). The repo list reads this instead of the task log.
+    """
+    __tablename__ = "repo_mirrors"
+    __table_args__ = (
+        UniqueConstraint("user_id", "github_repo_url", name="uq_repo_mirrors_user_repo"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    github_repo_url = Column(String(255), nullable=False)
+    gitee_repo_url = Column(String(255), nullable=False)
+
+    # Newest task for the repo and its status (pending, syncing, completed, up_to_date, failed, cancelled)
+    last_task_id = Column(Integer, nullable=True)
+    last_status = Column(String(50), nullable=True)
+
+    # {ref: sha} of the branches and tags the last successful sync left on Gitee
+    synced_refs = Column(JSON, nullable=True)
+    last_duration = Column(Float, nullable=True)  # seconds
+    bytes_transferred = Column(BigInteger, nullable=True)
+    last_success_at = Column(DateTime(timezone=True), nullable=True)
+
+    # {"YYYY-MM-DD": finished syncs} for the repo list's heatmap
+    activity = Column(JSON, nullable=True)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, Date, ForeignKey
+from app.core.database import Base
+
+class SyncTaskDailyStat(Base):
+    """
+    Rollup of `RepositorySyncTask` rows per user, creation day and current status.
+    Kept up to date on every task insert and status change; the dashboard reads only this.
+    """
+    __tablename__ = "sync_task_daily_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    status = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
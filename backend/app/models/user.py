@@ -1,6 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.sql import func
 from app.core.database import Base
+from datetime import datetime, timezone
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
 
 class User(Base):
     __tablename__ = "users"
@@ -19,15 +24,31 @@ class User(Base):
 
 class RepositorySyncTask(Base):
     __tablename__ = "repository_sync_tasks"
+    # Match the trigger (active task per repo), logs and activity queries, and the lease reaper;
+    # see migrations/0003 and 0005
+    __table_args__ = (
+        Index("ix_sync_tasks_user_repo_status", "user_id", "github_repo_url", "status"),
+        Index("ix_sync_tasks_user_status_created", "user_id", "status", "created_at"),
+        Index("ix_sync_tasks_user_created", "user_id", "created_at"),
+        Index("ix_sync_tasks_status_lease", "status", "lease_expires_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     github_repo_url = Column(String(255), nullable=False)
     gitee_repo_url = Column(String(255), nullable=False)
     
-    # pending, syncing, completed, failed
+    # pending, syncing, completed, up_to_date, failed, cancelled
     status = Column(String(50), default="pending") 
     error_message = Column(String(1024), nullable=True)
+    # Running syncs renew this lease; see app.services.sync_lease
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    # Runs lost with their worker so far; also the lease's fencing token
+    recoveries = Column(Integer, nullable=False, default=0, server_default="0")
+    # Marks the rows of one multi-row INSERT, to read their ids back (MySQL has no RETURNING)
+    enqueue_batch = Column(String(32), nullable=True)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set on the client too, so stored values compare like the bound keyset cursors of the logs
+    # (SQLite keeps CURRENT_TIMESTAMP as text in another format)
+    created_at = Column(DateTime(timezone=True), default=_utcnow, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
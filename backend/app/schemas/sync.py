@@ -22,7 +22,20 @@ class SyncResponse(BaseModel):
 
 class BulkSyncRequest(BaseModel):
     user_id: int
+    force: bool = False  # also sync repos with no push since their last successful sync
+
+class CancelResponse(BaseModel):
+    task_id: int
+    status: str  # cancelled, or cancelling while a running sync stops
 
 class BulkSyncResponse(BaseModel):
     message: str
     task_count: int
+    job_id: Optional[str] = None
+
+class BulkJobStatus(BaseModel):
+    job_id: str
+    user_id: int
+    created_at: str
+    task_count: int
+    counts: dict[str, int]
@@ -0,0 +1,403 @@
+"""
+Sync task creation and dispatch.
+
+Bulk planning uses one query for the active tasks of all candidate repos, one multi-row INSERT
+for the new `RepositorySyncTask` rows and one Celery group publish, instead of several
+round trips per repo. Unless forced, it also skips repos whose GitHub `pushed_at` predates
+their last successful sync (from `RepoMirror`), so an unchanged fleet queues next to nothing.
+
+The `*_async` variants serve the API: database and Redis work goes through the asyncio
+clients, and the (blocking) Celery publish is handed to a worker thread.
+"""
+import asyncio
+import json
+import uuid
+from datetime import datetime, timezone
+
+from celery import group
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.redis import async_redis_client, redis_client
+from app.models.user import User, RepositorySyncTask
+from app.services.cancellation import celery_task_id
+from app.services.coalesce import claim_dirty, mark_dirty, record_ref_update
+from app.services.mirror_state import sync_marks_query, unchanged_since_sync
+from app.services.task_stats import record_created, record_created_async
+from app.worker.celery_app import QUEUE_BULK, QUEUE_INTERACTIVE, QUEUE_LARGE, QUEUE_WEBHOOK
+from app.worker.tasks import provision_gitee_repos, sync_repository
+
+ACTIVE_STATUSES = ("pending", "syncing")
+IN_CLAUSE_CHUNK = 500
+BULK_JOB_TTL = 24 * 3600
+
+
+def _chunks(items: list, size: int = IN_CLAUSE_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def gitee_repo_url(user: User, repo_name: str) -> str:
+    return f"{settings.GITEE_GIT_URL}/{user.gitee_username}/{repo_name}.git"
+
+
+def _new_task(user: User, github_repo_url: str, repo_name: str) -> RepositorySyncTask:
+    return RepositorySyncTask(
+        user_id=user.id,
+        github_repo_url=github_repo_url,
+        gitee_repo_url=gitee_repo_url(user, repo_name),
+        status="pending"
+    )
+
+
+def _queue(scoped: bool) -> str:
+    """Single syncs: webhook pushes (ref-scoped) or a user's click."""
+    return QUEUE_WEBHOOK if scoped else QUEUE_INTERACTIVE
+
+
+def _bulk_queue(repo: dict) -> str:
+    return QUEUE_LARGE if (repo.get("size") or 0) > settings.LARGE_REPO_SIZE_KB else QUEUE_BULK
+
+
+def _dispatch(task_record, user: User, countdown: float = None, scoped: bool = False):
+    sync_repository.apply_async(kwargs=dict(
+        task_id=task_record.id,
+        github_repo_url=task_record.github_repo_url,
+        gitee_repo_url=task_record.gitee_repo_url,
+        github_pat=user.github_access_token,
+        gitee_pat=user.gitee_access_token,
+        scoped=scoped
+    ), countdown=countdown, queue=_queue(scoped), task_id=celery_task_id(task_record.id))
+
+
+def _sync_group(created: list, users: dict, scoped: bool = False, queues: dict = None):
+    """
+    The syncs of `created` rows (id, github url, gitee url, user_id, ...) as one Celery group,
+    on `queues[github url]` or else the single-sync queue.
+    """
+    return group(
+        sync_repository.si(
+            task_id=task_id,
+            github_repo_url=github_url,
+            gitee_repo_url=gitee_url,
+            github_pat=users[user_id].github_access_token,
+            gitee_pat=users[user_id].gitee_access_token,
+            scoped=scoped
+        ).set(queue=queues[github_url] if queues else _queue(scoped), task_id=celery_task_id(task_id))
+        for task_id, github_url, gitee_url, user_id, *_ in created
+    )
+
+
+def _dispatch_group(created: list, users: dict, countdown: float = None, scoped: bool = False):
+    """One publish for many tasks."""
+    _sync_group(created, users, scoped).apply_async(countdown=countdown)
+
+
+def requeue(tasks: list, users: dict):
+    """
+    Publishes existing `pending` tasks again, for syncs recovered from a dead worker: full
+    mirrors, on the bulk queue so they do not jump ahead of clicks and pushes.
+    """
+    created = [(t.id, t.github_repo_url, t.gitee_repo_url, t.user_id) for t in tasks]
+    _sync_group(created, users, queues={t.github_repo_url: QUEUE_BULK for t in tasks}).apply_async()
+
+
+def _dispatch_bulk(created: list, user: User, candidates: dict):
+    """
+    One publish for a bulk run: a provisioning step that creates the user's missing Gitee
+    repos with bounded concurrency, then (chained) the syncs, which find their repos in place.
+    Syncs go out smallest repo first, so the queue drains quick ones before long ones.
+    """
+    created = sorted(created, key=lambda row: candidates[row[1]].get("size") or 0)
+    queues = {github_url: _bulk_queue(candidates[github_url]) for _, github_url, *_ in created}
+    repos = {candidates[github_url]["name"]: f"Mirrored from {github_url}" for _, github_url, *_ in created}
+    provision = provision_gitee_repos.si(user.gitee_access_token, user.gitee_username, repos)
+    (provision | _sync_group(created, {user.id: user}, queues=queues)).apply_async()
+
+
+def _active_query(user: User, urls: list):
+    return select(RepositorySyncTask.github_repo_url).where(
+        RepositorySyncTask.user_id == user.id,
+        RepositorySyncTask.github_repo_url.in_(urls),
+        RepositorySyncTask.status.in_(ACTIVE_STATUSES)
+    ).distinct()
+
+
+def _unchanged(candidates: dict, marks) -> set:
+    """URLs among `marks` (sync_marks_query rows) with no push since their last successful sync."""
+    return {
+        url for url, status, success_at, duration in marks
+        if unchanged_since_sync(candidates[url].get("pushed_at"), status, success_at, duration)
+    }
+
+
+def _insert_rows(user: User, candidates: dict, urls: list, batch: str) -> list:
+    return [
+        {
+            "user_id": user.id,
+            "github_repo_url": url,
+            "gitee_repo_url": gitee_repo_url(user, candidates[url]["name"]),
+            "status": "pending",
+            "enqueue_batch": batch,
+        }
+        for url in urls
+    ]
+
+
+def _created_query(batch: str, user_ids, urls: list):
+    # MySQL has no INSERT ... RETURNING; read the ids back in one query per chunk. The batch
+    # marker keeps out pending rows other triggers inserted for the same repos meanwhile.
+    return select(
+        RepositorySyncTask.id, RepositorySyncTask.github_repo_url, RepositorySyncTask.gitee_repo_url,
+        RepositorySyncTask.user_id, RepositorySyncTask.created_at, RepositorySyncTask.status
+    ).where(
+        RepositorySyncTask.user_id.in_(user_ids),
+        RepositorySyncTask.github_repo_url.in_(urls),
+        RepositorySyncTask.enqueue_batch == batch
+    )
+
+
+def _new_job(user: User, task_ids: list) -> tuple:
+    job_id = uuid.uuid4().hex
+    payload = json.dumps({
+        "user_id": user.id,
+        "task_ids": task_ids,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+    return job_id, payload
+
+
+def enqueue_repo(db: Session, user: User, github_repo_url: str, repo_name: str, countdown: float = None, scoped: bool = False) -> int:
+    """Creates and dispatches a single sync task. Returns the task id."""
+    task_record = _new_task(user, github_repo_url, repo_name)
+    db.add(task_record)
+    db.flush()
+    record_created(db, [task_record])
+    db.commit()
+    db.refresh(task_record)
+
+    _dispatch(task_record, user, countdown, scoped)
+    return task_record.id
+
+
+async def enqueue_repo_async(db: AsyncSession, user: User, github_repo_url: str, repo_name: str, countdown: float = None, scoped: bool = False) -> int:
+    task_record = _new_task(user, github_repo_url, repo_name)
+    db.add(task_record)
+    await db.flush()
+    await db.refresh(task_record)
+    await record_created_async(db, [task_record])
+    await db.commit()
+
+    await asyncio.to_thread(_dispatch, task_record, user, countdown, scoped)
+    return task_record.id
+
+
+def enqueue_repos(db: Session, user: User, repos: list, force: bool = False) -> tuple:
+    """
+    Creates and dispatches sync tasks for every repo in `repos` (GitHub listing entries)
+    that has no pending/syncing task yet and, unless `force`, has been pushed to since its
+    last successful sync. Returns (bulk_job_id, task_ids).
+    """
+    candidates = {r["clone_url"]: r for r in repos}
+    urls = list(candidates)
+
+    skip = set()
+    for chunk in _chunks(urls):
+        skip.update(db.execute(_active_query(user, chunk)).scalars())
+        if not force:
+            skip.update(_unchanged(candidates, db.execute(sync_marks_query(user.id, chunk))))
+
+    new_urls = [url for url in urls if url not in skip]
+    if not new_urls:
+        return None, []
+
+    batch = uuid.uuid4().hex
+    db.execute(insert(RepositorySyncTask), _insert_rows(user, candidates, new_urls, batch))
+    created = []
+    for chunk in _chunks(new_urls):
+        created.extend(db.execute(_created_query(batch, [user.id], chunk)).all())
+    record_created(db, created)
+    db.commit()
+
+    _dispatch_bulk(created, user, candidates)
+
+    task_ids = [row.id for row in created]
+    job_id, payload = _new_job(user, task_ids)
+    redis_client.setex(f"sync:bulk:{job_id}", BULK_JOB_TTL, payload)
+    return job_id, task_ids
+
+
+async def enqueue_repos_async(db: AsyncSession, user: User, repos: list, force: bool = False) -> tuple:
+    candidates = {r["clone_url"]: r for r in repos}
+    urls = list(candidates)
+
+    skip = set()
+    for chunk in _chunks(urls):
+        skip.update((await db.execute(_active_query(user, chunk))).scalars())
+        if not force:
+            skip.update(_unchanged(candidates, await db.execute(sync_marks_query(user.id, chunk))))
+
+    new_urls = [url for url in urls if url not in skip]
+    if not new_urls:
+        return None, []
+
+    batch = uuid.uuid4().hex
+    await db.execute(insert(RepositorySyncTask), _insert_rows(user, candidates, new_urls, batch))
+    created = []
+    for chunk in _chunks(new_urls):
+        created.extend((await db.execute(_created_query(batch, [user.id], chunk))).all())
+    await record_created_async(db, created)
+    await db.commit()
+
+    await asyncio.to_thread(_dispatch_bulk, created, user, candidates)
+
+    task_ids = [row.id for row in created]
+    job_id, payload = _new_job(user, task_ids)
+    await async_redis_client.setex(f"sync:bulk:{job_id}", BULK_JOB_TTL, payload)
+    return job_id, task_ids
+
+
+def plan_pushes(db: Session, events: list) -> dict:
+    """
+    Batch version of the webhook's direct path for pushes read from the ingest stream
+    (`webhook_events.push_event` dicts, oldest first): records the pushed refs, then per repo
+    coalesces into a queued sync, flags a running one for a follow-up, or queues a new
+    ref-scoped sync. All new tasks go in with one INSERT and one Celery publish.
+    Returns how many repos ended up in each outcome (events of unlinked users are `ignored`).
+    """
+    outcome = {"queued": 0, "coalesced": 0, "follow_up": 0, "ignored": 0}
+    user_ids = {event["user_id"] for event in events}
+    users = {
+        user.id: user
+        for user in db.execute(select(User).where(User.id.in_(user_ids))).scalars()
+        if user.github_access_token and user.gitee_access_token
+    }
+
+    repos = {}
+    for event in events:
+        if event["user_id"] not in users:
+            outcome["ignored"] += 1
+            continue
+        key = (event["user_id"], event["github_repo_url"])
+        repos[key] = event["repo_name"]
+        if event.get("ref") and event.get("before") and event.get("after"):
+            record_ref_update(
+                event["user_id"], event["github_repo_url"], event["ref"],
+                before=event["before"],
+                after=event["after"],
+                deleted=event["deleted"],
+                forced=event["forced"]
+            )
+    if not repos:
+        return outcome
+
+    # Latest active task per repo, one query per chunk of URLs
+    active = {}
+    urls = list({url for _, url in repos})
+    for chunk in _chunks(urls):
+        for task_id, user_id, url, status in db.execute(
+            select(RepositorySyncTask.id, RepositorySyncTask.user_id, RepositorySyncTask.github_repo_url, RepositorySyncTask.status).where(
+                RepositorySyncTask.user_id.in_(users),
+                RepositorySyncTask.github_repo_url.in_(chunk),
+                RepositorySyncTask.status.in_(ACTIVE_STATUSES)
+            ).order_by(RepositorySyncTask.id)
+        ):
+            active[(user_id, url)] = (task_id, status)
+
+    new, running = [], {}
+    for key in repos:
+        task = active.get(key)
+        if task is None:
+            new.append(key)
+        elif task[1] == "pending":
+            # The queued sync fetches GitHub when it starts, so it already covers this push
+            outcome["coalesced"] += 1
+        else:
+            mark_dirty(*key)
+            running[key] = task[0]
+
+    if running:
+        # Same race as the direct path: a sync that finished before it could see the flag
+        db.commit()  # end the read snapshot so the re-check sees the worker's latest status
+        still_active = set()
+        for chunk in _chunks(list(running.values())):
+            still_active.update(db.execute(select(RepositorySyncTask.id).where(
+                RepositorySyncTask.id.in_(chunk),
+                RepositorySyncTask.status.in_(ACTIVE_STATUSES)
+            )).scalars())
+        for key, task_id in running.items():
+            if task_id not in still_active and claim_dirty(*key):
+                new.append(key)
+            else:
+                outcome["follow_up"] += 1
+
+    if not new:
+        db.commit()
+        return outcome
+
+    batch = uuid.uuid4().hex
+    db.execute(insert(RepositorySyncTask), [
+        {
+            "user_id": user_id,
+            "github_repo_url": url,
+            "gitee_repo_url": gitee_repo_url(users[user_id], repos[(user_id, url)]),
+            "status": "pending",
+            "enqueue_batch": batch,
+        }
+        for user_id, url in new
+    ])
+    created = []
+    for chunk in _chunks(list({url for _, url in new})):
+        created.extend(db.execute(_created_query(batch, {user_id for user_id, _ in new}, chunk)).all())
+    record_created(db, created)
+    db.commit()
+
+    # Delay the start so a burst of pushes lands in these queued syncs
+    _dispatch_group(created, users, countdown=settings.WEBHOOK_DEBOUNCE_SECONDS, scoped=True)
+    outcome["queued"] += len(new)
+    return outcome
+
+
+def _status_counts_query(task_ids: list):
+    return select(RepositorySyncTask.status, func.count(RepositorySyncTask.id)).where(
+        RepositorySyncTask.id.in_(task_ids)
+    ).group_by(RepositorySyncTask.status)
+
+
+def _job_status(job_id: str, job: dict, counts: dict) -> dict:
+    return {
+        "job_id": job_id,
+        "user_id": job["user_id"],
+        "created_at": job["created_at"],
+        "task_count": len(job["task_ids"]),
+        "counts": counts,
+    }
+
+
+def bulk_job_status(db: Session, job_id: str):
+    """Per-status task counts for a bulk job, or None when the job id is unknown/expired."""
+    raw = redis_client.get(f"sync:bulk:{job_id}")
+    if not raw:
+        return None
+    job = json.loads(raw)
+
+    counts = {}
+    for chunk in _chunks(job["task_ids"]):
+        for status, count in db.execute(_status_counts_query(chunk)):
+            counts[status] = counts.get(status, 0) + count
+    return _job_status(job_id, job, counts)
+
+
+async def bulk_job_status_async(db: AsyncSession, job_id: str):
+    raw = await async_redis_client.get(f"sync:bulk:{job_id}")
+    if not raw:
+        return None
+    job = json.loads(raw)
+
+    counts = {}
+    for chunk in _chunks(job["task_ids"]):
+        for status, count in await db.execute(_status_counts_query(chunk)):
+            counts[status] = counts.get(status, 0) + count
+    return _job_status(job_id, job, counts)
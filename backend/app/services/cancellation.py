@@ -0,0 +1,70 @@
+"""
+Cancelling syncs.
+
+A queued task is revoked in Celery and marked `cancelled` right away. A running one only gets
+a cancel flag in Redis: the worker's git watchdog polls it, kills the running git command and
+the worker marks the task `cancelled` itself, so a running task's status has a single writer.
+Both sides lock the task row while deciding, so a task that starts while it is being cancelled
+ends up in exactly one of the two paths.
+"""
+import asyncio
+
+import redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.redis import async_redis_client, redis_client
+from app.models.user import RepositorySyncTask
+from app.services.task_stats import set_status_async
+from app.worker.celery_app import celery_app
+
+CANCEL_TTL = 24 * 3600
+CANCELLED_MESSAGE = "Cancelled by user"
+
+
+def cancel_key(task_id: int) -> str:
+    return f"sync:cancel:{task_id}"
+
+
+def celery_task_id(task_id: int) -> str:
+    """The Celery id every run of a sync task is published under, so it can be revoked by task id."""
+    return f"sync-{task_id}"
+
+
+def is_requested(task_id: int) -> bool:
+    try:
+        return bool(redis_client.exists(cancel_key(task_id)))
+    except redis.RedisError:
+        return False
+
+
+def clear(task_id: int):
+    try:
+        redis_client.delete(cancel_key(task_id))
+    except redis.RedisError:
+        pass
+
+
+async def cancel_async(db: AsyncSession, task_id: int):
+    """
+    Cancels a pending or running task. Returns its status afterwards: "cancelled" when it was
+    still queued, "cancelling" while a running one winds down, the final status of a task that
+    already finished, or None for an unknown task.
+    """
+    query = select(RepositorySyncTask).where(RepositorySyncTask.id == task_id).with_for_update()
+    task = (await db.execute(query)).scalar_one_or_none()
+    if task is None:
+        return None
+
+    if task.status == "syncing":
+        await async_redis_client.set(cancel_key(task_id), 1, ex=CANCEL_TTL)
+        await db.commit()
+        return "cancelling"
+    if task.status != "pending":
+        await db.commit()
+        return task.status
+
+    await set_status_async(db, task, "cancelled", error_message=CANCELLED_MESSAGE)
+    # Workers drop revoked messages, including countdowns they already hold
+    await asyncio.to_thread(celery_app.control.revoke, celery_task_id(task_id))
+    return "cancelled"
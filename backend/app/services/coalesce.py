@@ -0,0 +1,105 @@
+"""
+Per-repository push coalescing.
+
+A push that arrives while a sync for the same repo is *running* sets a dirty flag in Redis.
+Whoever clears the flag (the worker when it finishes, or the webhook if the sync finished
+in the meantime) enqueues exactly one follow-up sync, so the last push is never lost.
+
+The refs named by coalesced pushes are merged into one per-repo hash (ref -> first `before`,
+last `after`) that the next ref-scoped sync consumes.
+"""
+import hashlib
+import json
+
+from app.core.redis import async_redis_client, redis_client
+
+DIRTY_TTL = 24 * 3600
+ZERO_SHA = "0" * 40
+
+
+def _repo_hash(github_repo_url: str) -> str:
+    return hashlib.sha1(github_repo_url.encode()).hexdigest()
+
+
+def dirty_key(user_id: int, github_repo_url: str) -> str:
+    return f"sync:dirty:{user_id}:{_repo_hash(github_repo_url)}"
+
+
+def refs_key(user_id: int, github_repo_url: str) -> str:
+    return f"sync:refs:{user_id}:{_repo_hash(github_repo_url)}"
+
+
+def mark_dirty(user_id: int, github_repo_url: str):
+    redis_client.set(dirty_key(user_id, github_repo_url), 1, ex=DIRTY_TTL)
+
+
+def claim_dirty(user_id: int, github_repo_url: str) -> bool:
+    """Atomically clears the flag; True for the single caller that saw it set."""
+    return bool(redis_client.getdel(dirty_key(user_id, github_repo_url)))
+
+
+def clear_dirty(user_id: int, github_repo_url: str):
+    redis_client.delete(dirty_key(user_id, github_repo_url))
+
+
+def _merge_ref_update(raw: str, before: str, after: str, deleted: bool, forced: bool, older: bool = False) -> str:
+    """
+    Merges an update into the stored one: the earliest `before` and the latest `after`/`deleted`
+    win. The update is newer than what is stored, or with `older`, one that preceded it.
+    """
+    if raw:
+        previous = json.loads(raw)
+        forced = forced or previous["forced"]
+        if older:
+            after, deleted = previous["after"], previous["deleted"]
+        else:
+            before = previous["before"]
+    return json.dumps({"before": before, "after": after, "deleted": deleted, "forced": forced})
+
+
+def record_ref_update(user_id: int, github_repo_url: str, ref: str, before: str, after: str, deleted: bool = False, forced: bool = False, older: bool = False):
+    """
+    Merges one pushed ref into the pending set, atomically (WATCH/MULTI, retried on conflict).
+    `older` puts back an update taken by a sync that did not finish, behind any recorded since.
+    """
+    key = refs_key(user_id, github_repo_url)
+
+    def merge(pipe):
+        update = _merge_ref_update(pipe.hget(key, ref), before, after, deleted, forced, older)
+        pipe.multi()
+        pipe.hset(key, ref, update)
+        pipe.expire(key, DIRTY_TTL)
+
+    redis_client.transaction(merge, key)
+
+
+def pop_ref_updates(user_id: int, github_repo_url: str) -> dict:
+    """Atomically takes every pending ref update for the repo as {ref: update}."""
+    key = refs_key(user_id, github_repo_url)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hgetall(key)
+    pipe.delete(key)
+    raw, _ = pipe.execute()
+    return {ref: json.loads(update) for ref, update in raw.items()}
+
+
+# --- Asyncio variants for the webhook endpoint ---
+
+async def mark_dirty_async(user_id: int, github_repo_url: str):
+    await async_redis_client.set(dirty_key(user_id, github_repo_url), 1, ex=DIRTY_TTL)
+
+
+async def claim_dirty_async(user_id: int, github_repo_url: str) -> bool:
+    return bool(await async_redis_client.getdel(dirty_key(user_id, github_repo_url)))
+
+
+async def record_ref_update_async(user_id: int, github_repo_url: str, ref: str, before: str, after: str, deleted: bool = False, forced: bool = False):
+    key = refs_key(user_id, github_repo_url)
+
+    async def merge(pipe):
+        update = _merge_ref_update(await pipe.hget(key, ref), before, after, deleted, forced)
+        pipe.multi()
+        pipe.hset(key, ref, update)
+        pipe.expire(key, DIRTY_TTL)
+
+    await async_redis_client.transaction(merge, key)
@@ -0,0 +1,88 @@
+"""
+Conditional-request cache for provider GET calls.
+
+The ETag/Last-Modified validators and the decoded body of a response are kept in Redis per
+token+URL. Later requests send `If-None-Match`/`If-Modified-Since`, and a `304 Not Modified`
+(which GitHub does not count against the rate limit) is answered from the stored body.
+"""
+import hashlib
+import json
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import async_redis_client, redis_client
+
+
+def cache_key(token: str, url: str, params: dict) -> str:
+    query = "&".join(f"{k}={params[k]}" for k in sorted(params or {}))
+    digest = hashlib.sha256(f"{token}\n{url}?{query}".encode()).hexdigest()
+    return f"provider:etag:{digest}"
+
+
+def get(key: str):
+    try:
+        raw = redis_client.get(key)
+    except redis.RedisError:
+        return None
+    return json.loads(raw) if raw else None
+
+
+def validators(entry: dict) -> dict:
+    """Request headers that let the provider answer 304 for a cached entry."""
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def store(key: str, response_headers, body, last_page: int):
+    etag = response_headers.get("ETag")
+    last_modified = response_headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return
+    entry = {"etag": etag, "last_modified": last_modified, "body": body, "last_page": last_page}
+    try:
+        redis_client.setex(key, settings.PROVIDER_ETAG_TTL, json.dumps(entry))
+    except redis.RedisError:
+        pass
+
+
+def touch(key: str):
+    """Keeps a revalidated entry alive for another TTL period."""
+    try:
+        redis_client.expire(key, settings.PROVIDER_ETAG_TTL)
+    except redis.RedisError:
+        pass
+
+
+# --- Asyncio variants ---
+
+async def get_async(key: str):
+    try:
+        raw = await async_redis_client.get(key)
+    except redis.RedisError:
+        return None
+    return json.loads(raw) if raw else None
+
+
+async def store_async(key: str, response_headers, body, last_page: int):
+    etag = response_headers.get("ETag")
+    last_modified = response_headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return
+    entry = {"etag": etag, "last_modified": last_modified, "body": body, "last_page": last_page}
+    try:
+        await async_redis_client.setex(key, settings.PROVIDER_ETAG_TTL, json.dumps(entry))
+    except redis.RedisError:
+        pass
+
+
+async def touch_async(key: str):
+    try:
+        await async_redis_client.expire(key, settings.PROVIDER_ETAG_TTL)
+    except redis.RedisError:
+        pass
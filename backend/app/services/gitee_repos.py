@@ -0,0 +1,138 @@
+"""
+Known Gitee repositories per owner.
+
+A Redis set holds the (lower-cased) repository paths of an owner, filled in one go from Gitee's
+paginated listing of the token's own repos and kept current on create and on 404. While the
+set is loaded, "does owner/name exist" needs no API call; a missing repo is simply created,
+and a create that races with an existing repo is resolved by one lookup.
+
+Bulk syncs run `provision` first, creating every missing repo with bounded concurrency,
+so their syncs find all repos in place instead of each checking (and creating) on its own.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import redis_client
+from app.services.providers import GiteeClient, ProviderError
+
+LOAD_LOCK_TTL = 120
+
+
+def repos_key(owner: str) -> str:
+    return f"gitee:repos:{owner.lower()}"
+
+
+def loaded_key(owner: str) -> str:
+    return f"gitee:repos:{owner.lower()}:loaded"
+
+
+def load(gitee: GiteeClient, owner: str) -> set:
+    """Replaces the owner's set with Gitee's listing. Returns the lower-cased paths."""
+    prefix = f"{owner.lower()}/"
+    names = {
+        repo["full_name"].lower()[len(prefix):]
+        for repo in gitee.list_user_repos()
+        if repo.get("full_name", "").lower().startswith(prefix)
+    }
+    ttl = settings.GITEE_REPO_CACHE_TTL
+    pipe = redis_client.pipeline()
+    pipe.delete(repos_key(owner))
+    if names:
+        pipe.sadd(repos_key(owner), *names)
+        pipe.expire(repos_key(owner), ttl)
+    pipe.set(loaded_key(owner), 1, ex=ttl)
+    pipe.execute()
+    return names
+
+
+def _ensure_loaded(gitee: GiteeClient, owner: str) -> bool:
+    """Loads the owner's listing unless it is cached or another worker is loading it."""
+    if redis_client.exists(loaded_key(owner)):
+        return True
+    if not redis_client.set(f"{loaded_key(owner)}:lock", 1, nx=True, ex=LOAD_LOCK_TTL):
+        return False
+    try:
+        load(gitee, owner)
+        return True
+    except ProviderError as e:
+        print(f"⚠️ Could not list Gitee repos of {owner}: {e.detail}")
+        return False
+    finally:
+        redis_client.delete(f"{loaded_key(owner)}:lock")
+
+
+def mark_exists(owner: str, name: str):
+    try:
+        redis_client.sadd(repos_key(owner), name.lower())
+    except redis.RedisError:
+        pass
+
+
+def forget(owner: str, name: str):
+    """Drops a repo that turned out not to exist (404, or a push to a deleted repo)."""
+    try:
+        redis_client.srem(repos_key(owner), name.lower())
+    except redis.RedisError:
+        pass
+
+
+def exists(gitee: GiteeClient, owner: str, name: str) -> bool:
+    """
+    Whether owner/name exists on Gitee, from the cached listing when possible, otherwise
+    from one GET. Raises ProviderError when Gitee cannot tell.
+    """
+    try:
+        if _ensure_loaded(gitee, owner):
+            return bool(redis_client.sismember(repos_key(owner), name.lower()))
+    except redis.RedisError:
+        pass
+
+    found = gitee.get_repo(owner, name) is not None
+    if found:
+        mark_exists(owner, name)
+    else:
+        forget(owner, name)
+    return found
+
+
+def create(gitee: GiteeClient, owner: str, name: str, description: str = ""):
+    """Creates a private repo; a create refused because the repo already exists counts as done."""
+    try:
+        gitee.create_repo(name, private=True, description=description)
+    except ProviderError:
+        if gitee.get_repo(owner, name) is None:
+            raise
+    mark_exists(owner, name)
+
+
+def provision(gitee_pat: str, owner: str, repos: dict) -> dict:
+    """
+    Creates the repos of `repos` ({name: description}) missing from Gitee, at most
+    GITEE_PROVISION_CONCURRENCY at a time. Returns {"existing", "created", "failed"} counts.
+    """
+    gitee = GiteeClient(gitee_pat)
+    try:
+        known = load(gitee, owner)
+    except ProviderError as e:
+        # Without a listing every sync checks its own repo as before
+        print(f"⚠️ Could not list Gitee repos of {owner}, skipping provisioning: {e.detail}")
+        return {"existing": 0, "created": 0, "failed": 0}
+
+    missing = [name for name in repos if name.lower() not in known]
+
+    def create_one(name: str) -> bool:
+        try:
+            create(gitee, owner, name, repos[name])
+            return True
+        except ProviderError as e:
+            print(f"❌ Failed to create Gitee repository {owner}/{name}: {e.detail}")
+            return False
+
+    created = 0
+    if missing:
+        print(f"📦 Provisioning {len(missing)} Gitee repositories for {owner}")
+        with ThreadPoolExecutor(max_workers=settings.GITEE_PROVISION_CONCURRENCY) as pool:
+            created = sum(pool.map(create_one, missing))
+    return {"existing": len(repos) - len(missing), "created": created, "failed": len(missing) - created}
@@ -0,0 +1,173 @@
+"""
+Per-repository mirror state (`RepoMirror`).
+
+Task creation and every worker status change update the repo's row in the same transaction
+as the task itself: the newest task and its status, the refs the last successful sync left
+on Gitee, the duration and transfer size of the last run and a short per-day activity count.
+Listing a user's repos is then one indexed read of these rows instead of a scan of the task log.
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models.mirror import RepoMirror
+from app.services.progress import TERMINAL_STATUSES
+
+ACTIVITY_DAYS = 21
+SUCCESS_STATUSES = ("completed", "up_to_date")
+# Allowed skew between GitHub's clock and ours when comparing pushed_at with our sync times
+CLOCK_SKEW_SECONDS = 60
+
+
+def _upsert(db: Session, rows: list, update: tuple):
+    """Inserts `rows`, overwriting only the `update` columns of rows that already exist."""
+    table = RepoMirror.__table__
+    if db.get_bind().dialect.name == "mysql":
+        stmt = mysql_insert(table).values(rows)
+        if update:
+            set_ = {"updated_at": func.now(), **{column: stmt.inserted[column] for column in update}}
+        else:
+            set_ = {"user_id": table.c.user_id}  # no-op
+        stmt = stmt.on_duplicate_key_update(**set_)
+    else:
+        stmt = sqlite_insert(table).values(rows)
+        index_elements = [table.c.user_id, table.c.github_repo_url]
+        if update:
+            set_ = {column: stmt.excluded[column] for column in update}
+            stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_={"updated_at": func.now(), **set_})
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+    db.execute(stmt)
+
+
+def record_queued(db: Session, tasks: list):
+    """
+    Points each repo's state at its freshly inserted task, given as objects or rows with
+    id, user_id, github_repo_url, gitee_repo_url and status. Call before the INSERT's commit.
+    """
+    rows = [
+        {
+            "user_id": t.user_id,
+            "github_repo_url": t.github_repo_url,
+            "gitee_repo_url": t.gitee_repo_url,
+            "last_task_id": t.id,
+            "last_status": t.status,
+        }
+        for t in tasks
+    ]
+    for i in range(0, len(rows), 1000):
+        _upsert(db, rows[i:i + 1000], ("gitee_repo_url", "last_task_id", "last_status"))
+
+
+def _locked(db: Session, task) -> RepoMirror:
+    query = select(RepoMirror).where(
+        RepoMirror.user_id == task.user_id,
+        RepoMirror.github_repo_url == task.github_repo_url
+    ).with_for_update()
+    mirror = db.execute(query).scalar_one_or_none()
+    if mirror is None:
+        # Repo without state yet (task inserted elsewhere); insert-if-absent keeps racing workers safe
+        _upsert(db, [{
+            "user_id": task.user_id,
+            "github_repo_url": task.github_repo_url,
+            "gitee_repo_url": task.gitee_repo_url,
+        }], ())
+        mirror = db.execute(query).scalar_one()
+    return mirror
+
+
+def _bump_activity(activity: dict, today) -> dict:
+    oldest = (today - timedelta(days=ACTIVITY_DAYS - 1)).isoformat()
+    kept = {day: count for day, count in (activity or {}).items() if day >= oldest}
+    kept[today.isoformat()] = kept.get(today.isoformat(), 0) + 1
+    return kept
+
+
+def record_status(db: Session, task, status: str, result: dict = None):
+    """
+    Applies a task's status change (and, for finished runs, its `result`) to the repo's state.
+    `result` may carry `duration` (seconds), `bytes`, and either `refs` (the complete {ref: sha}
+    now on Gitee) or `ref_changes` ({ref: sha, or None when deleted}) for ref-scoped syncs.
+    Runs inside the caller's transaction, holding the row lock until its commit.
+    """
+    mirror = _locked(db, task)
+    result = result or {}
+    now = datetime.now(timezone.utc)
+
+    # An older task finishing late must not hide a newer queued/running one
+    if mirror.last_task_id is None or task.id >= mirror.last_task_id:
+        mirror.last_task_id = task.id
+        mirror.last_status = status
+        mirror.gitee_repo_url = task.gitee_repo_url
+
+    if "duration" in result:
+        mirror.last_duration = result["duration"]
+    if "bytes" in result:
+        mirror.bytes_transferred = result["bytes"]
+    if status in TERMINAL_STATUSES:
+        mirror.activity = _bump_activity(mirror.activity, now.date())
+    if status in SUCCESS_STATUSES:
+        mirror.last_success_at = now
+        if "refs" in result:
+            mirror.synced_refs = dict(result["refs"])
+        elif "ref_changes" in result and mirror.synced_refs is not None:
+            # Without a complete map to start from, a partial one would be misleading
+            refs = dict(mirror.synced_refs)
+            for ref, sha in result["ref_changes"].items():
+                if sha is None:
+                    refs.pop(ref, None)
+                else:
+                    refs[ref] = sha
+            mirror.synced_refs = refs
+
+
+def activity_series(activity: dict, today=None) -> list:
+    """The last ACTIVITY_DAYS daily counts, oldest first."""
+    today = today or datetime.now(timezone.utc).date()
+    activity = activity or {}
+    return [
+        activity.get((today - timedelta(days=ACTIVITY_DAYS - 1 - i)).isoformat(), 0)
+        for i in range(ACTIVITY_DAYS)
+    ]
+
+
+def user_mirrors_query(user_id: int):
+    """Status and activity of every repo of a user; served by the (user_id, github_repo_url) key."""
+    return select(RepoMirror.github_repo_url, RepoMirror.last_status, RepoMirror.activity).where(
+        RepoMirror.user_id == user_id
+    )
+
+
+def sync_marks_query(user_id: int, urls: list):
+    """Last status, last success and its duration for the given repos of a user."""
+    return select(
+        RepoMirror.github_repo_url, RepoMirror.last_status, RepoMirror.last_success_at, RepoMirror.last_duration
+    ).where(
+        RepoMirror.user_id == user_id,
+        RepoMirror.github_repo_url.in_(urls)
+    )
+
+
+def _utc(value: datetime) -> datetime:
+    # SQLite and MySQL hand back naive datetimes; they are stored in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def unchanged_since_sync(pushed_at: str, status: str, success_at: datetime, duration: float) -> bool:
+    """
+    Whether GitHub's `pushed_at` (ISO 8601) predates the start of the repo's last successful
+    sync, i.e. nothing was pushed that the mirror lacks. Missing times and a newest task that
+    failed or has not finished count as changed.
+    """
+    if not pushed_at or success_at is None or status not in SUCCESS_STATUSES:
+        return False
+    try:
+        pushed = _utc(datetime.fromisoformat(pushed_at.replace("Z", "+00:00")))
+    except ValueError:
+        return False
+    # The sync fetched when it started, so a push while it ran may not have been mirrored
+    started = _utc(success_at) - timedelta(seconds=(duration or 0) + CLOCK_SKEW_SECONDS)
+    return pushed < started
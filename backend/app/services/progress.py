@@ -0,0 +1,168 @@
+"""
+Live sync progress over Redis pub/sub.
+
+Workers publish small JSON events on a per-user and a per-task channel: status changes,
+the phase a sync is in (check, lookup, create, clone, push, fallback) and git's object/byte counts.
+The latest event of every running task is also kept in a per-user hash, so a browser that
+subscribes mid-sync starts from the current state.
+"""
+import json
+import time
+
+import redis
+
+from app.core.metrics import SYNC_PHASE_SECONDS, observe_transfers
+from app.core.redis import redis_client
+
+PHASES = ("check", "lookup", "create", "clone", "push", "fallback")
+TERMINAL_STATUSES = ("completed", "up_to_date", "failed", "cancelled")
+PUBLISH_INTERVAL = 0.5
+ACTIVE_TTL = 24 * 3600
+# Stages whose byte counts are the data fetched from GitHub / pushed to Gitee
+TRANSFER_STAGES = ("Receiving objects", "Writing objects")
+UNITS = {"bytes": 1, "B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4}
+
+
+def user_channel(user_id: int) -> str:
+    return f"sync:progress:user:{user_id}"
+
+
+def task_channel(task_id: int) -> str:
+    return f"sync:progress:task:{task_id}"
+
+
+def active_key(user_id: int) -> str:
+    return f"sync:progress:active:{user_id}"
+
+
+def _publish(event: dict):
+    payload = json.dumps(event)
+    user_id, task_id = event["user_id"], event["task_id"]
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        if event.get("status") in TERMINAL_STATUSES:
+            pipe.hdel(active_key(user_id), task_id)
+        else:
+            pipe.hset(active_key(user_id), task_id, payload)
+            pipe.expire(active_key(user_id), ACTIVE_TTL)
+        pipe.publish(user_channel(user_id), payload)
+        pipe.publish(task_channel(task_id), payload)
+        pipe.execute()
+    except redis.RedisError:
+        # Progress is best effort; never let it fail a sync
+        pass
+
+
+def parse_size(transferred: str) -> int:
+    """Bytes in one of git's sizes ("978.94 KiB", "220 bytes"); 0 if unrecognised."""
+    amount, _, unit = transferred.partition(" ")
+    try:
+        return int(float(amount) * UNITS.get(unit, 0))
+    except ValueError:
+        return 0
+
+
+def status_event(task, status: str, error_message: str = None) -> dict:
+    return {
+        "type": "status",
+        "task_id": task.id,
+        "user_id": task.user_id,
+        "github_repo_url": task.github_repo_url,
+        "status": status,
+        "error_message": error_message,
+        "ts": time.time(),
+    }
+
+
+def publish_status(task, status: str, error_message: str = None):
+    _publish(status_event(task, status, error_message))
+
+
+class ProgressReporter:
+    """
+    Publishes the phase and git transfer progress of one running task. Also times its phases
+    and totals what git moved (`bytes_transferred`), reported to the metrics by `finish`.
+    """
+
+    def __init__(self, task, min_interval: float = PUBLISH_INTERVAL):
+        self.task_id = task.id
+        self.user_id = task.user_id
+        self.github_repo_url = task.github_repo_url
+        self.min_interval = min_interval
+        self.current_phase = None
+        self._last_sent = 0.0
+        self._last_done = None
+        self._phase_started = None
+        self._transfers = {}  # stage -> (percent, bytes, objects) of the transfer running in it
+        self._finished = {}  # stage -> [bytes, objects] of finished transfers
+
+    def _event(self, **fields) -> dict:
+        return {
+            "type": "progress",
+            "task_id": self.task_id,
+            "user_id": self.user_id,
+            "github_repo_url": self.github_repo_url,
+            "status": "syncing",
+            "phase": self.current_phase,
+            "ts": time.time(),
+            **fields,
+        }
+
+    def transfer_totals(self) -> dict:
+        """{stage: (bytes, objects)} git moved so far, for the TRANSFER_STAGES."""
+        totals = {stage: tuple(finished) for stage, finished in self._finished.items()}
+        for stage, (_, size, objects) in self._transfers.items():
+            done_size, done_objects = totals.get(stage, (0, 0))
+            totals[stage] = (done_size + size, done_objects + objects)
+        return totals
+
+    @property
+    def bytes_transferred(self) -> int:
+        return sum(size for size, _ in self.transfer_totals().values())
+
+    def _fold(self, stage: str):
+        _, size, objects = self._transfers.pop(stage)
+        finished = self._finished.setdefault(stage, [0, 0])
+        finished[0] += size
+        finished[1] += objects
+
+    def _count(self, stage: str, percent: int, done: int, transferred: str):
+        # The counts are cumulative per command; a stage restarting means a new command
+        previous = self._transfers.get(stage)
+        if previous and percent < previous[0]:
+            self._fold(stage)
+            previous = None
+        size = parse_size(transferred) if transferred else (previous[1] if previous else 0)
+        self._transfers[stage] = (percent, size, done)
+
+    def _end_phase(self):
+        if self.current_phase and self._phase_started is not None:
+            SYNC_PHASE_SECONDS.labels(self.current_phase).observe(time.monotonic() - self._phase_started)
+        for stage in list(self._transfers):
+            self._fold(stage)
+
+    def phase(self, phase: str):
+        self._end_phase()
+        self.current_phase = phase
+        self._phase_started = self._last_sent = time.monotonic()
+        _publish(self._event())
+
+    def finish(self):
+        """Ends the timing of the last phase and records the run's git transfers."""
+        self._end_phase()
+        self.current_phase = None
+        observe_transfers(self.transfer_totals())
+
+    def git(self, stage: str, percent: int, done: int, total: int, transferred: str = None):
+        """`run_git` progress callback; throttled except for a stage's final line."""
+        if stage in TRANSFER_STAGES:
+            self._count(stage, percent, done, transferred)
+        now = time.monotonic()
+        if percent < 100 and now - self._last_sent < self.min_interval:
+            return
+        # git repeats the 100% line with ", done."; only the one with the byte count is new
+        if percent == 100 and self._last_done == (stage, done) and not transferred:
+            return
+        self._last_sent = now
+        self._last_done = (stage, done) if percent == 100 else None
+        _publish(self._event(stage=stage, percent=percent, done=done, total=total, transferred=transferred))
@@ -0,0 +1,460 @@
+"""
+Shared HTTP clients for the GitHub and Gitee REST APIs.
+
+Every outbound provider call goes through here so they all get keep-alive connection pooling,
+timeouts, retries on transient errors and full pagination. `GitHubClient`/`GiteeClient` are the
+blocking interfaces (Celery workers, sync endpoints), `AsyncGitHubClient`/`AsyncGiteeClient`
+the asyncio ones.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.core import metrics, rate_limit
+from app.core.config import settings
+from app.services import etag_cache
+
+RETRY_STATUSES = (500, 502, 503, 504)
+PER_PAGE = 100
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _last_page(links: dict, headers) -> int:
+    """Total page count from GitHub's `Link: rel="last"` or Gitee's `total_page` header."""
+    last = links.get("last", {}).get("url")
+    if last:
+        page = parse_qs(urlparse(str(last)).query).get("page")
+        if page:
+            return int(page[0])
+    if headers.get("total_page"):
+        return int(headers["total_page"])
+    return 1
+
+
+def _cached_page(res, entry: dict):
+    """
+    (items, last_page) for a 304. An ETag covers the body but not the `Link`/`total_page`
+    headers, so a page count sent along with the 304 wins over the cached one.
+    """
+    announced = res.links.get("last") or res.headers.get("total_page")
+    return entry["body"], _last_page(res.links, res.headers) if announced else entry["last_page"]
+
+
+def _limits(host: str, token: str):
+    """(scope, rate, burst) token buckets a request to `host` must pass."""
+    scopes = [(host, settings.PROVIDER_HOST_RATE, settings.PROVIDER_HOST_BURST)]
+    if token:
+        scopes.append((rate_limit.token_scope(host, token), settings.PROVIDER_TOKEN_RATE, settings.PROVIDER_TOKEN_BURST))
+    return scopes
+
+
+def _rate_limit_verdict(host: str, token: str, res):
+    """
+    Reads GitHub/Gitee rate-limit headers. Returns (scope, block_seconds, throttled):
+    exhausted quotas block the scope until the reset time, and 403/429 rate-limit responses
+    are `throttled` so the caller raises `RateLimited` and can reschedule.
+    """
+    scope = rate_limit.token_scope(host, token) if token else host
+    headers = res.headers
+    remaining = headers.get("X-RateLimit-Remaining")
+    reset = headers.get("X-RateLimit-Reset")
+    reset_in = float(reset) - time.time() if reset and reset.isdigit() else None
+
+    if res.status_code in (403, 429):
+        retry_after = None
+        if headers.get("Retry-After", "").isdigit():
+            retry_after = float(headers["Retry-After"])
+        elif remaining == "0":
+            retry_after = reset_in if reset_in is not None else settings.RATE_LIMIT_DEFAULT_BACKOFF
+        elif res.status_code == 429 or "rate limit" in res.text.lower():
+            retry_after = settings.RATE_LIMIT_DEFAULT_BACKOFF
+        if retry_after is not None:
+            return scope, retry_after, True
+    elif remaining == "0" and reset_in:
+        return scope, reset_in, False
+    return scope, 0, False
+
+
+def _check_rate_limit(host: str, token: str, res):
+    scope, seconds, throttled = _rate_limit_verdict(host, token, res)
+    if seconds:
+        rate_limit.block(scope, seconds)
+    if throttled:
+        raise rate_limit.RateLimited(scope, seconds)
+
+
+async def _check_rate_limit_async(host: str, token: str, res):
+    scope, seconds, throttled = _rate_limit_verdict(host, token, res)
+    if seconds:
+        await rate_limit.block_async(scope, seconds)
+    if throttled:
+        raise rate_limit.RateLimited(scope, seconds)
+
+
+# --- Blocking interface -------------------------------------------------------------
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    One pooled session per process. Celery's prefork workers must not share sockets
+    with the parent, so the pool is keyed by pid.
+    """
+    pid = os.getpid()
+    session = _sessions.get(pid)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(pid)
+            if session is None:
+                retry = Retry(
+                    total=settings.PROVIDER_MAX_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=frozenset(["GET", "HEAD"]),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=settings.PROVIDER_POOL_SIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[pid] = session
+    return session
+
+
+class _ProviderClient:
+    api_url = ""
+
+    def __init__(self, token: str = None):
+        self.token = token
+
+    def _prepare(self, headers: dict, params: dict, data: dict = None):
+        pass
+
+    def request(self, method: str, url: str, params: dict = None, headers: dict = None, **kwargs) -> requests.Response:
+        if not url.startswith("http"):
+            url = f"{self.api_url}{url}"
+        params = dict(params or {})
+        headers = dict(headers or {})
+        if kwargs.get("data") is not None:
+            kwargs["data"] = dict(kwargs["data"])
+        self._prepare(headers, params, kwargs.get("data"))
+        kwargs.setdefault("timeout", settings.PROVIDER_TIMEOUT)
+
+        host = urlparse(url).hostname
+        for scope, rate, burst in _limits(host, self.token):
+            rate_limit.acquire(scope, rate, burst)
+        started = time.perf_counter()
+        try:
+            res = get_session().request(method, url, params=params, headers=headers, **kwargs)
+        except requests.RequestException:
+            metrics.observe_provider(host, method, "error", started)
+            raise
+        metrics.observe_provider(host, method, res.status_code, started)
+        _check_rate_limit(host, self.token, res)
+        return res
+
+    def get_json(self, path: str, params: dict = None):
+        res = self.request("GET", path, params=params)
+        if res.status_code != 200:
+            raise ProviderError(res.status_code, res.text)
+        return res.json()
+
+    def get_page(self, path: str, params: dict = None, conditional: bool = False):
+        """
+        Returns (items, last_page) for one page. With `conditional`, the request is revalidated
+        against the ETag cache and a 304 is served from the stored body.
+        """
+        key = etag_cache.cache_key(self.token, f"{self.api_url}{path}", params) if conditional else None
+        entry = etag_cache.get(key) if key else None
+
+        res = self.request("GET", path, params=params, headers=etag_cache.validators(entry))
+        if res.status_code == 304 and entry:
+            etag_cache.touch(key)
+            return _cached_page(res, entry)
+        if res.status_code != 200:
+            raise ProviderError(res.status_code, res.text)
+
+        items = res.json()
+        last = _last_page(res.links, res.headers)
+        if key:
+            etag_cache.store(key, res.headers, items, last)
+        return items, last
+
+    def get_paginated(self, path: str, params: dict = None, conditional: bool = False) -> list:
+        """
+        Fetches page 1, then every remaining page concurrently. Pages past the announced count
+        are read while the last one is full, since a count revalidated from the ETag cache can
+        be behind.
+        """
+        params = {**(params or {}), "per_page": PER_PAGE}
+        first, last = self.get_page(path, {**params, "page": 1}, conditional)
+
+        def fetch(page: int):
+            return self.get_page(path, {**params, "page": page}, conditional)[0]
+
+        pages = [first]
+        if last > 1:
+            with ThreadPoolExecutor(max_workers=min(settings.PROVIDER_POOL_SIZE, last - 1)) as pool:
+                pages.extend(pool.map(fetch, range(2, last + 1)))
+        while len(pages[-1]) >= PER_PAGE:
+            pages.append(fetch(len(pages) + 1))
+        return [item for page in pages for item in page]
+
+
+class _GitHubAuth:
+    api_url = settings.GITHUB_API_URL
+
+    def _prepare(self, headers: dict, params: dict, data: dict = None):
+        headers.setdefault("Accept", "application/vnd.github+json")
+        headers.setdefault("X-GitHub-Api-Version", "2022-11-28")
+        if self.token:
+            headers.setdefault("Authorization", f"Bearer {self.token}")
+
+
+class _GiteeAuth:
+    api_url = f"{settings.GITEE_URL}/api/v5"
+
+    def _prepare(self, headers: dict, params: dict, data: dict = None):
+        if self.token:
+            # In the form body when there is one, keeping the token out of URLs (and access logs)
+            (data if data is not None else params).setdefault("access_token", self.token)
+
+
+class GitHubClient(_GitHubAuth, _ProviderClient):
+    def list_user_repos(self) -> list:
+        return self.get_paginated("/user/repos", {"visibility": "all"}, conditional=True)
+
+    def get_repo(self, owner: str, name: str):
+        """Repository metadata (with `parent`/`source` for forks), or None when it does not exist."""
+        res = self.request("GET", f"/repos/{owner}/{name}")
+        if res.status_code == 404:
+            return None
+        if res.status_code != 200:
+            raise ProviderError(res.status_code, res.text)
+        return res.json()
+
+    def get_user(self) -> dict:
+        return self.get_json("/user")
+
+    def exchange_code(self, code: str) -> dict:
+        res = self.request(
+            "POST",
+            f"{settings.GITHUB_OAUTH_URL}/login/oauth/access_token",
+            json={
+                "client_id": settings.GITHUB_CLIENT_ID,
+                "client_secret": settings.GITHUB_CLIENT_SECRET,
+                "code": code,
+            },
+            headers={"Accept": "application/json"},
+        )
+        return res.json()
+
+
+class GiteeClient(_GiteeAuth, _ProviderClient):
+    def list_user_repos(self) -> list:
+        """Repositories owned by the token's user."""
+        return self.get_paginated("/user/repos", {"affiliation": "owner"})
+
+    def get_repo(self, owner: str, name: str):
+        """Repository metadata, or None when it does not exist."""
+        res = self.request("GET", f"/repos/{owner}/{name}")
+        if res.status_code == 404:
+            return None
+        if res.status_code != 200:
+            raise ProviderError(res.status_code, res.text)
+        return res.json()
+
+    def create_repo(self, name: str, private: bool = True, description: str = "") -> dict:
+        res = self.request(
+            "POST",
+            "/user/repos",
+            data={"name": name, "private": private, "description": description},
+        )
+        if res.status_code != 201:
+            raise ProviderError(res.status_code, res.text)
+        return res.json()
+
+    def get_user(self) -> dict:
+        return self.get_json("/user")
+
+    def exchange_code(self, code: str, redirect_uri: str) -> dict:
+        res = self.request(
+            "POST",
+            f"{settings.GITEE_URL}/oauth/token",
+            data={
+                "grant_type": "authorization_code",
+                "code": code,
+                "client_id": settings.GITEE_CLIENT_ID,
+                "client_secret": settings.GITEE_CLIENT_SECRET,
+                "redirect_uri": redirect_uri,
+            },
+        )
+        return res.json()
+
+
+# --- Asyncio interface --------------------------------------------------------------
+
+_async_client: httpx.AsyncClient = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=settings.PROVIDER_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.PROVIDER_POOL_SIZE,
+                max_keepalive_connections=settings.PROVIDER_POOL_SIZE,
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=settings.PROVIDER_MAX_RETRIES),
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+class _AsyncProviderClient:
+    api_url = ""
+
+    def __init__(self, token: str = None):
+        self.token = token
+
+    def _prepare(self, headers: dict, params: dict, data: dict = None):
+        pass
+
+    async def request(self, method: str, url: str, params: dict = None, headers: dict = None, **kwargs) -> httpx.Response:
+        if not url.startswith("http"):
+            url = f"{self.api_url}{url}"
+        params = dict(params or {})
+        headers = dict(headers or {})
+        if kwargs.get("data") is not None:
+            kwargs["data"] = dict(kwargs["data"])
+        self._prepare(headers, params, kwargs.get("data"))
+
+        host = urlparse(url).hostname
+        client = get_async_client()
+        # The transport only retries connection errors; retry idempotent 5xx here
+        attempts = settings.PROVIDER_MAX_RETRIES + 1 if method in ("GET", "HEAD") else 1
+        for attempt in range(attempts):
+            for scope, rate, burst in _limits(host, self.token):
+                await rate_limit.acquire_async(scope, rate, burst)
+            started = time.perf_counter()
+            try:
+                res = await client.request(method, url, params=params, headers=headers, **kwargs)
+            except httpx.HTTPError:
+                metrics.observe_provider(host, method, "error", started)
+                raise
+            metrics.observe_provider(host, method, res.status_code, started)
+            await _check_rate_limit_async(host, self.token, res)
+            if res.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                return res
+            await asyncio.sleep(0.5 * (2 ** attempt))
+
+    async def get_json(self, path: str, params: dict = None):
+        res = await self.request("GET", path, params=params)
+        if res.status_code != 200:
+            raise ProviderError(res.status_code, res.text)
+        return res.json()
+
+    async def get_page(self, path: str, params: dict = None, conditional: bool = False):
+        key = etag_cache.cache_key(self.token, f"{self.api_url}{path}", params) if conditional else None
+        entry = await etag_cache.get_async(key) if key else None
+
+        res = await self.request("GET", path, params=params, headers=etag_cache.validators(entry))
+        if res.status_code == 304 and entry:
+            await etag_cache.touch_async(key)
+            return _cached_page(res, entry)
+        if res.status_code != 200:
+            raise ProviderError(res.status_code, res.text)
+
+        items = res.json()
+        last = _last_page(res.links, res.headers)
+        if key:
+            await etag_cache.store_async(key, res.headers, items, last)
+        return items, last
+
+    async def get_paginated(self, path: str, params: dict = None, conditional: bool = False) -> list:
+        params = {**(params or {}), "per_page": PER_PAGE}
+        first, last = await self.get_page(path, {**params, "page": 1}, conditional)
+        pages = [first]
+        if last > 1:
+            rest = await asyncio.gather(*(self.get_page(path, {**params, "page": page}, conditional) for page in range(2, last + 1)))
+            pages.extend(page_items for page_items, _ in rest)
+        # See the blocking client: the announced count can be behind
+        while len(pages[-1]) >= PER_PAGE:
+            page_items, _ = await self.get_page(path, {**params, "page": len(pages) + 1}, conditional)
+            pages.append(page_items)
+        return [item for page in pages for item in page]
+
+
+class AsyncGitHubClient(_GitHubAuth, _AsyncProviderClient):
+    async def list_user_repos(self) -> list:
+        return await self.get_paginated("/user/repos", {"visibility": "all"}, conditional=True)
+
+    async def get_user(self) -> dict:
+        return await self.get_json("/user")
+
+    async def exchange_code(self, code: str) -> dict:
+        res = await self.request(
+            "POST",
+            f"{settings.GITHUB_OAUTH_URL}/login/oauth/access_token",
+            json={
+                "client_id": settings.GITHUB_CLIENT_ID,
+                "client_secret": settings.GITHUB_CLIENT_SECRET,
+                "code": code,
+            },
+            headers={"Accept": "application/json"},
+        )
+        return res.json()
+
+
+class AsyncGiteeClient(_GiteeAuth, _AsyncProviderClient):
+    async def get_repo(self, owner: str, name: str):
+        res = await self.request("GET", f"/repos/{owner}/{name}")
+        if res.status_code == 404:
+            return None
+        if res.status_code != 200:
+            raise ProviderError(res.status_code, res.text)
+        return res.json()
+
+    async def get_user(self) -> dict:
+        return await self.get_json("/user")
+
+    async def exchange_code(self, code: str, redirect_uri: str) -> dict:
+        res = await self.request(
+            "POST",
+            f"{settings.GITEE_URL}/oauth/token",
+            data={
+                "grant_type": "authorization_code",
+                "code": code,
+                "client_id": settings.GITEE_CLIENT_ID,
+                "client_secret": settings.GITEE_CLIENT_SECRET,
+                "redirect_uri": redirect_uri,
+            },
+        )
+        return res.json()
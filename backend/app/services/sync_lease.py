@@ -0,0 +1,114 @@
+"""
+Leases on running syncs.
+
+The worker running a sync holds a lease on its task (`lease_expires_at`) and renews it from a
+heartbeat thread. When a worker is OOM-killed or redeployed mid-sync, the renewals stop, and
+the reaper (`app.worker.periodic_tasks.reap_expired_syncs`) finds the task `syncing` with an
+expired lease. The task then goes back to the queue, or it fails once
+SYNC_LEASE_MAX_RECOVERIES runs of it were lost.
+
+`recoveries` doubles as the lease's fencing token. A run that was given up on (its worker was
+alive but could not renew) cannot renew any more, notices, and stops.
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.rate_limit import renew_slots
+from app.models.user import RepositorySyncTask
+
+REAP_BATCH = 100
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def expires_at() -> datetime:
+    return _now() + timedelta(seconds=settings.SYNC_LEASE_SECONDS)
+
+
+def is_expired(task: RepositorySyncTask) -> bool:
+    lease = task.lease_expires_at
+    if lease is None:
+        return True
+    if lease.tzinfo is None:
+        # SQLite and MySQL hand back naive datetimes; they are stored in UTC
+        lease = lease.replace(tzinfo=timezone.utc)
+    return lease <= _now()
+
+
+def recover(task: RepositorySyncTask) -> bool:
+    """Counts one lost run of `task`. False once its budget is spent and it should fail instead."""
+    if task.recoveries >= settings.SYNC_LEASE_MAX_RECOVERIES:
+        return False
+    task.recoveries += 1
+    return True
+
+
+def lost_message(task: RepositorySyncTask) -> str:
+    return f"Worker lost during sync (run {task.recoveries + 1})"
+
+
+def expired_ids_query(limit: int = REAP_BATCH):
+    """Ids of running tasks whose lease ran out (or that never had one)."""
+    return select(RepositorySyncTask.id).where(
+        RepositorySyncTask.status == "syncing",
+        or_(RepositorySyncTask.lease_expires_at.is_(None), RepositorySyncTask.lease_expires_at < _now()),
+    ).order_by(RepositorySyncTask.id).limit(limit)
+
+
+def lock_query(task_id: int):
+    """The task, locked, unless a worker is deciding about it right now."""
+    return select(RepositorySyncTask).where(RepositorySyncTask.id == task_id).with_for_update(skip_locked=True)
+
+
+class Heartbeat:
+    """
+    Renews the lease of task `task_id`, claimed with `token` (its `recoveries`), and the git
+    transfer slots of this process every SYNC_HEARTBEAT_SECONDS until `stop`. `lost` turns true
+    once the lease was taken over; database errors are retried on the next beat.
+    """
+
+    def __init__(self, task_id: int, token: int):
+        self.task_id = task_id
+        self.token = token
+        self.lost = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{task_id}", daemon=True)
+
+    def start(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stopped.wait(settings.SYNC_HEARTBEAT_SECONDS):
+            renew_slots()
+            if not self.renew():
+                return
+
+    def renew(self) -> bool:
+        db = SessionLocal()
+        try:
+            result = db.execute(update(RepositorySyncTask).where(
+                RepositorySyncTask.id == self.task_id,
+                RepositorySyncTask.status == "syncing",
+                RepositorySyncTask.recoveries == self.token,
+            ).values(lease_expires_at=expires_at()))
+            db.commit()
+        except SQLAlchemyError as e:
+            print(f"⚠️ Could not renew the lease of task {self.task_id}: {e}")
+            return True
+        finally:
+            db.close()
+        if result.rowcount == 0:
+            self.lost = True
+        return not self.lost
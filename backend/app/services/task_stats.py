@@ -0,0 +1,234 @@
+"""
+Incrementally maintained dashboard rollups.
+
+Every task insert and status change adjusts `SyncTaskDailyStat` counters in the same
+transaction, and drops the user's cached dashboard payload. The dashboard then needs one
+indexed read of a few hundred rows instead of counting and scanning the task table.
+"""
+import asyncio
+import json
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+import redis
+from sqlalchemy import select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.redis import async_redis_client, redis_client
+from app.models.stats import SyncTaskDailyStat
+from app.models.user import RepositorySyncTask
+from app.services.mirror_state import record_queued, record_status
+from app.services.progress import publish_status
+
+HEATMAP_DAYS = 120
+DASHBOARD_CACHE_TTL = 60
+
+
+def _day(created_at) -> date:
+    # Naive timestamps are treated as UTC, like the rest of the API
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date()
+
+
+def _dashboard_key(user_id: int) -> str:
+    return f"dashboard:{user_id}"
+
+
+def _invalidate(user_ids):
+    keys = [_dashboard_key(user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+    try:
+        redis_client.delete(*keys)
+    except redis.RedisError:
+        pass
+
+
+async def _invalidate_async(user_ids):
+    keys = [_dashboard_key(user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+    try:
+        await async_redis_client.delete(*keys)
+    except redis.RedisError:
+        pass
+
+
+def _apply(db: Session, deltas: Counter):
+    """Adds {(user_id, day, status): delta} to the rollup with one upsert."""
+    rows = [
+        {"user_id": user_id, "day": day, "status": status, "count": delta}
+        for (user_id, day, status), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+
+    table = SyncTaskDailyStat.__table__
+    is_mysql = db.get_bind().dialect.name == "mysql"
+    for i in range(0, len(rows), 1000):
+        if is_mysql:
+            stmt = mysql_insert(table).values(rows[i:i + 1000])
+            stmt = stmt.on_duplicate_key_update(count=table.c.count + stmt.inserted["count"])
+        else:
+            stmt = sqlite_insert(table).values(rows[i:i + 1000])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.user_id, table.c.day, table.c.status],
+                set_={"count": table.c.count + stmt.excluded["count"]},
+            )
+        db.execute(stmt)
+
+
+def record_created(db: Session, tasks: list):
+    """
+    Counts freshly inserted tasks, given as objects or rows with id, user_id, repo URLs,
+    created_at and status, and points their repos' mirror state at them.
+    Call before the INSERT's commit so both land together.
+    """
+    deltas = Counter((t.user_id, _day(t.created_at), t.status) for t in tasks)
+    _apply(db, deltas)
+    record_queued(db, tasks)
+    _invalidate(t.user_id for t in tasks)
+
+
+async def record_created_async(db: AsyncSession, tasks: list):
+    """`record_created` for the API's AsyncSession."""
+    deltas = Counter((t.user_id, _day(t.created_at), t.status) for t in tasks)
+    await db.run_sync(_apply, deltas)
+    await db.run_sync(record_queued, tasks)
+    await _invalidate_async(t.user_id for t in tasks)
+
+
+def set_status(db: Session, task: RepositorySyncTask, status: str, error_message: str = None, result: dict = None):
+    """
+    Moves a task to `status`, and its rollup count and repo mirror state (with the run's
+    `result`, see `mirror_state.record_status`) along with it, in one commit,
+    then announces the change to live progress subscribers.
+    """
+    old_status = task.status
+    task.status = status
+    if error_message is not None:
+        task.error_message = error_message
+    if old_status != status:
+        day = _day(task.created_at)
+        _apply(db, Counter({(task.user_id, day, old_status): -1, (task.user_id, day, status): 1}))
+    if old_status != status or result:
+        record_status(db, task, status, result)
+    db.commit()
+    if old_status != status:
+        _invalidate([task.user_id])
+        publish_status(task, status, error_message)
+
+
+async def set_status_async(db: AsyncSession, task: RepositorySyncTask, status: str, error_message: str = None):
+    """`set_status` for the API's AsyncSession (status changes without a run result)."""
+    old_status = task.status
+    task.status = status
+    if error_message is not None:
+        task.error_message = error_message
+    if old_status != status:
+        day = _day(task.created_at)
+        await db.run_sync(_apply, Counter({(task.user_id, day, old_status): -1, (task.user_id, day, status): 1}))
+        await db.run_sync(record_status, task, status)
+    await db.commit()
+    if old_status != status:
+        await _invalidate_async([task.user_id])
+        await asyncio.to_thread(publish_status, task, status, error_message)
+
+
+def _level(count: int) -> int:
+    if count == 0: return 0
+    elif count <= 2: return 1
+    elif count <= 5: return 2
+    elif count <= 10: return 3
+    return 4
+
+
+def _dashboard(rows) -> dict:
+    by_status = Counter()
+    by_day = Counter()
+    for day, status, count in rows:
+        by_status[status] += count
+        by_day[day] += count
+
+    today = datetime.now(timezone.utc).date()
+    heatmap_data = [_level(by_day[today - timedelta(days=HEATMAP_DAYS - 1 - i)]) for i in range(HEATMAP_DAYS)]
+
+    return {
+        "stats": {
+            "total": sum(by_status.values()),
+            "active": by_status["syncing"],
+            "queued": by_status["pending"],
+            "failed": by_status["failed"],
+        },
+        "heatmapData": heatmap_data
+    }
+
+
+def _rollup_query(user_id: int):
+    return select(SyncTaskDailyStat.day, SyncTaskDailyStat.status, SyncTaskDailyStat.count).where(
+        SyncTaskDailyStat.user_id == user_id
+    )
+
+
+def dashboard_stats(db: Session, user_id: int) -> dict:
+    try:
+        cached = redis_client.get(_dashboard_key(user_id))
+        if cached:
+            return json.loads(cached)
+    except redis.RedisError:
+        pass
+
+    result = _dashboard(db.execute(_rollup_query(user_id)).all())
+    try:
+        redis_client.setex(_dashboard_key(user_id), DASHBOARD_CACHE_TTL, json.dumps(result))
+    except redis.RedisError:
+        pass
+    return result
+
+
+async def dashboard_stats_async(db: AsyncSession, user_id: int) -> dict:
+    try:
+        cached = await async_redis_client.get(_dashboard_key(user_id))
+        if cached:
+            return json.loads(cached)
+    except redis.RedisError:
+        pass
+
+    result = _dashboard((await db.execute(_rollup_query(user_id))).all())
+    try:
+        await async_redis_client.setex(_dashboard_key(user_id), DASHBOARD_CACHE_TTL, json.dumps(result))
+    except redis.RedisError:
+        pass
+    return result
+
+
+def rebuild(db: Session, user_id: int = None):
+    """Recomputes the rollup from the task table, e.g. after importing existing data."""
+    query = db.query(SyncTaskDailyStat)
+    tasks = db.query(RepositorySyncTask.user_id, RepositorySyncTask.created_at, RepositorySyncTask.status)
+    if user_id is not None:
+        query = query.filter(SyncTaskDailyStat.user_id == user_id)
+        tasks = tasks.filter(RepositorySyncTask.user_id == user_id)
+    query.delete(synchronize_session=False)
+
+    deltas = Counter()
+    for row in tasks.yield_per(10000):
+        deltas[(row.user_id, _day(row.created_at), row.status)] += 1
+    _apply(db, deltas)
+    db.commit()
+    _invalidate(user for user, _, _ in deltas)
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        rebuild(session)
+        print("✅ Dashboard rollups rebuilt")
+    finally:
+        session.close()
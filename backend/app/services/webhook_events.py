@@ -0,0 +1,65 @@
+"""
+Webhook push ingestion.
+
+In stream mode the endpoint only verifies the request and appends the push to a Redis stream;
+`app.worker.webhook_consumer` reads it in batches through a consumer group and plans the syncs
+(`bulk_sync.plan_pushes`). GitHub redeliveries are dropped by their X-GitHub-Delivery id.
+"""
+import hashlib
+import hmac
+import json
+
+from app.core.config import settings
+from app.core.redis import async_redis_client
+
+STREAM_KEY = "webhook:push"
+CONSUMER_GROUP = "planners"
+DELIVERY_TTL = 24 * 3600
+
+
+def verify_signature(secret: str, body: bytes, signature: str) -> bool:
+    """Checks GitHub's `X-Hub-Signature-256: sha256=<hmac>` header."""
+    if not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len("sha256="):])
+
+
+def push_event(user_id: int, payload: dict) -> dict:
+    """The fields of a push payload the planner needs. Raises ValueError for unusable payloads."""
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid payload")
+    repository = payload.get("repository") or {}
+    github_repo_url = repository.get("clone_url")
+    repo_name = repository.get("name")
+    if not github_repo_url or not repo_name:
+        raise ValueError("Invalid payload: missing repository details")
+    return {
+        "user_id": user_id,
+        "github_repo_url": github_repo_url,
+        "repo_name": repo_name,
+        "ref": payload.get("ref"),
+        "before": payload.get("before"),
+        "after": payload.get("after"),
+        "deleted": bool(payload.get("deleted")),
+        "forced": bool(payload.get("forced")),
+    }
+
+
+async def append_async(event: dict, delivery_id: str = None) -> bool:
+    """Appends a push to the stream. False when this delivery was already accepted."""
+    if delivery_id:
+        first = await async_redis_client.set(f"webhook:delivery:{delivery_id}", 1, nx=True, ex=DELIVERY_TTL)
+        if not first:
+            return False
+    await async_redis_client.xadd(
+        STREAM_KEY,
+        {"event": json.dumps(event)},
+        maxlen=settings.WEBHOOK_STREAM_MAXLEN,
+        approximate=True,
+    )
+    return True
+
+
+def decode(fields: dict) -> dict:
+    return json.loads(fields["event"])
@@ -1,6 +1,18 @@
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown
+from kombu import Queue
 from ..core.config import settings
+from ..core.metrics import mark_process_dead
+
+# Sync queues. A worker consuming several of them always takes from the first non-empty one
+# in this order, so a bulk backlog never delays a click or a push; large repos (by GitHub's
+# `size`) get their own queue so they cannot hold every bulk slot.
+QUEUE_INTERACTIVE = "sync.interactive"  # manual single-repo triggers
+QUEUE_WEBHOOK = "sync.webhook"  # webhook and follow-up syncs
+QUEUE_DEFAULT = "celery"  # planning, provisioning and other short tasks
+QUEUE_BULK = "sync.bulk"  # trigger-all and the nightly run
+QUEUE_LARGE = "sync.large"  # bulk syncs of repos above LARGE_REPO_SIZE_KB
 
 celery_app = Celery(
     "github_gitee_sync",
@@ -15,6 +27,19 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="Asia/Shanghai",
     enable_utc=True,
+    task_queues=[Queue(name, routing_key=name) for name in (QUEUE_INTERACTIVE, QUEUE_WEBHOOK, QUEUE_DEFAULT, QUEUE_BULK, QUEUE_LARGE)],
+    task_default_queue=QUEUE_DEFAULT,
+    task_routes={"app.worker.tasks.sync_repository": {"queue": QUEUE_BULK}},
+    broker_transport_options={
+        "queue_order_strategy": "priority",
+        # Unacked syncs are redelivered after this long; keep it above the longest sync and countdown
+        "visibility_timeout": settings.CELERY_VISIBILITY_TIMEOUT,
+    },
+    # A sync is acknowledged once it finishes and requeued if its worker dies mid-way.
+    # Prefetching one at a time keeps queued syncs available to idle workers.
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
 )
 
 celery_app.conf.beat_schedule = {
@@ -22,4 +47,14 @@ celery_app.conf.beat_schedule = {
         "task": "app.worker.periodic_tasks.auto_sync_all_users",
         "schedule": crontab(minute=0, hour=2), # 每天凌晨2点执行
     },
+    "reap-expired-syncs": {
+        "task": "app.worker.periodic_tasks.reap_expired_syncs",
+        "schedule": settings.SYNC_REAPER_INTERVAL,  # 回收失联 Worker 的同步任务
+    },
 }
+
+
+@worker_process_shutdown.connect
+def _release_metrics(pid=None, **kwargs):
+    # Prefork children write their metrics to PROMETHEUS_MULTIPROC_DIR; see app.core.metrics
+    mark_process_dead(pid)
@@ -0,0 +1,318 @@
+import os
+import queue
+import re
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from app.core.config import settings
+from app.core.rate_limit import RateLimited, block, concurrency_slot, token_scope
+
+# stderr fragments git prints when GitHub/Gitee throttle a transfer
+RATE_LIMIT_MARKERS = ("rate limit", "too many requests", "http 429", "error: 429", "abuse detection")
+
+# Seconds between watchdog checks, between cancel checks, and from SIGTERM to SIGKILL
+WATCH_INTERVAL = 0.2
+CANCEL_POLL_INTERVAL = 1.0
+KILL_GRACE = 5
+# Limit for local bookkeeping commands (ref and object lookups, ref updates), which move no data
+LOCAL_GIT_TIMEOUT = 120
+# git runs in a process group of its own, so its helpers can be killed along with it
+PROCESS_GROUP = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt" else {"start_new_session": True}
+
+_watch = threading.local()
+
+# "Receiving objects:  45% (450/1000), 1.20 MiB | 2.00 MiB/s", optionally prefixed by "remote: "
+PROGRESS_RE = re.compile(
+    r"^(?:remote:\s*)?(?P<stage>[A-Z][a-z]+(?: [a-z]+)*):\s+(?P<percent>\d+)% \((?P<done>\d+)/(?P<total>\d+)\)"
+    r"(?:,\s*(?P<transferred>[\d.]+ (?:[KMGT]?i?B|bytes)))?"
+)
+
+
+def _git_scopes(auth_url: str) -> tuple:
+    """(host scope, token scope) for an authenticated `https://oauth2:<token>@host/...` URL."""
+    parsed = urlparse(auth_url)
+    host = parsed.hostname or "local"
+    token = parsed.password or ""
+    return f"git:{host}", f"git:{token_scope(host, token)}"
+
+
+def parse_progress(line: str):
+    """(stage, percent, done, total, transferred) for a git progress line, else None."""
+    match = PROGRESS_RE.match(line.strip())
+    if not match:
+        return None
+    return (match["stage"], int(match["percent"]), int(match["done"]), int(match["total"]), match["transferred"])
+
+
+class GitTimeout(Exception):
+    """A git command ran past its time limit or stopped making progress, and was killed."""
+
+
+class GitCancelled(Exception):
+    """The sync was cancelled while a git command ran, and the command was killed."""
+
+
+def watch_cancel(check):
+    """
+    Makes every git command this thread runs stop with `GitCancelled` once `check()` returns
+    true (polled every CANCEL_POLL_INTERVAL seconds). `None` stops watching.
+    """
+    _watch.check = check
+
+
+def _kill(proc: subprocess.Popen):
+    """Ends git and everything it started (remote helpers, pack-objects, ssh): its whole process group."""
+    try:
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+        else:
+            os.killpg(proc.pid, signal.SIGTERM)
+            try:
+                proc.wait(KILL_GRACE)
+            except subprocess.TimeoutExpired:
+                pass
+            # Helpers that outlived git itself
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    proc.wait()
+
+
+def _feed(stream, data: bytes):
+    try:
+        stream.write(data)
+        stream.close()
+    except OSError:
+        pass  # git exited (or was killed) without reading all of it
+
+
+def _pump(stream, name: str, events: queue.Queue):
+    while True:
+        chunk = os.read(stream.fileno(), 8192)
+        events.put((name, chunk))
+        if not chunk:
+            return
+
+
+def _run(cmd: list, cwd: str, progress, timeout: float, stall_timeout: float, input: str = None) -> subprocess.CompletedProcess:
+    """
+    Runs git in its own process group, writing `input` to it and reading its output on the side.
+    The group is killed when the command runs longer than `timeout`, when `stall_timeout` passes
+    without new output or progress (counts that do not move are not progress), or when the
+    thread's cancel check fires. With `progress`, git reports `--progress` and parsed lines are fed to it.
+    """
+    if progress:
+        cmd = cmd[:2] + ["--progress"] + cmd[2:]
+    stdin = subprocess.PIPE if input is not None else None
+    proc = subprocess.Popen(cmd, cwd=cwd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **PROCESS_GROUP)
+    if input is not None:
+        threading.Thread(target=_feed, args=(proc.stdin, input.encode()), daemon=True).start()
+    events = queue.Queue()
+    for stream, name in ((proc.stdout, "stdout"), (proc.stderr, "stderr")):
+        threading.Thread(target=_pump, args=(stream, name, events), daemon=True).start()
+
+    # Progress lines are redrawn with \r; everything else is kept for errors and fallbacks
+    stdout, messages, pending = [], [], b""
+    started = active = time.monotonic()
+    checked, last_progress, open_streams = None, None, 2
+    check = getattr(_watch, "check", None)
+    try:
+        while open_streams:
+            now = time.monotonic()
+            if timeout and now - started > timeout:
+                raise GitTimeout(f"git {cmd[1]} did not finish within {timeout:.0f}s")
+            if stall_timeout and now - active > stall_timeout:
+                raise GitTimeout(f"git {cmd[1]} made no progress for {stall_timeout:.0f}s")
+            if check and (checked is None or now - checked >= CANCEL_POLL_INTERVAL):
+                checked = now
+                if check():
+                    raise GitCancelled(f"git {cmd[1]} stopped: sync cancelled")
+            try:
+                name, chunk = events.get(timeout=WATCH_INTERVAL)
+            except queue.Empty:
+                continue
+            if not chunk:
+                open_streams -= 1
+                continue
+            if name == "stdout":
+                stdout.append(chunk)
+                active = now
+                continue
+            *lines, pending = re.split(rb"[\r\n]", pending + chunk)
+            for raw in lines:
+                line = raw.decode(errors="replace")
+                parsed = parse_progress(line)
+                if parsed:
+                    if (parsed[0], parsed[2], parsed[4]) != last_progress:
+                        last_progress = (parsed[0], parsed[2], parsed[4])
+                        active = now
+                    if progress:
+                        progress(*parsed)
+                elif line.strip():
+                    messages.append(line)
+                    active = now
+        returncode = proc.wait()
+    except BaseException:
+        _kill(proc)
+        raise
+    finally:
+        proc.stdout.close()
+        proc.stderr.close()
+    if pending.strip():
+        messages.append(pending.decode(errors="replace"))
+
+    out = b"".join(stdout).decode(errors="replace")
+    err = "\n".join(messages)
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd, output=out, stderr=err)
+    return subprocess.CompletedProcess(cmd, returncode, out, err)
+
+
+def run_git(cmd: list, cwd: str = None, auth_url: str = None, progress=None, timeout: float = None, input: str = None) -> subprocess.CompletedProcess:
+    """
+    subprocess.run for git, under a watchdog: the command is killed (`GitTimeout`) after
+    `timeout` (default GIT_TIMEOUT) or, for remote commands (`auth_url`), after GIT_STALL_TIMEOUT
+    without progress, and on cancellation (`GitCancelled`, see `watch_cancel`).
+    Throttling errors from the remote are raised as `RateLimited`
+    (and the user's token scope backs off) instead of `CalledProcessError`.
+    With a `progress(stage, percent, done, total, transferred)` callback, transfer commands
+    report git's progress while they run.
+    """
+    stall_timeout = settings.GIT_STALL_TIMEOUT if auth_url else None
+    try:
+        return _run(cmd, cwd, progress, timeout or settings.GIT_TIMEOUT, stall_timeout, input)
+    except subprocess.CalledProcessError as e:
+        stderr = (e.stderr or "").lower()
+        if auth_url and any(marker in stderr for marker in RATE_LIMIT_MARKERS):
+            _, scope = _git_scopes(auth_url)
+            block(scope, settings.RATE_LIMIT_DEFAULT_BACKOFF)
+            raise RateLimited(scope, settings.RATE_LIMIT_DEFAULT_BACKOFF) from e
+        raise
+
+
+@contextmanager
+def transfer_slot(auth_url: str):
+    """Holds a fleet-wide git transfer slot for the remote's host and for the user's token."""
+    host_scope, user_scope = _git_scopes(auth_url)
+    gitee_host = urlparse(settings.GITEE_GIT_URL).hostname or "local"
+    host_limit = settings.GITEE_GIT_CONCURRENCY if host_scope == f"git:{gitee_host}" else settings.GITHUB_GIT_CONCURRENCY
+
+    with concurrency_slot(host_scope, host_limit), concurrency_slot(user_scope, settings.GIT_TOKEN_CONCURRENCY):
+        yield
+
+
+def ls_remote(auth_url: str, refs: list = None) -> dict:
+    """
+    Returns the branch and tag refs advertised by a remote as {ref: sha}, optionally only `refs`.
+    Peeled tag entries (`refs/tags/v1^{}`) and GitHub's hidden refs (refs/pull/*) are left out,
+    since those never reach Gitee anyway.
+    """
+    cmd = ["git", "ls-remote", "--heads", "--tags", auth_url] + list(refs or [])
+    res = run_git(cmd, auth_url=auth_url)
+
+    advertised = {}
+    for line in res.stdout.splitlines():
+        sha, _, ref = line.partition("\t")
+        if not ref or ref.endswith("^{}"):
+            continue
+        if refs and ref not in refs:
+            # ls-remote patterns match on ref suffixes
+            continue
+        advertised[ref] = sha
+    return advertised
+
+
+def refs_in_sync(github_auth_url: str, gitee_auth_url: str) -> dict:
+    """GitHub's heads/tags ({ref: sha}) when Gitee already advertises exactly the same, else None."""
+    github_refs = ls_remote(github_auth_url)
+    try:
+        gitee_refs = ls_remote(gitee_auth_url)
+    except subprocess.CalledProcessError:
+        # Missing or inaccessible Gitee repo: the full sync path creates/reports it
+        return None
+    return github_refs if github_refs and github_refs == gitee_refs else None
+
+
+def local_refs(repo_dir: str) -> dict:
+    """The branch and tag refs of a local repository as {ref: sha}, in `ls_remote`'s form."""
+    res = run_git(["git", "for-each-ref", "--format=%(objectname) %(refname)", "refs/heads", "refs/tags"], cwd=repo_dir)
+    pairs = (line.split(" ", 1) for line in res.stdout.splitlines() if line)
+    return {ref: sha for sha, ref in pairs}
+
+
+def _disk_usage(repo_dir: str, tips: list, exclude: list) -> int:
+    """On-disk (compressed) size of the objects reachable from `tips` but not from `exclude`."""
+    cmd = ["git", "rev-list", "--objects", "--disk-usage", "--ignore-missing"] + tips + ["--not"] + exclude
+    return int(run_git(cmd, cwd=repo_dir).stdout.strip() or 0)
+
+
+def _batch_end(repo_dir: str, commits: list, start: int, exclude: list, limit: int) -> int:
+    """Index of the last commit of `commits` (oldest first) from `start` whose history beyond `exclude` fits `limit`."""
+    def fits(i: int) -> bool:
+        return _disk_usage(repo_dir, [commits[i]], exclude) <= limit
+
+    if not fits(start):
+        return start  # a commit cannot be split, it goes alone
+    # Gallop forward, then bisect between the last fitting and the first oversized candidate
+    good, step = start, 1
+    bad = len(commits)
+    while good + step < len(commits):
+        if not fits(good + step):
+            bad = good + step
+            break
+        good += step
+        step *= 2
+    while bad - good > 1:
+        mid = (good + bad) // 2
+        if fits(mid):
+            good = mid
+        else:
+            bad = mid
+    return good
+
+
+def push_in_chunks(repo_dir: str, auth_url: str, limit: int, progress=None) -> int:
+    """
+    Pushes the branch history the remote lacks in batches of at most about `limit` bytes (packed),
+    each batch moving a branch to a later commit of its first-parent chain, so no single pack
+    hits the remote's size or time limits. The remote's refs are the checkpoint: a later attempt
+    only pushes what the accepted batches did not cover. Returns the number of batches, 0 when
+    everything fits in one push (the caller's regular push then does all of it).
+    """
+    remote = ls_remote(auth_url)
+    exclude = sorted(set(remote.values()))
+    refs = local_refs(repo_dir)
+    try:
+        if _disk_usage(repo_dir, sorted(set(refs.values())), exclude) <= limit:
+            return 0
+    except subprocess.CalledProcessError as e:
+        print(f"⚠️ Cannot size the push (rev-list --disk-usage needs git 2.31+), pushing in one go: {e.stderr}")
+        return 0
+
+    # The default branch first, so the repo is usable on Gitee as early as possible
+    try:
+        head = run_git(["git", "symbolic-ref", "-q", "HEAD"], cwd=repo_dir, timeout=LOCAL_GIT_TIMEOUT).stdout.strip()
+    except subprocess.CalledProcessError:
+        head = None  # detached
+    branches = sorted((ref for ref in refs if ref.startswith("refs/heads/")), key=lambda ref: ref != head)
+    batches = 0
+    for ref in branches:
+        tip = refs[ref]
+        if remote.get(ref) == tip:
+            continue
+        cmd = ["git", "rev-list", "--first-parent", "--reverse", "--ignore-missing", tip, "--not"] + exclude
+        commits = run_git(cmd, cwd=repo_dir).stdout.split()
+        start = 0
+        while start < len(commits):
+            end = _batch_end(repo_dir, commits, start, exclude, limit)
+            batches += 1
+            print(f"⬆️ Pushing {ref} batch {batches}: commits {start + 1}-{end + 1} of {len(commits)}")
+            # Forced: in a mirror a rewritten branch is overwritten anyway
+            run_git(["git", "push", auth_url, f"+{commits[end]}:{ref}"], cwd=repo_dir, auth_url=auth_url, progress=progress)
+            exclude.append(commits[end])
+            start = end + 1
+    return batches
@@ -0,0 +1,458 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+from contextlib import ExitStack, contextmanager
+
+from app.core.config import settings
+from app.worker.git_ops import LOCAL_GIT_TIMEOUT, GitTimeout, ls_remote, run_git, transfer_slot
+
+try:
+    import fcntl
+except ImportError:  # Windows workers (--pool=solo)
+    fcntl = None
+    import msvcrt
+
+META_FILE = "syncpulse-cache.json"
+# Members repack their own objects into the shared pool once this much accumulated locally
+LOCAL_REPACK_BYTES = 32 * 1024 ** 2
+
+
+def _lock(fh, blocking: bool = True) -> bool:
+    try:
+        if fcntl:
+            fcntl.flock(fh, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fh):
+    if fcntl:
+        fcntl.flock(fh, fcntl.LOCK_UN)
+    else:
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _normalize_url(github_repo_url: str) -> str:
+    """One spelling per repo (GitHub names are case-insensitive; `/` and `.git` are optional)."""
+    url = github_repo_url.strip().rstrip("/").lower()
+    return url[:-4] if url.endswith(".git") else url
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class MirrorCache:
+    """
+    Bare `git clone --mirror` copies kept on the worker's disk, one per (user, repo).
+    The first sync clones, later syncs only `fetch --prune` the new objects.
+
+    Mirrors of related repos (forks, or mirrors of one upstream by several users) share their
+    history through a pool: a bare repo under pools/, named after a root commit, that the
+    members borrow objects from via git alternates. A member's refs are kept in the pool
+    under refs/members/<key>/, so every object a member borrows stays reachable there.
+    A new repo whose GitHub tips are already in a pool is cloned against it and only
+    downloads what the pool lacks. Pools are only pruned with all their members locked,
+    and removed once they have none.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.mirrors_dir = os.path.join(root, "mirrors")
+        self.pools_dir = os.path.join(root, "pools")
+        self.locks_dir = os.path.join(root, "locks")
+
+    def key_for(self, user_id: int, github_repo_url: str) -> str:
+        repo_name = github_repo_url.rstrip("/").split("/")[-1].replace(".git", "")
+        digest = hashlib.sha1(_normalize_url(github_repo_url).encode()).hexdigest()[:16]
+        return f"{user_id}-{repo_name}-{digest}"
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.mirrors_dir, f"{key}.git")
+
+    def pool_path(self, family: str) -> str:
+        return os.path.join(self.pools_dir, f"{family}.git")
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.locks_dir, f"{key}.lock")
+
+    @contextmanager
+    def locked(self, key: str, blocking: bool = True):
+        """Per-mirror exclusive file lock shared by every worker process on this host."""
+        os.makedirs(self.locks_dir, exist_ok=True)
+        with open(self._lock_path(key), "a+") as fh:
+            if not _lock(fh, blocking):
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                _unlock(fh)
+
+    @contextmanager
+    def checkout(self, user_id: int, github_repo_url: str, auth_url: str, refspecs: list = None, progress=None, upstream=None):
+        """
+        Yields an up-to-date bare mirror of `github_repo_url` while holding its lock.
+        With `refspecs`, an existing mirror only fetches those refs. `progress` is passed to `run_git`.
+        `upstream()`, only called before a first clone, may return the URL of the repo this one
+        was forked from, to find its pool when no GitHub tip is in one yet.
+        Credentials are only passed on the command line, never written to the cached config.
+        """
+        key = self.key_for(user_id, github_repo_url)
+        repo_dir = self.path_for(key)
+        os.makedirs(self.mirrors_dir, exist_ok=True)
+
+        with self.locked(key):
+            if refspecs and self._is_valid(repo_dir):
+                # Failures here mean the refs moved on GitHub, not a broken mirror: let the caller decide
+                print(f"🎯 Fetching {len(refspecs)} ref(s) into cached mirror {repo_dir}")
+                self._fetch(repo_dir, auth_url, refspecs, progress=progress)
+            elif self._is_valid(repo_dir):
+                try:
+                    print(f"🔁 Fetching updates for cached mirror {repo_dir}")
+                    self._fetch(repo_dir, auth_url, progress=progress)
+                except subprocess.CalledProcessError:
+                    # A broken mirror (interrupted gc, disk full...) is cheaper to rebuild than to repair
+                    print(f"⚠️ Cached mirror {repo_dir} is unusable, re-cloning")
+                    shutil.rmtree(repo_dir, ignore_errors=True)
+                    self._clone(repo_dir, github_repo_url, auth_url, progress=progress)
+            else:
+                shutil.rmtree(repo_dir, ignore_errors=True)
+                self._clone_new(key, repo_dir, github_repo_url, auth_url, progress=progress, upstream=upstream)
+
+            try:
+                self._share(key, repo_dir)
+            except subprocess.CalledProcessError as e:
+                # The mirror itself is fine; it shares on a later sync
+                print(f"⚠️ Could not share objects of {repo_dir}: {e.stderr}")
+
+            try:
+                yield repo_dir
+            finally:
+                self._write_meta(repo_dir)
+
+        self.evict(keep=key)
+
+    def _is_valid(self, repo_dir: str) -> bool:
+        if not os.path.isdir(repo_dir):
+            return False
+        pool = self._pool_of(repo_dir)
+        if pool and not os.path.isdir(os.path.join(self.pool_path(pool), "objects")):
+            return False
+        try:
+            res = run_git(["git", "rev-parse", "--is-bare-repository"], cwd=repo_dir, timeout=LOCAL_GIT_TIMEOUT)
+        except subprocess.CalledProcessError:
+            return False
+        return res.stdout.strip() == "true"
+
+    def _clone_new(self, key: str, repo_dir: str, github_repo_url: str, auth_url: str, progress=None, upstream=None):
+        """Clones a repo not cached yet, against the pool of its family when one is found."""
+        family, seed = self._family_for_remote(auth_url), None
+        if family is None and upstream:
+            family, seed = self._family_for_upstream(upstream())
+        if family is None:
+            print(f"⬇️ Cloning {github_repo_url} into {repo_dir}")
+            self._clone(repo_dir, github_repo_url, auth_url, progress=progress)
+            return
+        # Held until the clone has joined, so the pool cannot be pruned under it
+        with self.locked(f"pool-{family}"):
+            if seed:
+                # The upstream's mirror is not pooled yet: start the pool with its objects (it joins on its next sync)
+                self._fetch_into_pool(family, *seed)
+            print(f"⬇️ Cloning {github_repo_url} into {repo_dir} (sharing objects with pool {family[:12]})")
+            self._clone(repo_dir, github_repo_url, auth_url, progress=progress, reference=self.pool_path(family))
+            self._join(key, repo_dir, family)
+
+    def _clone(self, repo_dir: str, github_repo_url: str, auth_url: str, progress=None, reference: str = None):
+        clone_cmd = ["git", "clone", "--mirror", auth_url, repo_dir]
+        if reference:
+            clone_cmd[3:3] = ["--reference", reference]
+        with transfer_slot(auth_url):
+            run_git(clone_cmd, auth_url=auth_url, progress=progress)
+        # Keep the token out of the on-disk config
+        run_git(["git", "remote", "set-url", "origin", github_repo_url], cwd=repo_dir, timeout=LOCAL_GIT_TIMEOUT)
+
+    def _fetch(self, repo_dir: str, auth_url: str, refspecs: list = None, progress=None):
+        if refspecs:
+            fetch_cmd = ["git", "fetch", auth_url] + refspecs
+        else:
+            fetch_cmd = ["git", "fetch", "--prune", auth_url, "+refs/*:refs/*"]
+        with transfer_slot(auth_url):
+            run_git(fetch_cmd, cwd=repo_dir, auth_url=auth_url, progress=progress)
+
+    def _pools(self) -> list:
+        if not os.path.isdir(self.pools_dir):
+            return []
+        return [name[:-4] for name in os.listdir(self.pools_dir) if name.endswith(".git")]
+
+    def _pool_of(self, repo_dir: str):
+        """The family whose pool a mirror borrows objects from, if any."""
+        try:
+            with open(os.path.join(repo_dir, "objects", "info", "alternates")) as fh:
+                lines = [line.strip() for line in fh if line.strip()]
+        except OSError:
+            return None
+        for line in lines:
+            pool_dir = os.path.dirname(os.path.realpath(line))
+            if os.path.dirname(pool_dir) == os.path.realpath(self.pools_dir) and pool_dir.endswith(".git"):
+                return os.path.basename(pool_dir)[:-4]
+        return None
+
+    def _memberships(self) -> dict:
+        """{family: keys of the cached mirrors that borrow from its pool}."""
+        members = {}
+        if os.path.isdir(self.mirrors_dir):
+            for name in os.listdir(self.mirrors_dir):
+                family = self._pool_of(os.path.join(self.mirrors_dir, name)) if name.endswith(".git") else None
+                if family:
+                    members.setdefault(family, []).append(name[:-4])
+        return members
+
+    def _roots(self, repo_dir: str) -> list:
+        """The mirror's root commits, cached in its metadata (they only change with rewritten history)."""
+        meta = self._read_meta(repo_dir) or {}
+        if "roots" not in meta:
+            res = run_git(["git", "rev-list", "--max-parents=0", "--all"], cwd=repo_dir)
+            meta["roots"] = sorted(set(res.stdout.split()))
+            self._write_meta(repo_dir, roots=meta["roots"])
+        return meta["roots"]
+
+    def _family_for_remote(self, auth_url: str):
+        """A pool that already holds one of the remote's branch/tag tips, i.e. shares its history."""
+        pools = self._pools()
+        if not pools:
+            return None
+        try:
+            tips = set(ls_remote(auth_url).values())
+        except subprocess.CalledProcessError:
+            return None
+        if not tips:
+            return None
+        for family in pools:
+            try:
+                res = run_git(
+                    ["git", "cat-file", "--batch-check"], cwd=self.pool_path(family),
+                    input="\n".join(tips) + "\n", timeout=LOCAL_GIT_TIMEOUT
+                )
+            except (subprocess.CalledProcessError, GitTimeout):
+                continue  # a broken pool is just not shared
+            if any(not line.endswith(" missing") for line in res.stdout.splitlines()):
+                return family
+        return None
+
+    def _family_for_upstream(self, upstream_url: str) -> tuple:
+        """
+        (family, seed) for a fork whose upstream is cached here: the upstream mirror's pool, or
+        its first root and (key, dir) of the mirror to seed a new pool from. (None, None) otherwise.
+        """
+        if not upstream_url or not os.path.isdir(self.mirrors_dir):
+            return None, None
+        suffix = f"-{self.key_for(0, upstream_url).rsplit('-', 1)[-1]}.git"
+        for name in os.listdir(self.mirrors_dir):
+            if not name.endswith(suffix):
+                continue
+            repo_dir = os.path.join(self.mirrors_dir, name)
+            family = self._pool_of(repo_dir)
+            if family:
+                return family, None
+            roots = (self._read_meta(repo_dir) or {}).get("roots")
+            if roots:
+                return roots[0], (name[:-4], repo_dir)
+        return None, None
+
+    def _family_for_roots(self, key: str, roots: list):
+        """The family of a mirror outside any pool: an existing pool, or another mirror, with a common root."""
+        pools = set(self._pools())
+        for root in roots:
+            if root in pools:
+                return root
+        wanted = set(roots)
+        for name in os.listdir(self.mirrors_dir):
+            if not name.endswith(".git") or name[:-4] == key:
+                continue
+            common = wanted & set((self._read_meta(os.path.join(self.mirrors_dir, name)) or {}).get("roots", []))
+            if common:
+                return min(common)
+        return None
+
+    def _share(self, key: str, repo_dir: str):
+        """
+        After a clone or fetch: refreshes the member's refs in its pool (and repacks once enough
+        objects accumulated locally), or makes the mirror a member once a related mirror shows up.
+        """
+        family = self._pool_of(repo_dir)
+        if family is None:
+            roots = self._roots(repo_dir)
+            family = self._family_for_roots(key, roots) if roots else None
+            if family is None:
+                return
+        with self.locked(f"pool-{family}"):
+            self._join(key, repo_dir, family)
+
+    def _fetch_into_pool(self, family: str, key: str, repo_dir: str) -> str:
+        """Creates the pool if needed and (re)copies a mirror's refs and objects into it. Needs the pool lock."""
+        pool_dir = self.pool_path(family)
+        if not os.path.isdir(pool_dir):
+            os.makedirs(self.pools_dir, exist_ok=True)
+            run_git(["git", "init", "-q", "--bare", pool_dir])
+            # Objects only go away in `_compact`, never in a background gc
+            run_git(["git", "config", "gc.auto", "0"], cwd=pool_dir)
+            run_git(["git", "config", "gc.pruneExpire", "never"], cwd=pool_dir)
+            print(f"🧬 Created shared object pool {family[:12]}")
+        run_git(["git", "fetch", "-q", "--prune", "--no-tags", repo_dir, f"+refs/*:refs/members/{key}/*"], cwd=pool_dir)
+        return pool_dir
+
+    def _join(self, key: str, repo_dir: str, family: str):
+        """Copies the mirror's refs and objects into the pool and borrows from it. Needs the pool lock."""
+        pool_dir = self._fetch_into_pool(family, key, repo_dir)
+
+        alternates = os.path.join(repo_dir, "objects", "info", "alternates")
+        joined = self._pool_of(repo_dir) != family
+        if joined:
+            os.makedirs(os.path.dirname(alternates), exist_ok=True)
+            with open(alternates, "w") as fh:
+                fh.write(os.path.abspath(os.path.join(pool_dir, "objects")) + "\n")
+            print(f"🧬 {key} now shares objects with pool {family[:12]}")
+
+        res = run_git(["git", "count-objects", "-v"], cwd=repo_dir)
+        counts = dict(line.split(": ", 1) for line in res.stdout.splitlines() if ": " in line)
+        local_kib = int(counts.get("size", 0)) + int(counts.get("size-pack", 0))
+        if joined or local_kib * 1024 >= LOCAL_REPACK_BYTES:
+            # -l leaves out everything the pool has
+            run_git(["git", "repack", "-a", "-d", "-l", "-q"], cwd=repo_dir)
+        self._write_meta(pool_dir)
+
+    def _leave(self, key: str, family: str):
+        """Drops an evicted member's refs from its pool; its objects stay until `_compact`."""
+        pool_dir = self.pool_path(family)
+        if not os.path.isdir(pool_dir):
+            return
+        with self.locked(f"pool-{family}"):
+            self._drop_refs(pool_dir, {key})
+
+    def _drop_refs(self, pool_dir: str, keys: set):
+        res = run_git(["git", "for-each-ref", "--format=%(refname)", "refs/members/"], cwd=pool_dir)
+        doomed = [ref for ref in res.stdout.splitlines() if ref.split("/")[2] in keys]
+        if doomed:
+            commands = "".join(f"delete {ref}\n" for ref in doomed)
+            run_git(["git", "update-ref", "--stdin"], cwd=pool_dir, input=commands, timeout=LOCAL_GIT_TIMEOUT)
+
+    def _compact(self, family: str) -> int:
+        """
+        Removes the pool when it has no members left, else prunes objects no member needs
+        anymore, provided every member can be locked. Returns the bytes freed.
+        """
+        pool_dir = self.pool_path(family)
+        before = (self._read_meta(pool_dir) or {}).get("size", 0)
+        with ExitStack() as stack:
+            members = sorted(self._memberships().get(family, []))
+            for key in members:
+                if not stack.enter_context(self.locked(key, blocking=False)):
+                    return 0  # a member is syncing; try again on a later eviction
+            stack.enter_context(self.locked(f"pool-{family}"))
+            if sorted(self._memberships().get(family, [])) != members:
+                return 0  # joined meanwhile
+            if not members:
+                print(f"🧹 Removing shared object pool {family[:12]} ({before} bytes)")
+                shutil.rmtree(pool_dir, ignore_errors=True)
+                return before
+            for key in members:
+                # Refresh every member's refs, so each object a member borrows is reachable
+                self._fetch_into_pool(family, key, self.path_for(key))
+            # Refs of mirrors that seeded the pool but were evicted before joining
+            res = run_git(["git", "for-each-ref", "--format=%(refname)", "refs/members/"], cwd=pool_dir)
+            stale = {ref.split("/")[2] for ref in res.stdout.splitlines()} - set(members)
+            self._drop_refs(pool_dir, {key for key in stale if not os.path.isdir(self.path_for(key))})
+            run_git(["git", "gc", "-q", "--prune=now"], cwd=pool_dir)
+            self._write_meta(pool_dir)
+        after = (self._read_meta(pool_dir) or {}).get("size", 0)
+        print(f"🧹 Compacted shared object pool {family[:12]} ({before} -> {after} bytes)")
+        return max(before - after, 0)
+
+    def _write_meta(self, repo_dir: str, **extra):
+        if not os.path.isdir(repo_dir):
+            return
+        try:
+            with open(os.path.join(repo_dir, META_FILE)) as fh:
+                meta = {key: value for key, value in json.load(fh).items() if key == "roots"}
+        except (OSError, ValueError):
+            meta = {}
+        meta.update({"last_used": time.time(), "size": _dir_size(repo_dir)}, **extra)
+        with open(os.path.join(repo_dir, META_FILE), "w") as fh:
+            json.dump(meta, fh)
+
+    def _read_meta(self, repo_dir: str) -> dict:
+        try:
+            with open(os.path.join(repo_dir, META_FILE)) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            pass
+        try:
+            return {"last_used": os.path.getmtime(repo_dir), "size": _dir_size(repo_dir)}
+        except OSError:
+            return None
+
+    def evict(self, keep: str = None):
+        """Drops least recently used mirrors until the cache (mirrors and pools) fits in `max_bytes`."""
+        if not os.path.isdir(self.mirrors_dir):
+            return
+
+        entries = []
+        for name in os.listdir(self.mirrors_dir):
+            if not name.endswith(".git"):
+                continue
+            meta = self._read_meta(os.path.join(self.mirrors_dir, name))
+            if meta is None:
+                continue
+            entries.append((meta.get("last_used", 0), meta.get("size", 0), name[:-4]))
+        pools = {family: (self._read_meta(self.pool_path(family)) or {}).get("size", 0) for family in self._pools()}
+
+        total = sum(size for _, size, _ in entries) + sum(pools.values())
+        left = set()
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            # Never evict a mirror another worker is using right now
+            with self.locked(key, blocking=False) as acquired:
+                if not acquired:
+                    continue
+                family = self._pool_of(self.path_for(key))
+                print(f"🧹 Evicting cached mirror {key} ({size} bytes)")
+                shutil.rmtree(self.path_for(key), ignore_errors=True)
+                total -= size
+            if family:
+                left.add(family)
+                try:
+                    self._leave(key, family)
+                except subprocess.CalledProcessError as e:
+                    print(f"⚠️ Could not drop {key} from pool {family[:12]}: {e.stderr}")
+
+        # Pools without members go; the others shed evicted members' objects while still over budget
+        members = self._memberships()
+        for family in pools:
+            if family in members and (family not in left or total <= self.max_bytes):
+                continue
+            try:
+                total -= self._compact(family)
+            except subprocess.CalledProcessError as e:
+                print(f"⚠️ Could not compact pool {family[:12]}: {e.stderr}")
+
+mirror_cache = MirrorCache(settings.MIRROR_CACHE_DIR, settings.MIRROR_CACHE_MAX_BYTES)
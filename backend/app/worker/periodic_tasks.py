@@ -1,69 +1,158 @@
 from .celery_app import celery_app
+from celery import chord, group
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.core.database import SessionLocal
-from app.models.user import User, RepositorySyncTask
-from app.worker.tasks import sync_repository
-import requests
+from app.core.metrics import SYNC_LEASES_EXPIRED
+from app.core.rate_limit import RateLimited, acquire
+from app.core.redis import redis_client
+from app.models.user import User
+from app.services import sync_lease
+from app.services.bulk_sync import enqueue_repos, requeue
+from app.services.providers import GitHubClient
+from app.services.task_stats import set_status
+from datetime import datetime, timezone
+import json
+import random
 import time
+import uuid
+
+AUTO_SYNC_SUMMARY_TTL = 30 * 24 * 3600
+# Slack so a sweep due "every N days" is not pushed back a night by beat jitter
+FULL_SWEEP_SLACK = 3600
+# Spread of the retries of shards that found the fleet-wide start rate used up
+SHARD_RETRY_JITTER = 30
+
+def _full_sweep_due(now: float) -> bool:
+    days = settings.AUTO_SYNC_FULL_SWEEP_DAYS
+    if days <= 0:
+        return True
+    last = redis_client.get("sync:auto:last_full")
+    return last is None or now - float(last) >= days * 24 * 3600 - FULL_SWEEP_SLACK
 
 @celery_app.task
-def auto_sync_all_users():
+def auto_sync_all_users(force: bool = None):
     """
     Periodic task to trigger sync for all users who have both GitHub and Gitee linked.
+    Users are split into shards that are planned in parallel; a chord callback records a summary.
+    Only repos pushed to since their last successful sync are queued, except in a full sweep
+    (`force`, or by default once AUTO_SYNC_FULL_SWEEP_DAYS have passed since the last one).
+    """
+    started_at = time.time()
+    run_id = uuid.uuid4().hex
+    full = _full_sweep_due(started_at) if force is None else force
+
+    db: Session = SessionLocal()
+    try:
+        user_ids = [user_id for (user_id,) in db.query(User.id).filter(
+            User.github_access_token.isnot(None), User.gitee_access_token.isnot(None)
+        ).order_by(User.id)]
+    finally:
+        db.close()
+
+    size = settings.AUTO_SYNC_SHARD_SIZE
+    shards = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+    print(f"🌙 Auto sync {run_id}: {len(user_ids)} users in {len(shards)} shards{' (full sweep)' if full else ''}")
+    if not shards:
+        record_auto_sync_summary([], run_id, started_at, full)
+        return {"run_id": run_id, "shards": 0, "full": full}
+
+    chord(group(plan_user_shard.s(shard, full) for shard in shards))(record_auto_sync_summary.s(run_id, started_at, full))
+    return {"run_id": run_id, "shards": len(shards), "full": full}
+
+@celery_app.task(bind=True, max_retries=None)
+def plan_user_shard(self, user_ids: list, full: bool = False):
     """
+    Plans the nightly sync of one shard of users: lists their GitHub repos and bulk-enqueues
+    the ones without an active task that changed since their last sync (all of them when
+    `full`). Returns one result dict per user.
+    Shards start at most AUTO_SYNC_SHARD_RATE per second across every worker; a shard over
+    the rate is rescheduled instead of holding its worker.
+    """
+    try:
+        acquire("auto-sync:shards", settings.AUTO_SYNC_SHARD_RATE, settings.AUTO_SYNC_SHARD_BURST, max_wait=0)
+    except RateLimited as e:
+        raise self.retry(countdown=e.retry_after + random.uniform(0, SHARD_RETRY_JITTER))
+
+    results = []
     db: Session = SessionLocal()
     try:
-        users = db.query(User).filter(User.github_access_token.isnot(None), User.gitee_access_token.isnot(None)).all()
-        for user in users:
-            # Fetch repos from github
-            headers = {
-                "Accept": "application/vnd.github+json",
-                "Authorization": f"Bearer {user.github_access_token}",
-                "X-GitHub-Api-Version": "2022-11-28"
-            }
+        for user_id in user_ids:
+            user = db.query(User).filter(User.id == user_id).first()
+            if not user or not user.github_access_token or not user.gitee_access_token:
+                continue
             try:
-                response = requests.get(
-                    "https://api.github.com/user/repos", 
-                    headers=headers, 
-                    params={"visibility": "all", "per_page": 100},
-                    timeout=10
-                )
-                if response.status_code == 200:
-                    repos = response.json()
-                    for r in repos:
-                        github_repo_url = r["clone_url"]
-                        repo_name = r["name"]
-                        
-                        # Check existing active sync tasks
-                        existing = db.query(RepositorySyncTask).filter(
-                            RepositorySyncTask.user_id == user.id,
-                            RepositorySyncTask.github_repo_url == github_repo_url,
-                            RepositorySyncTask.status.in_(["pending", "syncing"])
-                        ).first()
-                        
-                        if not existing:
-                            task_record = RepositorySyncTask(
-                                user_id=user.id,
-                                github_repo_url=github_repo_url,
-                                gitee_repo_url=f"https://gitee.com/{user.gitee_username}/{repo_name}.git",
-                                status="pending"
-                            )
-                            db.add(task_record)
-                            db.commit()
-                            db.refresh(task_record)
-                            
-                            sync_repository.delay(
-                                task_id=task_record.id,
-                                github_repo_url=task_record.github_repo_url,
-                                gitee_repo_url=task_record.gitee_repo_url,
-                                github_pat=user.github_access_token,
-                                gitee_pat=user.gitee_access_token
-                            )
+                # Fetch repos from github
+                repos = GitHubClient(user.github_access_token).list_user_repos()
+                _, task_ids = enqueue_repos(db, user, repos, force=full)
+                results.append({"user_id": user_id, "repos": len(repos), "queued": len(task_ids)})
             except Exception as e:
-                print(f"Error syncing repos for user {user.id}: {e}")
-            
-            # Simple rate limiting per user to avoid hitting APIs too fast
-            time.sleep(2)
-            
+                db.rollback()
+                print(f"Error syncing repos for user {user_id}: {e}")
+                results.append({"user_id": user_id, "repos": 0, "queued": 0, "error": str(e)})
     finally:
         db.close()
+    return results
+
+@celery_app.task
+def record_auto_sync_summary(shard_results: list, run_id: str, started_at: float, full: bool = False):
+    """
+    Chord callback: stores how long planning took and how many syncs it queued, and when
+    the last full sweep started.
+    """
+    user_results = [r for shard in shard_results for r in shard]
+    finished_at = time.time()
+    summary = {
+        "run_id": run_id,
+        "started_at": datetime.fromtimestamp(started_at, timezone.utc).isoformat(),
+        "finished_at": datetime.fromtimestamp(finished_at, timezone.utc).isoformat(),
+        "planning_seconds": round(finished_at - started_at, 3),
+        "shards": len(shard_results),
+        "users": len(user_results),
+        "full": full,
+        "repos": sum(r.get("repos", 0) for r in user_results),
+        "queued": sum(r["queued"] for r in user_results),
+        "failed_users": [r["user_id"] for r in user_results if r.get("error")],
+    }
+    payload = json.dumps(summary)
+    redis_client.setex(f"sync:auto:{run_id}", AUTO_SYNC_SUMMARY_TTL, payload)
+    redis_client.set("sync:auto:last", payload)
+    if full:
+        redis_client.set("sync:auto:last_full", started_at)
+    print(f"🌙 Auto sync {run_id} planned in {summary['planning_seconds']}s, queued {summary['queued']} of {summary['repos']} repos")
+    return summary
+
+@celery_app.task
+def reap_expired_syncs():
+    """
+    Recovers syncs whose worker died: tasks still `syncing` after their lease ran out go back to
+    the queue, or to `failed` once SYNC_LEASE_MAX_RECOVERIES runs of them were lost. Each task is
+    locked on its own, so one a worker is taking over right now is left to that worker.
+    """
+    requeued, failed = [], []
+    db: Session = SessionLocal()
+    try:
+        task_ids = db.execute(sync_lease.expired_ids_query()).scalars().all()
+        db.commit()
+        for task_id in task_ids:
+            task = db.execute(sync_lease.lock_query(task_id)).scalar_one_or_none()
+            if task is None or task.status != "syncing" or not sync_lease.is_expired(task):
+                db.commit()
+                continue
+            user = db.get(User, task.user_id)
+            message = sync_lease.lost_message(task)
+            if user and user.github_access_token and user.gitee_access_token and sync_lease.recover(task):
+                set_status(db, task, "pending", error_message=f"{message}, queued again")
+                requeue([task], {user.id: user})
+                requeued.append(task_id)
+            else:
+                set_status(db, task, "failed", error_message=message)
+                failed.append(task_id)
+    finally:
+        db.close()
+
+    SYNC_LEASES_EXPIRED.labels("requeued").inc(len(requeued))
+    SYNC_LEASES_EXPIRED.labels("failed").inc(len(failed))
+    if requeued or failed:
+        print(f"♻️ Recovered syncs of dead workers: requeued {requeued}, failed {failed}")
+    return {"requeued": requeued, "failed": failed}
@@ -1,26 +1,87 @@
-from .celery_app import celery_app
+from .celery_app import QUEUE_WEBHOOK, celery_app
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.core.database import SessionLocal
+from app.core.metrics import SYNC_LEASES_EXPIRED, SYNC_QUEUE_WAIT_SECONDS, SYNC_SECONDS
+from app.core.rate_limit import RateLimited, SlotBusy
 from app.models.user import RepositorySyncTask
+from app.services import cancellation, gitee_repos, sync_lease
+from app.services.coalesce import ZERO_SHA, claim_dirty, clear_dirty, pop_ref_updates, record_ref_update
+from app.services.progress import ProgressReporter
+from app.services.providers import GitHubClient, GiteeClient, ProviderError
+from app.services.task_stats import record_created, set_status
+from app.worker.git_ops import GitCancelled, local_refs, ls_remote, push_in_chunks, refs_in_sync, run_git, transfer_slot, watch_cancel
+from app.worker.mirror_cache import mirror_cache
+import functools
+import random
+import requests
 import subprocess
-import os
-import shutil
 import tempfile
+import time
+from datetime import datetime, timezone
 
-@celery_app.task(bind=True, max_retries=0)
-def sync_repository(self, task_id: int, github_repo_url: str, gitee_repo_url: str, github_pat: str, gitee_pat: str):
+@celery_app.task(bind=True, max_retries=None)
+def sync_repository(self, task_id: int, github_repo_url: str, gitee_repo_url: str, github_pat: str, gitee_pat: str, scoped: bool = False, rate_limited: int = 0):
     """
     Synchronizes a repository from GitHub to Gitee using git mirror.
+    `scoped` syncs (from webhooks) only transfer the refs recorded for the repo's pushes.
+    `rate_limited` counts the earlier runs rescheduled by provider throttling (at most
+    SYNC_RATE_LIMIT_MAX_RETRIES); runs that only found the transfer slots busy are not counted.
     """
     db: Session = SessionLocal()
-    task = db.query(RepositorySyncTask).filter(RepositorySyncTask.id == task_id).first()
+    # Locked until "syncing" is committed, so a cancel either sees the task queued or running
+    task = db.query(RepositorySyncTask).filter(RepositorySyncTask.id == task_id).with_for_update().first()
     if not task:
         db.close()
         return {"status": "Failed", "error": "Task not found"}
+    if task.status == "cancelled":
+        # Cancelled while queued, and the revoke did not reach the worker that got it
+        db.close()
+        print(f"🚫 Task {task_id} was cancelled before it started")
+        return {"status": "Cancelled"}
+    if task.status not in ("pending", "syncing") or (task.status == "syncing" and not sync_lease.is_expired(task)):
+        # A redelivered message (acks_late) for a task that finished or runs on another worker
+        db.close()
+        print(f"⏭️ Task {task_id} is already {task.status}, ignoring duplicate delivery")
+        return {"status": "Duplicate"}
+    if task.status == "syncing":
+        # Redelivered because its worker died mid-sync: take over before the reaper does
+        if not sync_lease.recover(task):
+            SYNC_LEASES_EXPIRED.labels("failed").inc()
+            set_status(db, task, "failed", error_message=sync_lease.lost_message(task))
+            db.close()
+            print(f"❌ Task {task_id}: {task.error_message}")
+            return {"status": "Failed", "error": task.error_message}
+        SYNC_LEASES_EXPIRED.labels("resumed").inc()
+        print(f"♻️ Task {task_id} lost its worker, running it again")
+
+    _observe_queue_wait(task, self.request.eta)
+    task.lease_expires_at = sync_lease.expires_at()
+    set_status(db, task, "syncing")
+    heartbeat = sync_lease.Heartbeat(task_id, task.recoveries).start()
+    progress = ProgressReporter(task)
+    started = time.monotonic()
+    # Every git command of this run stops once the task is cancelled, or taken over after this
+    # worker failed to renew its lease
+    watch_cancel(lambda: heartbeat.lost or cancellation.is_requested(task_id))
 
-    task.status = "syncing"
-    db.commit()
+    def result(**refs) -> dict:
+        """What this run did, for the repo's mirror state."""
+        return dict(duration=time.monotonic() - started, bytes=progress.bytes_transferred, **refs)
 
+    ref_updates = {}
+
+    def reschedule(e, rate_limited: int):
+        """Puts the task back in the queue for a later run (raises Celery's Retry)."""
+        countdown = e.retry_after + random.uniform(0, 10)
+        print(f"⏳ {e}, rescheduling {github_repo_url} in {countdown:.0f}s")
+        set_status(db, task, "pending", error_message=str(e))
+        # The retried run fetches GitHub again, so pushes seen so far need no extra follow-up,
+        # but it still needs the refs this attempt had taken (older than any recorded since)
+        clear_dirty(task.user_id, github_repo_url)
+        for ref, update in ref_updates.items():
+            record_ref_update(task.user_id, github_repo_url, ref, **update, older=True)
+        raise self.retry(countdown=countdown, kwargs={**self.request.kwargs, "rate_limited": rate_limited})
     try:
         # 1. Format URLs with credentials
         gh_auth_url = github_repo_url.replace("https://", f"https://oauth2:{github_pat}@")
@@ -31,76 +92,262 @@ def sync_repository(self, task_id: int, github_repo_url: str, gitee_repo_url: st
         if not gt_auth_url.endswith('.git'):
             gt_auth_url += ".git"
 
-        # 2. Ensure Gitee repository exists
-        import requests
+        # 2. Webhook syncs: only fetch/push the refs named in the push payloads
+        if scoped:
+            ref_updates = pop_ref_updates(task.user_id, github_repo_url)
+        if ref_updates:
+            mode = _sync_refs(task.user_id, github_repo_url, gh_auth_url, gt_auth_url, ref_updates, progress)
+            ref_changes = {ref: None if update["deleted"] else update["after"] for ref, update in ref_updates.items()}
+            if mode == "up_to_date":
+                set_status(db, task, "up_to_date", result=result(ref_changes=ref_changes))
+                print(f"⏭️ Pushed refs already on Gitee: {github_repo_url} -> {gitee_repo_url}")
+                return {'status': 'UpToDate', 'github': github_repo_url, 'gitee': gitee_repo_url}
+            if mode == "refs":
+                set_status(db, task, "completed", result=result(ref_changes=ref_changes))
+                print(f"✅ Sync completed (refs: {', '.join(ref_updates)}): {github_repo_url} -> {gitee_repo_url}")
+                return {'status': 'Completed', 'mode': 'refs', 'refs': list(ref_updates), 'github': github_repo_url, 'gitee': gitee_repo_url}
+            print(f"⚠️ Ref-scoped sync not possible, falling back to full mirror")
+
+        # 3. Skip the whole clone/push when Gitee already matches GitHub
+        progress.phase("check")
+        github_refs = refs_in_sync(gh_auth_url, gt_auth_url)
+        if github_refs:
+            set_status(db, task, "up_to_date", result=result(refs=github_refs))
+            print(f"⏭️ Already up to date: {github_repo_url} -> {gitee_repo_url}")
+            return {'status': 'UpToDate', 'github': github_repo_url, 'gitee': gitee_repo_url}
+
+        # 4. Ensure Gitee repository exists
         repo_name = github_repo_url.split("/")[-1].replace(".git", "")
-        
-        gitee_api_url = f"https://gitee.com/api/v5/repos/{gitee_repo_url.split('/')[-2]}/{repo_name}"
-        res = requests.get(gitee_api_url, params={"access_token": gitee_pat})
-        
-        if res.status_code == 404:
+        gitee_owner = gitee_repo_url.split('/')[-2]
+        gitee = GiteeClient(gitee_pat)
+
+        progress.phase("lookup")
+        try:
+            # Usually answered from the owner's cached repo listing without an API call
+            gitee_exists = gitee_repos.exists(gitee, gitee_owner, repo_name)
+        except ProviderError:
+            # Only a definite 404 means "create"; other errors surface on push
+            gitee_exists = True
+
+        if not gitee_exists:
             print(f"📦 Repository {repo_name} not found on Gitee, creating...")
-            create_res = requests.post(
-                "https://gitee.com/api/v5/user/repos",
-                data={
-                    "access_token": gitee_pat,
-                    "name": repo_name,
-                    "private": True,
-                    "description": f"Mirrored from {github_repo_url}"
-                }
-            )
-            if create_res.status_code != 201:
-                raise Exception(f"Failed to create Gitee repository: {create_res.text}")
-
-        # 3. Create a temporary directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            print(f"⬇️ Cloning {github_repo_url} into {temp_dir}")
-            
-            # 4. Clone mirror from GitHub
-            clone_cmd = ["git", "clone", "--mirror", gh_auth_url, "repo.git"]
-            subprocess.run(clone_cmd, cwd=temp_dir, check=True, capture_output=True, text=True)
-            
-            repo_dir = os.path.join(temp_dir, "repo.git")
+            progress.phase("create")
+            try:
+                gitee_repos.create(gitee, gitee_owner, repo_name, description=f"Mirrored from {github_repo_url}")
+            except ProviderError as e:
+                raise Exception(f"Failed to create Gitee repository: {e.detail}")
 
-            # 5. Push to Gitee: try --mirror first, fallback to --all
+        # 5. Reuse the cached mirror for this repo (clone on first sync, incremental fetch afterwards)
+        progress.phase("clone")
+        # (forks of a repo cached on this worker share its objects instead of downloading them again)
+        upstream = functools.partial(_fork_source, github_pat, github_repo_url)
+        with mirror_cache.checkout(task.user_id, github_repo_url, gh_auth_url, progress=progress.git, upstream=upstream) as repo_dir:
+            # 6. Push to Gitee: large histories first go in bounded batches (resuming from what
+            # Gitee already has), then try --mirror, fallback to --all
             push_mode = "mirror"
-            try:
-                print(f"⬆️ Pushing (--mirror) to {gitee_repo_url}")
-                push_cmd = ["git", "push", "--mirror", gt_auth_url]
-                subprocess.run(push_cmd, cwd=repo_dir, check=True, capture_output=True, text=True)
-            except subprocess.CalledProcessError as mirror_err:
-                stderr = mirror_err.stderr or ""
-                if "deny updating a hidden ref" in stderr or "remote rejected" in stderr:
-                    print(f"⚠️ Mirror push rejected, falling back to --all + --tags")
-                    push_mode = "all"
-                    # Push all branches
-                    push_all_cmd = ["git", "push", "--all", gt_auth_url]
-                    subprocess.run(push_all_cmd, cwd=repo_dir, check=True, capture_output=True, text=True)
-                    # Push all tags
-                    push_tags_cmd = ["git", "push", "--tags", gt_auth_url]
-                    subprocess.run(push_tags_cmd, cwd=repo_dir, check=True, capture_output=True, text=True)
-                else:
-                    raise  # Re-raise if it's a different error
-
-        # 6. Success
-        task.status = "completed"
-        db.commit()
+            progress.phase("push")
+            with transfer_slot(gt_auth_url):
+                if settings.GIT_PUSH_CHUNK_BYTES and push_in_chunks(repo_dir, gt_auth_url, settings.GIT_PUSH_CHUNK_BYTES, progress=progress.git):
+                    push_mode = "chunked"
+                try:
+                    print(f"⬆️ Pushing (--mirror) to {gitee_repo_url}")
+                    push_cmd = ["git", "push", "--mirror", gt_auth_url]
+                    run_git(push_cmd, cwd=repo_dir, auth_url=gt_auth_url, progress=progress.git)
+                except subprocess.CalledProcessError as mirror_err:
+                    stderr = mirror_err.stderr or ""
+                    if "deny updating a hidden ref" in stderr or "remote rejected" in stderr:
+                        print(f"⚠️ Mirror push rejected, falling back to --all + --tags")
+                        push_mode = "all"
+                        progress.phase("fallback")
+                        # Push all branches
+                        push_all_cmd = ["git", "push", "--all", gt_auth_url]
+                        run_git(push_all_cmd, cwd=repo_dir, auth_url=gt_auth_url, progress=progress.git)
+                        # Push all tags
+                        push_tags_cmd = ["git", "push", "--tags", gt_auth_url]
+                        run_git(push_tags_cmd, cwd=repo_dir, auth_url=gt_auth_url, progress=progress.git)
+                    else:
+                        raise  # Re-raise if it's a different error
+            mirrored_refs = local_refs(repo_dir)
+
+        # 7. Success
+        set_status(db, task, "completed", result=result(refs=mirrored_refs))
         print(f"✅ Sync completed ({push_mode}): {github_repo_url} -> {gitee_repo_url}")
         return {'status': 'Completed', 'mode': push_mode, 'github': github_repo_url, 'gitee': gitee_repo_url}
     
+    except SlotBusy as e:
+        # Other syncs hold the git transfer slots: wait for a turn, however long the queue is
+        reschedule(e, rate_limited)
+    except RateLimited as e:
+        # Provider throttling is transient: put the task back in the queue instead of failing it
+        if rate_limited < settings.SYNC_RATE_LIMIT_MAX_RETRIES:
+            reschedule(e, rate_limited + 1)
+        error_msg = f"Gave up after {rate_limited} rate-limited attempts: {e}"
+        print(f"❌ {error_msg}")
+        set_status(db, task, "failed", error_message=error_msg, result=result())
+        return {'status': 'Failed', 'error': error_msg}
+    except GitCancelled:
+        if heartbeat.lost:
+            print(f"💔 Lease on task {task_id} lost, leaving it to the run that recovered it")
+            return {'status': 'Abandoned'}
+        print(f"🚫 Sync cancelled: {github_repo_url} -> {gitee_repo_url}")
+        set_status(db, task, "cancelled", error_message=cancellation.CANCELLED_MESSAGE, result=result())
+        return {'status': 'Cancelled'}
     except subprocess.CalledProcessError as e:
+        if "not found" in (e.stderr or "").lower():
+            # Possibly a Gitee repo deleted since it was cached as existing; look it up again next time
+            gitee_repos.forget(gitee_repo_url.split('/')[-2], github_repo_url.split("/")[-1].replace(".git", ""))
         error_msg = f"Git command failed: {e.stderr}"
         print(f"❌ {error_msg}")
-        task.status = "failed"
-        task.error_message = error_msg
-        db.commit()
+        set_status(db, task, "failed", error_message=error_msg, result=result())
         return {'status': 'Failed', 'error': error_msg}
     except Exception as e:
         error_msg = str(e)
         print(f"❌ Task failed: {error_msg}")
-        task.status = "failed"
-        task.error_message = error_msg
-        db.commit()
+        set_status(db, task, "failed", error_message=error_msg, result=result())
         return {'status': 'Failed', 'error': error_msg}
     finally:
+        heartbeat.stop()
+        watch_cancel(None)
+        cancellation.clear(task_id)
+        progress.finish()
+        SYNC_SECONDS.labels(task.status).observe(time.monotonic() - started)
+        if task.status not in ("pending", "syncing", "cancelled"):
+            _enqueue_follow_up_if_dirty(db, task, github_pat, gitee_pat)
         db.close()
+
+@celery_app.task
+def provision_gitee_repos(gitee_pat: str, owner: str, repos: dict):
+    """
+    First step of a bulk sync: creates the missing Gitee repos of `repos` ({name: description})
+    before the syncs start. Never fails, so the syncs chained after it always run.
+    """
+    try:
+        result = gitee_repos.provision(gitee_pat, owner, repos)
+    except Exception as e:
+        print(f"❌ Provisioning Gitee repositories for {owner} failed: {e}")
+        return {"error": str(e)}
+    print(f"📦 Gitee repositories for {owner}: {result['existing']} existing, {result['created']} created, {result['failed']} failed")
+    return result
+
+def _fork_source(github_pat: str, github_repo_url: str):
+    """Clone URL of the repository `github_repo_url` was (ultimately) forked from, if any."""
+    owner, name = github_repo_url.rstrip("/").split("/")[-2:]
+    if name.endswith(".git"):
+        name = name[:-4]
+    try:
+        repo = GitHubClient(github_pat).get_repo(owner, name)
+    except (ProviderError, RateLimited, requests.RequestException):
+        return None  # only an optimization; the clone works without it
+    if not repo or not repo.get("fork"):
+        return None
+    return (repo.get("source") or repo.get("parent") or {}).get("clone_url")
+
+def _observe_queue_wait(task: RepositorySyncTask, eta: str = None):
+    """Records how long the task waited for a worker, counted from its countdown's end if it had one."""
+    queued_at = datetime.fromisoformat(eta) if eta else task.created_at
+    if queued_at is None:
+        return
+    if queued_at.tzinfo is None:
+        queued_at = queued_at.replace(tzinfo=timezone.utc)
+    SYNC_QUEUE_WAIT_SECONDS.observe(max((datetime.now(timezone.utc) - queued_at).total_seconds(), 0))
+
+def _enqueue_follow_up_if_dirty(db: Session, task: RepositorySyncTask, github_pat: str, gitee_pat: str):
+    """Queues one more sync when a webhook push arrived while this one was running."""
+    try:
+        if not claim_dirty(task.user_id, task.github_repo_url):
+            return
+        follow_up = RepositorySyncTask(
+            user_id=task.user_id,
+            github_repo_url=task.github_repo_url,
+            gitee_repo_url=task.gitee_repo_url,
+            status="pending"
+        )
+        db.add(follow_up)
+        db.flush()
+        record_created(db, [follow_up])
+        db.commit()
+        db.refresh(follow_up)
+        sync_repository.apply_async(kwargs=dict(
+            task_id=follow_up.id,
+            github_repo_url=follow_up.github_repo_url,
+            gitee_repo_url=follow_up.gitee_repo_url,
+            github_pat=github_pat,
+            gitee_pat=gitee_pat,
+            scoped=True
+        ), countdown=settings.WEBHOOK_DEBOUNCE_SECONDS, queue=QUEUE_WEBHOOK, task_id=cancellation.celery_task_id(follow_up.id))
+        print(f"🔂 Push arrived during sync, queued follow-up task {follow_up.id} for {task.github_repo_url}")
+    except Exception as e:
+        print(f"❌ Failed to queue follow-up sync for {task.github_repo_url}: {e}")
+
+
+def _sync_refs(user_id: int, github_repo_url: str, gh_auth_url: str, gt_auth_url: str, ref_updates: dict, progress: ProgressReporter):
+    """
+    Fetches and pushes only the refs in `ref_updates` ({ref: {before, after, deleted, forced}}).
+    Returns "refs" or "up_to_date", or None when a full mirror is needed instead: a force-push,
+    a Gitee ref that is not at the expected `before`, a missing Gitee repo or a rejected push.
+    """
+    if any(update["forced"] for update in ref_updates.values()):
+        print(f"⚠️ Force-push in payload for {github_repo_url}")
+        return None
+
+    progress.phase("check")
+    try:
+        gitee_refs = ls_remote(gt_auth_url, refs=list(ref_updates))
+    except subprocess.CalledProcessError:
+        return None
+
+    updates, deletes = [], []
+    for ref, update in ref_updates.items():
+        current = gitee_refs.get(ref)
+        if update["deleted"]:
+            if current:
+                deletes.append(ref)
+            continue
+        if current == update["after"]:
+            continue
+        expected = None if update["before"] == ZERO_SHA else update["before"]
+        if current != expected:
+            print(f"⚠️ Gitee {ref} is at {current}, expected {expected}")
+            return None
+        updates.append(ref)
+
+    if not updates and not deletes:
+        return "up_to_date"
+
+    if not updates:
+        return _push_deletes(gt_auth_url, deletes, progress)
+
+    try:
+        refspecs = [f"+{ref}:{ref}" for ref in updates]
+        progress.phase("clone")
+        with mirror_cache.checkout(user_id, github_repo_url, gh_auth_url, refspecs=refspecs, progress=progress.git) as repo_dir:
+            progress.phase("push")
+            for ref in deletes:
+                run_git(["git", "update-ref", "-d", ref], cwd=repo_dir)
+            push_cmd = ["git", "push", gt_auth_url] + [f"{ref}:{ref}" for ref in updates] + [f":{ref}" for ref in deletes]
+            print(f"⬆️ Pushing {len(updates)} updated / {len(deletes)} deleted ref(s) to Gitee")
+            with transfer_slot(gt_auth_url):
+                run_git(push_cmd, cwd=repo_dir, auth_url=gt_auth_url, progress=progress.git)
+    except subprocess.CalledProcessError as e:
+        print(f"⚠️ Ref-scoped transfer failed: {e.stderr}")
+        return None
+    return "refs"
+
+
+def _push_deletes(gt_auth_url: str, deletes: list, progress: ProgressReporter):
+    """
+    Deletes refs on Gitee from an empty scratch repository: `git push <url> :ref` needs no
+    objects, so the cached mirror is neither fetched nor locked. (Its copy of the refs goes
+    with the next full fetch's --prune.)
+    """
+    progress.phase("push")
+    print(f"⬆️ Deleting {len(deletes)} ref(s) on Gitee")
+    try:
+        with tempfile.TemporaryDirectory(prefix="syncpulse-delete-") as scratch:
+            run_git(["git", "init", "-q", "--bare", scratch])
+            with transfer_slot(gt_auth_url):
+                run_git(["git", "push", gt_auth_url] + [f":{ref}" for ref in deletes], cwd=scratch, auth_url=gt_auth_url, progress=progress.git)
+    except subprocess.CalledProcessError as e:
+        print(f"⚠️ Ref-scoped transfer failed: {e.stderr}")
+        return None
+    return "refs"
@@ -0,0 +1,105 @@
+"""
+Batch planner for webhook pushes ingested into the Redis stream (WEBHOOK_INGEST_MODE=stream).
+
+    cd backend
+    python -m app.worker.webhook_consumer
+
+Run as many as needed: they share the work through a consumer group. A batch is acknowledged
+only after its tasks are committed and published; entries of a consumer that died mid-batch
+are claimed by another one once they have been idle for CLAIM_IDLE_MS. A batch that fails is
+retried entry by entry, and entries that still fail are parked on DEAD_LETTER_KEY.
+"""
+import os
+import socket
+import time
+
+import redis
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.redis import redis_client
+from app.services.bulk_sync import plan_pushes
+from app.services.webhook_events import CONSUMER_GROUP, STREAM_KEY, decode
+
+BLOCK_MS = 1000
+CLAIM_IDLE_MS = 60 * 1000
+DEAD_LETTER_KEY = f"{STREAM_KEY}:dead"
+
+
+def ensure_group():
+    try:
+        redis_client.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _next_batch(consumer: str, batch_size: int) -> list:
+    # Abandoned entries first, so a crashed consumer's pushes are not starved by new ones
+    _, claimed, *_ = redis_client.xautoclaim(STREAM_KEY, CONSUMER_GROUP, consumer, CLAIM_IDLE_MS, "0-0", count=batch_size)
+    if claimed:
+        return claimed
+    response = redis_client.xreadgroup(CONSUMER_GROUP, consumer, {STREAM_KEY: ">"}, count=batch_size, block=BLOCK_MS)
+    return response[0][1] if response else []
+
+
+def process_batch(entries: list) -> dict:
+    events = []
+    for _, fields in entries:
+        # Entries trimmed while pending come back without fields
+        if fields:
+            events.append(decode(fields))
+
+    db = SessionLocal()
+    try:
+        outcome = plan_pushes(db, events) if events else {}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    redis_client.xack(STREAM_KEY, CONSUMER_GROUP, *[entry_id for entry_id, _ in entries])
+    return outcome
+
+
+def _process_individually(entries: list):
+    for entry_id, fields in entries:
+        try:
+            process_batch([(entry_id, fields)])
+        except redis.RedisError:
+            raise
+        except Exception as e:
+            print(f"❌ Parking webhook entry {entry_id} on {DEAD_LETTER_KEY}: {e}")
+            redis_client.xadd(DEAD_LETTER_KEY, {**(fields or {}), "error": str(e)[:1000]}, maxlen=settings.WEBHOOK_STREAM_MAXLEN, approximate=True)
+            redis_client.xack(STREAM_KEY, CONSUMER_GROUP, entry_id)
+
+
+def run(consumer: str = None, batch_size: int = None):
+    consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+    batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+    ensure_group()
+    print(f"📥 Webhook consumer {consumer} reading {STREAM_KEY} (batches of {batch_size})")
+
+    while True:
+        try:
+            entries = _next_batch(consumer, batch_size)
+            if not entries:
+                continue
+            started = time.monotonic()
+            try:
+                outcome = process_batch(entries)
+            except redis.RedisError:
+                raise
+            except Exception as e:
+                print(f"❌ Failed to plan webhook batch of {len(entries)}, retrying one by one: {e}")
+                _process_individually(entries)
+                continue
+            print(f"📥 Planned {len(entries)} push(es) in {time.monotonic() - started:.2f}s: {outcome}")
+        except redis.RedisError as e:
+            # Unacknowledged entries are picked up again by the next claim
+            print(f"❌ Webhook stream unavailable: {e}")
+            time.sleep(5)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,182 @@
+"""
+Concurrency benchmark: API throughput while GitHub is slow.
+
+Serves `GET /api/v1/sync/github/repos/{user_id}?refresh=true` against a local fake GitHub
+that answers every request after `--delay` seconds, and compares
+
+- async:    the real app (AsyncSession + async Redis + httpx)
+- threaded: the same work as a plain `def` handler with the blocking client and session,
+            i.e. how the endpoint ran before, inside Starlette's thread pool
+
+Uses a throwaway SQLite database. Redis comes from CELERY_BROKER_URL, or from fakeredis with
+`--fakeredis` (pip install fakeredis).
+
+    cd backend
+    python benchmarks/async_api.py --fakeredis --delay 0.5 --concurrency 100 --requests 600
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SlowGitHub(BaseHTTPRequestHandler):
+    delay = 0.5
+    repos = 50
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = json.dumps([
+            {
+                "name": f"repo-{i}",
+                "full_name": f"bench/repo-{i}",
+                "html_url": f"https://github.com/bench/repo-{i}",
+                "description": None,
+                "private": False,
+                "clone_url": f"https://github.com/bench/repo-{i}.git",
+            }
+            for i in range(self.repos)
+        ]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", backlog=2048))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def _load(url: str, concurrency: int, total: int) -> dict:
+    import httpx
+
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async with httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                res = await client.get(url)
+                latencies.append(time.perf_counter() - start)
+                if res.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=0.5, help="upstream latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--repos", type=int, default=50, help="repositories per upstream response")
+    parser.add_argument("--fakeredis", action="store_true", help="use an in-process fakeredis instead of CELERY_BROKER_URL")
+    args = parser.parse_args()
+
+    SlowGitHub.delay = args.delay
+    SlowGitHub.repos = args.repos
+    upstream = Server(("127.0.0.1", 0), SlowGitHub)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+
+    # Settings are read at import time
+    workdir = tempfile.mkdtemp(prefix="syncpulse-bench-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "GITHUB_API_URL": f"http://127.0.0.1:{upstream.server_port}",
+        "PROVIDER_POOL_SIZE": str(args.concurrency),
+        "PROVIDER_HOST_RATE": "100000",
+        "PROVIDER_HOST_BURST": "100000",
+        "PROVIDER_TOKEN_RATE": "100000",
+        "PROVIDER_TOKEN_BURST": "100000",
+    })
+
+    if args.fakeredis:
+        import fakeredis
+        import app.core.redis as core_redis
+
+        server = fakeredis.FakeServer()
+        core_redis.redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        core_redis.async_redis_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+    from fastapi import Depends, FastAPI, HTTPException
+    from sqlalchemy.orm import Session
+
+    from app.core.database import Base, engine, get_db
+    from app.main import app as async_app
+    from app.models.user import RepositorySyncTask, User
+    from app.services.providers import GitHubClient
+
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        db.add(User(id=1, github_username="bench", github_access_token="bench-token"))
+        db.commit()
+
+    threaded_app = FastAPI()
+
+    @threaded_app.get("/api/v1/sync/github/repos/{user_id}")
+    def list_github_repos(user_id: int, refresh: bool = False, db: Session = Depends(get_db)):
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user or not user.github_access_token:
+            raise HTTPException(status_code=400, detail="GitHub account not linked")
+        repos = GitHubClient(user.github_access_token).list_user_repos()
+        db.query(RepositorySyncTask).filter(RepositorySyncTask.user_id == user_id).all()
+        return repos
+
+    print(f"upstream delay {args.delay}s, {args.concurrency} concurrent clients, {args.requests} requests\n")
+    print(f"{'mode':<10}{'req/s':>10}{'p50 (s)':>10}{'p95 (s)':>10}{'errors':>8}")
+    for mode, app in (("threaded", threaded_app), ("async", async_app)):
+        port = _free_port()
+        server = _serve(app, port)
+        url = f"http://127.0.0.1:{port}/api/v1/sync/github/repos/1?refresh=true"
+        result = asyncio.run(_load(url, args.concurrency, args.requests))
+        server.should_exit = True
+        print(f"{mode:<10}{result['rps']:>10.1f}{result['p50']:>10.2f}{result['p95']:>10.2f}{result['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
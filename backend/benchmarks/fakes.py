@@ -0,0 +1,156 @@
+"""
+Local stand-ins for GitHub and Gitee used by the offline benchmarks.
+
+- `ProviderServer`: one HTTP server answering the REST calls SyncPulse makes: GitHub's
+  paginated `/user/repos`, `/user` and `/repos/{owner}/{name}`, Gitee's paginated `/api/v5/user/repos`,
+  `/api/v5/repos/{owner}/{name}` and `POST /api/v5/user/repos` (which creates the bare
+  repository to push to).
+- `make_repo` / `add_commits`: bare git repositories with incompressible content of a chosen
+  size, built with `git fast-import`, which the workers clone over file://.
+"""
+import json
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_repo(path: str, commits: int, file_kb: int):
+    """A bare repository with `commits` commits on main, each adding a `file_kb` KiB file."""
+    subprocess.run(["git", "init", "-q", "--bare", "-b", "main", path], check=True)
+    add_commits(path, commits, file_kb)
+
+
+def add_commits(path: str, commits: int, file_kb: int):
+    """Appends commits to main (and tags every 50th) in one fast-import run."""
+    head = subprocess.run(
+        ["git", "rev-parse", "--verify", "-q", "refs/heads/main"], cwd=path, capture_output=True, text=True
+    ).stdout.strip()
+    proc = subprocess.Popen(["git", "fast-import", "--quiet"], cwd=path, stdin=subprocess.PIPE)
+    now = int(time.time())
+    for i in range(commits):
+        message = f"commit {i}".encode()
+        blob = os.urandom(file_kb * 1024)
+        proc.stdin.write(b"commit refs/heads/main\n")
+        proc.stdin.write(f"committer Bench <bench@example.com> {now + i} +0000\n".encode())
+        proc.stdin.write(b"data %d\n%s\n" % (len(message), message))
+        if i == 0 and head:
+            proc.stdin.write(f"from {head}\n".encode())
+        proc.stdin.write(b"M 644 inline files/%d-%d.bin\ndata %d\n" % (now, i, len(blob)))
+        proc.stdin.write(blob + b"\n")
+        if (i + 1) % 50 == 0:
+            proc.stdin.write(f"reset refs/tags/v{now}-{i}\nfrom refs/heads/main\n\n".encode())
+    proc.stdin.close()
+    if proc.wait():
+        raise RuntimeError(f"git fast-import failed for {path}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "ProviderServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+
+        if url.path == "/user/repos":
+            page = int(query.get("page", ["1"])[0])
+            per_page = int(query.get("per_page", ["30"])[0])
+            repos = self.server.github_repos
+            last = max(1, -(-len(repos) // per_page))
+            link = f'<http://{self.headers["Host"]}/user/repos?page={last}&per_page={per_page}>; rel="last"'
+            return self._reply(200, repos[(page - 1) * per_page:page * per_page], {"Link": link})
+        if url.path == "/api/v5/user/repos":
+            page = int(query.get("page", ["1"])[0])
+            per_page = int(query.get("per_page", ["20"])[0])
+            owner_dir = os.path.join(self.server.gitee_root, self.server.owner)
+            names = sorted(n[:-4] for n in os.listdir(owner_dir) if n.endswith(".git")) if os.path.isdir(owner_dir) else []
+            repos = [{"full_name": f"{self.server.owner}/{name}", "path": name} for name in names]
+            last = max(1, -(-len(repos) // per_page))
+            return self._reply(200, repos[(page - 1) * per_page:page * per_page], {"total_page": str(last)})
+        if parts[0] == "repos" and len(parts) == 3:
+            for repo in self.server.github_repos:
+                # Workers derive owner/name from file:// clone URLs; the name is what identifies a repo here
+                if repo["name"] == parts[2]:
+                    return self._reply(200, repo)
+            return self._reply(404, {"message": "Not Found"})
+        if url.path in ("/user", "/api/v5/user"):
+            return self._reply(200, {"id": 1, "login": self.server.owner})
+        if parts[:2] == ["api", "v5"] and parts[2:3] == ["repos"] and len(parts) == 5:
+            owner, name = parts[3], parts[4]
+            if os.path.isdir(self.server.gitee_path(owner, name)):
+                return self._reply(200, {"full_name": f"{owner}/{name}"})
+            return self._reply(404, {"message": "Not Found"})
+        self._reply(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        time.sleep(self.server.delay)
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode())
+        if urlparse(self.path).path == "/api/v5/user/repos":
+            name = form["name"][0]
+            path = self.server.gitee_path(self.server.owner, name)
+            subprocess.run(["git", "init", "-q", "--bare", path], check=True)
+            return self._reply(201, {"full_name": f"{self.server.owner}/{name}"})
+        self._reply(404, {"message": "Not Found"})
+
+
+class ProviderServer(ThreadingHTTPServer):
+    """
+    Serves `github_repos` (GitHub listing entries) and a Gitee whose repositories are bare
+    repos under `gitee_root`/{owner}/{name}.git. `delay` adds latency to every response.
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, gitee_root: str, owner: str, delay: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.gitee_root = gitee_root
+        self.owner = owner
+        self.delay = delay
+        self.github_repos = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def gitee_path(self, owner: str, name: str) -> str:
+        return os.path.join(self.gitee_root, owner, f"{name}.git")
+
+    def add_github_repo(self, name: str, path: str, pushed_at: float = None, fork_of: str = None):
+        """Lists a repo; `fork_of` names an already added repo it is a fork of."""
+        pushed = datetime.fromtimestamp(pushed_at or time.time(), timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        source = next((r for r in self.github_repos if r["name"] == fork_of), None)
+        self.github_repos.append({
+            "name": name,
+            "full_name": f"bench/{name}",
+            "html_url": f"https://github.com/bench/{name}",
+            "description": None,
+            "private": False,
+            "clone_url": f"file://{path}",
+            "pushed_at": pushed,
+            "updated_at": pushed,
+            "fork": source is not None,
+            **({"parent": source, "source": source} if source else {}),
+        })
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
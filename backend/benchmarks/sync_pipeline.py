@@ -0,0 +1,404 @@
+"""
+Offline end-to-end benchmark of the sync pipeline.
+
+Everything runs locally: a fake GitHub/Gitee REST server (`fakes.ProviderServer`), bare git
+repositories served over file://, a throwaway SQLite database (or DATABASE_URL), fakeredis
+(or CELERY_BROKER_URL's Redis with `--redis`) and an in-process Celery worker on the
+in-memory broker. The real code is driven end to end: `POST /sync/trigger/all`, Celery
+dispatch, `sync_repository`, `GET /sync/dashboard/{id}` and `GET /logs/{id}`.
+
+Reports
+- throughput: repos/minute for a bulk sync of fresh repos, then for a forced no-op re-sync,
+  and the time to plan an unforced re-sync, which skips every repo (no push since its sync)
+- cost per sync: duration and bytes for the first, an incremental and a no-op sync per repo size
+- forks: fetched/pushed bytes for the first sync of an upstream and of its forks, which share
+  its objects in the worker's mirror cache, and the cache's disk usage afterwards
+- API latency: p50/p99 of the dashboard and logs endpoints at each task-table size
+
+Needs fakeredis unless `--redis` is given (pip install fakeredis).
+
+    cd backend
+    python benchmarks/sync_pipeline.py
+    python benchmarks/sync_pipeline.py --repos 200 --workers 8 --rows 10000,100000 --samples 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import ProviderServer, add_commits, make_repo
+
+# name: (commits, KiB added per commit)
+SIZES = {
+    "small": (10, 4),
+    "medium": (100, 32),
+    "large": (200, 256),
+}
+OWNER = "bench"
+TERMINAL = ("completed", "up_to_date", "failed", "cancelled")
+SUCCESS = ("completed", "up_to_date")
+
+
+def _percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def _configure(workdir: str, provider: ProviderServer, args):
+    # Settings are read at import time, so this runs before any app import
+    os.environ.update({
+        "DATABASE_URL": os.environ.get("DATABASE_URL") or f"sqlite:///{workdir}/bench.db?timeout=30",
+        "GITHUB_API_URL": provider.url,
+        "GITEE_URL": provider.url,
+        "GITEE_GIT_URL": f"file://{workdir}/gitee",
+        "MIRROR_CACHE_DIR": f"{workdir}/mirrors",
+        "PROVIDER_HOST_RATE": "100000",
+        "PROVIDER_HOST_BURST": "100000",
+        "PROVIDER_TOKEN_RATE": "100000",
+        "PROVIDER_TOKEN_BURST": "100000",
+        "GIT_TOKEN_CONCURRENCY": str(args.workers),
+        "GITHUB_GIT_CONCURRENCY": str(args.workers),
+        "GITEE_GIT_CONCURRENCY": str(args.workers),
+    })
+    if not args.redis:
+        import fakeredis
+        import app.core.redis as core_redis
+
+        server = fakeredis.FakeServer()
+        core_redis.redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        core_redis.async_redis_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+    from app.worker.celery_app import celery_app
+
+    celery_app.conf.update(
+        broker_url="memory://",
+        result_backend="cache+memory://",
+        # The memory transport polls; its default 1s interval would dominate short syncs
+        broker_transport_options={**celery_app.conf.broker_transport_options, "polling_interval": 0.01},
+        # and only polls again once the prefetched message is acked, so one-at-a-time prefetch
+        # measures the transport rather than the pipeline; Redis brokers keep the default of 1
+        worker_prefetch_multiplier=4,
+        worker_hijack_root_logger=False,
+    )
+
+
+def _setup_db():
+    from app.core.database import Base, SessionLocal, engine
+    from app.models.user import User
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        for user_id in (1, 2, 3):
+            db.add(User(
+                id=user_id,
+                github_username=OWNER, github_access_token="gh-token",
+                gitee_username=OWNER, gitee_access_token="gitee-token",
+            ))
+        db.commit()
+
+
+def _wait_for(user_id: int, expected: int, timeout: float) -> float:
+    """Seconds until `expected` tasks of the user have finished."""
+    from sqlalchemy import func, select
+
+    from app.core.database import SessionLocal
+    from app.models.user import RepositorySyncTask
+
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        with SessionLocal() as db:
+            done = db.execute(select(func.count()).where(
+                RepositorySyncTask.user_id == user_id,
+                RepositorySyncTask.status.in_(TERMINAL)
+            )).scalar()
+        if done >= expected:
+            return time.perf_counter() - start
+        time.sleep(0.1)
+    raise TimeoutError(f"only {done}/{expected} syncs finished within {timeout}s")
+
+
+async def _throughput(client, provider: ProviderServer, workdir: str, args) -> list:
+    for i in range(args.repos):
+        path = f"{workdir}/github/throughput-{i}.git"
+        make_repo(path, *SIZES[args.repo_size])
+        # Pushed well before the first sync, beyond the clock-skew allowance of change detection
+        provider.add_github_repo(f"throughput-{i}", path, pushed_at=time.time() - 3600)
+
+    rows = []
+    for label, force, expected in (("fresh", False, 1), ("no-op", True, 2), ("unchanged", False, 2)):
+        start = time.perf_counter()
+        res = await client.post("/api/v1/sync/trigger/all", json={"user_id": 1, "force": force})
+        res.raise_for_status()
+        if label == "unchanged" and res.json()["task_count"]:
+            raise RuntimeError(f"unforced re-sync queued {res.json()['task_count']} unchanged repos")
+        await asyncio.to_thread(_wait_for, 1, args.repos * expected, args.timeout)
+        elapsed = time.perf_counter() - start
+        rows.append((label, args.repos, elapsed, args.repos / elapsed * 60))
+    return rows
+
+
+async def _check_log_paging(client, user_id: int, limit: int = 7):
+    """Walks the user's whole history by cursor: every task exactly once, and the walk ends."""
+    from sqlalchemy import func, select
+
+    from app.core.database import SessionLocal
+    from app.models.user import RepositorySyncTask
+
+    with SessionLocal() as db:
+        total = db.execute(select(func.count()).where(RepositorySyncTask.user_id == user_id)).scalar()
+    seen, cursor = [], None
+    while len(seen) <= total:
+        res = await client.get(f"/api/v1/logs/{user_id}", params={"limit": limit, **({"cursor": cursor} if cursor else {})})
+        res.raise_for_status()
+        seen += [task["id"] for task in res.json()]
+        cursor = res.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    if len(seen) != total or len(set(seen)) != total:
+        raise RuntimeError(f"paging the logs returned {len(seen)} rows ({len(set(seen))} distinct) of {total}")
+    return total
+
+
+def _sync_cost(provider: ProviderServer, workdir: str, args) -> list:
+    from app.core.database import SessionLocal
+    from app.models.mirror import RepoMirror
+    from app.models.user import RepositorySyncTask, User
+    from app.services.bulk_sync import gitee_repo_url
+    from app.worker.tasks import sync_repository
+
+    rows = []
+    with SessionLocal() as db:
+        user = db.get(User, 2)
+        for size in args.sizes:
+            commits, file_kb = SIZES[size]
+            results = {"first": [], "incremental": [], "no-op": []}
+            for n in range(args.cost_repos):
+                name = f"cost-{size}-{n}"
+                path = f"{workdir}/github/{name}.git"
+                make_repo(path, commits, file_kb)
+                for kind in results:
+                    if kind == "incremental":
+                        add_commits(path, 1, file_kb)
+                    task = RepositorySyncTask(
+                        user_id=user.id, github_repo_url=f"file://{path}",
+                        gitee_repo_url=gitee_repo_url(user, name), status="pending"
+                    )
+                    db.add(task)
+                    db.commit()
+                    start = time.perf_counter()
+                    sync_repository.apply(kwargs=dict(
+                        task_id=task.id,
+                        github_repo_url=task.github_repo_url,
+                        gitee_repo_url=task.gitee_repo_url,
+                        github_pat=user.github_access_token,
+                        gitee_pat=user.gitee_access_token,
+                    ))
+                    elapsed = time.perf_counter() - start
+                    db.expire_all()
+                    mirror = db.query(RepoMirror).filter(
+                        RepoMirror.user_id == user.id, RepoMirror.github_repo_url == task.github_repo_url
+                    ).one()
+                    if mirror.last_status in SUCCESS:
+                        results[kind].append((elapsed, mirror.bytes_transferred or 0))
+            repo_mib = commits * file_kb / 1024
+            for kind, samples in results.items():
+                if samples:
+                    rows.append((
+                        size, f"{repo_mib:.2f}", kind,
+                        statistics.median(s for s, _ in samples),
+                        statistics.median(b for _, b in samples) / 1024,
+                    ))
+    return rows
+
+
+def _transferred(direction: str) -> float:
+    from prometheus_client import REGISTRY
+
+    return REGISTRY.get_sample_value("syncpulse_git_transfer_bytes_total", {"direction": direction}) or 0
+
+
+def _forks(provider: ProviderServer, workdir: str, args) -> tuple:
+    """First syncs of a medium upstream and `args.forks` forks of it (one new commit each)."""
+    import subprocess
+
+    from app.core.config import settings
+    from app.core.database import SessionLocal
+    from app.models.user import RepositorySyncTask, User
+    from app.services.bulk_sync import gitee_repo_url
+    from app.worker.mirror_cache import _dir_size
+    from app.worker.tasks import sync_repository
+
+    upstream = f"{workdir}/github/forks-upstream.git"
+    make_repo(upstream, *SIZES["medium"])
+    provider.add_github_repo("forks-upstream", upstream)
+    names = ["forks-upstream"]
+    for n in range(args.forks):
+        path = f"{workdir}/github/fork-{n}.git"
+        subprocess.run(["git", "clone", "-q", "--bare", upstream, path], check=True)
+        add_commits(path, 1, SIZES["medium"][1])
+        provider.add_github_repo(f"fork-{n}", path, fork_of="forks-upstream")
+        names.append(f"fork-{n}")
+
+    rows = []
+    with SessionLocal() as db:
+        user = db.get(User, 2)
+        for name in names:
+            task = RepositorySyncTask(
+                user_id=user.id, github_repo_url=f"file://{workdir}/github/{name}.git",
+                gitee_repo_url=gitee_repo_url(user, name), status="pending"
+            )
+            db.add(task)
+            db.commit()
+            fetched, pushed = _transferred("fetch"), _transferred("push")
+            start = time.perf_counter()
+            sync_repository.apply(kwargs=dict(
+                task_id=task.id,
+                github_repo_url=task.github_repo_url,
+                gitee_repo_url=task.gitee_repo_url,
+                github_pat=user.github_access_token,
+                gitee_pat=user.gitee_access_token,
+            ))
+            rows.append((
+                name, time.perf_counter() - start,
+                (_transferred("fetch") - fetched) / 1024, (_transferred("push") - pushed) / 1024,
+            ))
+    cache = settings.MIRROR_CACHE_DIR
+    disk = (_dir_size(f"{cache}/mirrors") / 1024 ** 2, _dir_size(f"{cache}/pools") / 1024 ** 2)
+    return rows, disk
+
+
+def _seed(user_id: int, total: int, repos: int = 500):
+    """Tops the user's task history up to `total` rows spread over the last 120 days."""
+    from sqlalchemy import func, insert, select
+
+    from app.core.database import SessionLocal
+    from app.models.user import RepositorySyncTask
+    from app.services.task_stats import rebuild
+
+    statuses = ["completed"] * 6 + ["up_to_date"] * 3 + ["failed"]
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with SessionLocal() as db:
+        existing = db.execute(select(func.count()).where(RepositorySyncTask.user_id == user_id)).scalar()
+        for start in range(existing, total, 10000):
+            db.execute(insert(RepositorySyncTask), [
+                {
+                    "user_id": user_id,
+                    "github_repo_url": f"https://github.com/{OWNER}/seed-{i % repos}.git",
+                    "gitee_repo_url": f"https://gitee.com/{OWNER}/seed-{i % repos}.git",
+                    "status": random.choice(statuses),
+                    "created_at": now - timedelta(seconds=random.randrange(120 * 86400)),
+                }
+                for i in range(start, min(start + 10000, total))
+            ])
+            db.commit()
+        rebuild(db, user_id)
+
+
+async def _latency(client, user_id: int, samples: int) -> list:
+    from app.core.redis import async_redis_client
+
+    async def dashboard_uncached():
+        await async_redis_client.delete(f"dashboard:{user_id}")
+        return await client.get(f"/api/v1/sync/dashboard/{user_id}")
+
+    cursor = None
+
+    async def logs_walk():
+        # Successive pages, restarting from the top at the end of the history
+        nonlocal cursor
+        params = {"limit": 50, **({"cursor": cursor} if cursor else {})}
+        res = await client.get(f"/api/v1/logs/{user_id}", params=params)
+        cursor = res.headers.get("x-next-cursor")
+        return res
+
+    endpoints = {
+        "dashboard (uncached)": dashboard_uncached,
+        "dashboard (cached)": lambda: client.get(f"/api/v1/sync/dashboard/{user_id}"),
+        "logs first page": lambda: client.get(f"/api/v1/logs/{user_id}", params={"limit": 50}),
+        "logs status=failed": lambda: client.get(f"/api/v1/logs/{user_id}", params={"limit": 50, "status": "failed"}),
+        "logs cursor walk": logs_walk,
+    }
+    rows = []
+    for name, call in endpoints.items():
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            res = await call()
+            timings.append(time.perf_counter() - start)
+            res.raise_for_status()
+        rows.append((name, _percentile(timings, 0.5) * 1000, _percentile(timings, 0.99) * 1000))
+    return rows
+
+
+async def _run(provider: ProviderServer, workdir: str, args):
+    import httpx
+    from celery.contrib.testing.worker import start_worker
+
+    from app.main import app
+    from app.worker.celery_app import celery_app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"== throughput: {args.repos} {args.repo_size} repos, {args.workers} worker threads")
+        with start_worker(celery_app, pool="threads", concurrency=args.workers, perform_ping_check=False, shutdown_timeout=30):
+            rows = await _throughput(client, provider, workdir, args)
+        print(f"{'run':<10}{'repos':>8}{'seconds':>10}{'repos/min':>12}")
+        for label, repos, elapsed, rate in rows:
+            print(f"{label:<10}{repos:>8}{elapsed:>10.2f}{rate:>12.0f}")
+        print(f"logs paging: {await _check_log_paging(client, 1)} tasks, each on exactly one page")
+
+        print(f"\n== cost per sync ({args.cost_repos} repos per size, medians)")
+        rows = await asyncio.to_thread(_sync_cost, provider, workdir, args)
+        print(f"{'size':<8}{'MiB':>8}{'sync':>13}{'seconds':>10}{'KiB moved':>12}")
+        for size, mib, kind, elapsed, kib in rows:
+            print(f"{size:<8}{mib:>8}{kind:>13}{elapsed:>10.2f}{kib:>12.0f}")
+
+        if args.forks:
+            print(f"\n== forks: a {SIZES['medium'][0] * SIZES['medium'][1] / 1024:.1f} MiB upstream and {args.forks} forks")
+            rows, (mirrors_mib, pools_mib) = await asyncio.to_thread(_forks, provider, workdir, args)
+            print(f"{'repo':<16}{'seconds':>10}{'KiB fetched':>13}{'KiB pushed':>12}")
+            for name, elapsed, fetched, pushed in rows:
+                print(f"{name:<16}{elapsed:>10.2f}{fetched:>13.0f}{pushed:>12.0f}")
+            print(f"mirror cache: {mirrors_mib:.1f} MiB in mirrors, {pools_mib:.1f} MiB in shared pools")
+
+        for total in args.rows:
+            await asyncio.to_thread(_seed, 3, total)
+            print(f"\n== API latency at {total:,} task rows ({args.samples} requests each)")
+            print(f"{'endpoint':<24}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+            for name, p50, p99 in await _latency(client, 3, args.samples):
+                print(f"{name:<24}{p50:>10.1f}{p99:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", type=int, default=50, help="repositories in the bulk sync")
+    parser.add_argument("--repo-size", choices=SIZES, default="small", help="size of the bulk sync's repositories")
+    parser.add_argument("--workers", type=int, default=4, help="Celery worker threads")
+    parser.add_argument("--sizes", type=lambda v: v.split(","), default=list(SIZES), help="repo sizes for the cost table")
+    parser.add_argument("--cost-repos", type=int, default=3, help="repositories per size in the cost table")
+    parser.add_argument("--forks", type=int, default=3, help="forks of one upstream in the forks table (0 skips it)")
+    parser.add_argument("--rows", type=lambda v: [int(n) for n in v.split(",")], default=[10000, 100000], help="task-table sizes for the latency table")
+    parser.add_argument("--samples", type=int, default=200, help="requests per endpoint and table size")
+    parser.add_argument("--api-delay", type=float, default=0.0, help="latency of the fake REST API in seconds")
+    parser.add_argument("--redis", action="store_true", help="use CELERY_BROKER_URL's Redis instead of fakeredis (its data is not cleaned up)")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for a bulk sync to finish")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="syncpulse-bench-")
+    provider = ProviderServer(gitee_root=f"{workdir}/gitee", owner=OWNER, delay=args.api_delay).start()
+    _configure(workdir, provider, args)
+    _setup_db()
+    print(f"workdir {workdir}\n")
+    asyncio.run(_run(provider, workdir, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 03:41:14.104997
+
+The tables as `Base.metadata.create_all` used to create them on API start.
+Databases created that way are adopted with `alembic stamp 0001`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('github_id', sa.String(length=255), nullable=True),
+    sa.Column('github_username', sa.String(length=255), nullable=True),
+    sa.Column('github_access_token', sa.String(length=255), nullable=True),
+    sa.Column('gitee_id', sa.String(length=255), nullable=True),
+    sa.Column('gitee_username', sa.String(length=255), nullable=True),
+    sa.Column('gitee_access_token', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_gitee_id'), 'users', ['gitee_id'], unique=True)
+    op.create_index(op.f('ix_users_github_id'), 'users', ['github_id'], unique=True)
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+
+    op.create_table('repository_sync_tasks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('github_repo_url', sa.String(length=255), nullable=False),
+    sa.Column('gitee_repo_url', sa.String(length=255), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=True),
+    sa.Column('error_message', sa.String(length=1024), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_repository_sync_tasks_id'), 'repository_sync_tasks', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_repository_sync_tasks_id'), table_name='repository_sync_tasks')
+    op.drop_table('repository_sync_tasks')
+    op.drop_index(op.f('ix_users_id'), table_name='users')
+    op.drop_index(op.f('ix_users_github_id'), table_name='users')
+    op.drop_index(op.f('ix_users_gitee_id'), table_name='users')
+    op.drop_table('users')
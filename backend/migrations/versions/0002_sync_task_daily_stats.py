@@ -0,0 +1,57 @@
+"""dashboard rollups
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 03:41:14.104997
+
+`sync_task_daily_stats` counts tasks per user, creation day and status (see
+app.services.task_stats). It is filled from the existing task log, like
+`python -m app.services.task_stats` rebuilds it.
+"""
+from collections import Counter
+from datetime import timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    stats = op.create_table('sync_task_daily_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'status')
+    )
+
+    tasks = sa.table('repository_sync_tasks',
+        sa.column('user_id', sa.Integer()),
+        sa.column('status', sa.String()),
+        sa.column('created_at', sa.DateTime()),
+    )
+    counts = Counter()
+    for user_id, status, created_at in op.get_bind().execute(
+        sa.select(tasks.c.user_id, tasks.c.status, tasks.c.created_at).where(
+            tasks.c.user_id.isnot(None), tasks.c.status.isnot(None), tasks.c.created_at.isnot(None)
+        )
+    ):
+        # Naive timestamps are UTC, as in task_stats._day
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(timezone.utc)
+        counts[(user_id, created_at.date(), status)] += 1
+
+    rows = [{"user_id": user_id, "day": day, "status": status, "count": count} for (user_id, day, status), count in counts.items()]
+    for i in range(0, len(rows), 1000):
+        op.bulk_insert(stats, rows[i:i + 1000])
+
+
+def downgrade() -> None:
+    op.drop_table('sync_task_daily_stats')
@@ -0,0 +1,36 @@
+"""composite indexes for the hot task queries
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 04:02:37.512118
+
+- (user_id, github_repo_url, status): "is there already an active task for this repo"
+  on every trigger path (single, bulk, webhook)
+- (user_id, status, created_at): logs filtered by status, newest first
+- (user_id, created_at): logs without a status filter and the repo list's activity window
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_sync_tasks_user_repo_status', 'repository_sync_tasks', ['user_id', 'github_repo_url', 'status'], unique=False)
+    op.create_index('ix_sync_tasks_user_status_created', 'repository_sync_tasks', ['user_id', 'status', 'created_at'], unique=False)
+    op.create_index('ix_sync_tasks_user_created', 'repository_sync_tasks', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    # MySQL backs the user_id foreign key with one of these; give it its own index first
+    if op.get_bind().dialect.name == "mysql":
+        op.create_index('ix_repository_sync_tasks_user_id', 'repository_sync_tasks', ['user_id'], unique=False)
+    op.drop_index('ix_sync_tasks_user_created', table_name='repository_sync_tasks')
+    op.drop_index('ix_sync_tasks_user_status_created', table_name='repository_sync_tasks')
+    op.drop_index('ix_sync_tasks_user_repo_status', table_name='repository_sync_tasks')
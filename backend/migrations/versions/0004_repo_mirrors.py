@@ -0,0 +1,94 @@
+"""per-repository mirror state
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 06:12:48.204117
+
+`repo_mirrors` holds one row per (user, GitHub repo). Existing repos are backfilled from the
+task log: the newest task and its status, the last successful sync and the heatmap window.
+Refs, durations and transfer sizes fill in as the repos sync again.
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVITY_DAYS = 21
+
+
+def upgrade() -> None:
+    repo_mirrors = op.create_table('repo_mirrors',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('github_repo_url', sa.String(length=255), nullable=False),
+    sa.Column('gitee_repo_url', sa.String(length=255), nullable=False),
+    sa.Column('last_task_id', sa.Integer(), nullable=True),
+    sa.Column('last_status', sa.String(length=50), nullable=True),
+    sa.Column('synced_refs', sa.JSON(), nullable=True),
+    sa.Column('last_duration', sa.Float(), nullable=True),
+    sa.Column('bytes_transferred', sa.BigInteger(), nullable=True),
+    sa.Column('last_success_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('activity', sa.JSON(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'github_repo_url', name='uq_repo_mirrors_user_repo')
+    )
+
+    # Newest task per repo
+    op.execute("""
+        INSERT INTO repo_mirrors (user_id, github_repo_url, gitee_repo_url, last_task_id, last_status)
+        SELECT t.user_id, t.github_repo_url, t.gitee_repo_url, t.id, t.status
+        FROM repository_sync_tasks t
+        JOIN (
+            SELECT MAX(id) AS id FROM repository_sync_tasks
+            WHERE user_id IS NOT NULL
+            GROUP BY user_id, github_repo_url
+        ) latest ON latest.id = t.id
+    """)
+    op.execute("""
+        UPDATE repo_mirrors SET last_success_at = (
+            SELECT MAX(COALESCE(t.updated_at, t.created_at)) FROM repository_sync_tasks t
+            WHERE t.user_id = repo_mirrors.user_id
+              AND t.github_repo_url = repo_mirrors.github_repo_url
+              AND t.status IN ('completed', 'up_to_date')
+        )
+    """)
+
+    # Heatmap window: tasks per day, as the repo list used to count them
+    tasks = sa.table('repository_sync_tasks',
+        sa.column('user_id', sa.Integer()),
+        sa.column('github_repo_url', sa.String()),
+        sa.column('created_at', sa.DateTime()),
+    )
+    since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=ACTIVITY_DAYS)
+    bind = op.get_bind()
+    counts = Counter()
+    for user_id, url, created_at in bind.execute(
+        sa.select(tasks.c.user_id, tasks.c.github_repo_url, tasks.c.created_at).where(
+            tasks.c.user_id.isnot(None), tasks.c.created_at >= since
+        )
+    ):
+        counts[(user_id, url, created_at.date().isoformat())] += 1
+
+    activity = {}
+    for (user_id, url, day), count in counts.items():
+        activity.setdefault((user_id, url), {})[day] = count
+    for (user_id, url), days in activity.items():
+        bind.execute(
+            repo_mirrors.update()
+            .where(repo_mirrors.c.user_id == user_id, repo_mirrors.c.github_repo_url == url)
+            .values(activity=days)
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('repo_mirrors')
@@ -0,0 +1,46 @@
+"""sync task leases
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 09:41:05.318227
+
+- `lease_expires_at`: renewed by the worker running a sync; the reaper recovers `syncing`
+  tasks whose lease ran out, through (status, lease_expires_at)
+- `recoveries`: how many runs of a task were lost with their worker
+
+Tasks already `syncing` get an expired lease, so the first reaper run recovers the ones left
+behind by workers that died before this version. Stop the old workers before upgrading:
+their syncs do not renew a lease.
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('repository_sync_tasks', sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('repository_sync_tasks', sa.Column('recoveries', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_sync_tasks_status_lease', 'repository_sync_tasks', ['status', 'lease_expires_at'], unique=False)
+
+    # Bound in UTC (naive, like the rest of the schema's timestamps): CURRENT_TIMESTAMP would be
+    # in the MySQL session's time zone
+    tasks = sa.table('repository_sync_tasks',
+        sa.column('status', sa.String()),
+        sa.column('lease_expires_at', sa.DateTime()),
+    )
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    op.execute(tasks.update().where(tasks.c.status == 'syncing').values(lease_expires_at=now))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sync_tasks_status_lease', table_name='repository_sync_tasks')
+    op.drop_column('repository_sync_tasks', 'recoveries')
+    op.drop_column('repository_sync_tasks', 'lease_expires_at')
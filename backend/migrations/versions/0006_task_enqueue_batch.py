@@ -0,0 +1,28 @@
+"""task enqueue batch marker
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 11:02:47.640193
+
+`enqueue_batch` tags the rows of one bulk INSERT so their ids are read back by marker
+instead of by (user, repo, pending), which also matched rows inserted concurrently by
+other triggers. Rows from before this revision keep NULL.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('repository_sync_tasks', sa.Column('enqueue_batch', sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('repository_sync_tasks', 'enqueue_batch')
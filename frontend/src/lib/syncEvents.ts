@@ -0,0 +1,29 @@
+import { useEffect, useRef } from 'react';
+
+export interface SyncEvent {
+    type: 'status' | 'progress';
+    task_id: number;
+    user_id: number;
+    github_repo_url: string;
+    status: 'pending' | 'syncing' | 'completed' | 'up_to_date' | 'failed' | 'cancelled';
+    phase?: 'check' | 'lookup' | 'create' | 'clone' | 'push' | 'fallback' | null;
+    stage?: string;
+    percent?: number;
+    done?: number;
+    total?: number;
+    transferred?: string | null;
+    error_message?: string | null;
+}
+
+// Subscribes to the user's live sync events (SSE) instead of polling the API
+export function useSyncEvents(userId: number | null, onEvent: (event: SyncEvent) => void) {
+    const handler = useRef(onEvent);
+    handler.current = onEvent;
+
+    useEffect(() => {
+        if (!userId) return;
+        const source = new EventSource(`http://localhost:8001/api/v1/progress/${userId}`);
+        source.onmessage = (message) => handler.current(JSON.parse(message.data));
+        return () => source.close();
+    }, [userId]);
+}
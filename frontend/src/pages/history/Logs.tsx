@@ -10,16 +10,18 @@ import {
     ExternalLink,
     Filter,
     Calendar,
-    ArrowRightLeft
+    ArrowRightLeft,
+    Ban
 } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { cn } from '../../lib/utils';
+import { useSyncEvents } from '../../lib/syncEvents';
 
 interface SyncLog {
     id: number;
     github_repo_url: string;
     gitee_repo_url: string;
-    status: 'completed' | 'failed' | 'syncing' | 'pending';
+    status: 'completed' | 'up_to_date' | 'failed' | 'cancelled' | 'syncing' | 'pending';
     error_message: string | null;
     created_at: string;
 }
@@ -34,6 +36,13 @@ export default function SyncLogs() {
         fetchLogs();
     }, [userId, statusFilter]);
 
+    useSyncEvents(userId, (event) => {
+        if (event.type !== 'status') return;
+        setLogs(current => current.map(log => log.id === event.task_id
+            ? { ...log, status: event.status, error_message: event.error_message ?? log.error_message }
+            : log));
+    });
+
     const fetchLogs = async () => {
         try {
             setLoading(true);
@@ -48,10 +57,24 @@ export default function SyncLogs() {
         }
     };
 
+    const cancelSync = async (taskId: number) => {
+        try {
+            const res = await axios.post(`http://localhost:8001/api/v1/sync/cancel/${taskId}`);
+            // A running sync stays `syncing` until the worker has stopped git; its status event follows
+            if (res.data.status === 'cancelled') {
+                setLogs(current => current.map(log => log.id === taskId ? { ...log, status: 'cancelled' } : log));
+            }
+        } catch (error) {
+            console.error("Failed to cancel sync", error);
+        }
+    };
+
     const getStatusInfo = (status: string) => {
         switch (status) {
-            case 'completed': return { icon: <CheckCircle2 className="w-5 h-5 text-emerald-400" />, color: "text-emerald-400", bg: "bg-emerald-500/10", border: "border-emerald-500/20" };
+            case 'completed':
+            case 'up_to_date': return { icon: <CheckCircle2 className="w-5 h-5 text-emerald-400" />, color: "text-emerald-400", bg: "bg-emerald-500/10", border: "border-emerald-500/20" };
             case 'failed': return { icon: <XCircle className="w-5 h-5 text-rose-400" />, color: "text-rose-400", bg: "bg-rose-500/10", border: "border-rose-500/20" };
+            case 'cancelled': return { icon: <Ban className="w-5 h-5 text-zinc-400" />, color: "text-zinc-400", bg: "bg-zinc-500/10", border: "border-zinc-500/20" };
             case 'syncing': return { icon: <RefreshCw className="w-5 h-5 text-blue-400 animate-spin" />, color: "text-blue-400", bg: "bg-blue-500/10", border: "border-blue-500/20" };
             default: return { icon: <Clock className="w-5 h-5 text-amber-400" />, color: "text-amber-400", bg: "bg-amber-500/10", border: "border-amber-500/20" };
         }
@@ -104,7 +127,7 @@ export default function SyncLogs() {
                 </div>
 
                 <div className="flex bg-white/5 p-1 rounded-2xl border border-white/5 backdrop-blur-sm">
-                    {['all', 'completed', 'failed', 'syncing'].map((status) => (
+                    {['all', 'completed', 'failed', 'cancelled', 'syncing'].map((status) => (
                         <button
                             key={status}
                             onClick={() => setStatusFilter(status)}
@@ -219,6 +242,15 @@ export default function SyncLogs() {
                                         </div>
 
                                         <div className="flex items-center gap-4 lg:ml-auto">
+                                            {(log.status === 'pending' || log.status === 'syncing') && (
+                                                <button
+                                                    onClick={() => cancelSync(log.id)}
+                                                    title="Cancel sync"
+                                                    className="p-3 bg-white/5 rounded-xl border border-white/5 text-white/40 hover:text-rose-400 hover:bg-rose-500/10 transition-all"
+                                                >
+                                                    <Ban className="w-5 h-5" />
+                                                </button>
+                                            )}
                                             <a
                                                 href={log.github_repo_url}
                                                 target="_blank"
@@ -233,7 +265,7 @@ export default function SyncLogs() {
                                     {/* Accent gradient background */}
                                     <div className={cn(
                                         "absolute top-0 right-0 w-64 h-64 blur-[100px] -translate-y-1/2 translate-x-1/2 rounded-full opacity-0 group-hover:opacity-10 transition-opacity duration-500",
-                                        log.status === 'completed' ? "bg-emerald-500" : log.status === 'failed' ? "bg-rose-500" : "bg-blue-500"
+                                        (log.status === 'completed' || log.status === 'up_to_date') ? "bg-emerald-500" : log.status === 'failed' ? "bg-rose-500" : "bg-blue-500"
                                     )} />
                                 </motion.div>
                             );
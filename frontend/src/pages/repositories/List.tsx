@@ -4,6 +4,7 @@ import { useAuthStore } from '../../store/authStore';
 import { Github, Search, ArrowRight, RefreshCw } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { cn } from '../../lib/utils';
+import { useSyncEvents } from '../../lib/syncEvents';
 
 interface Repo {
     name: string;
@@ -11,7 +12,7 @@ interface Repo {
     html_url: string;
     clone_url: string;
     description: string;
-    sync_status?: 'pending' | 'syncing' | 'completed' | 'failed' | null;
+    sync_status?: 'pending' | 'syncing' | 'completed' | 'up_to_date' | 'failed' | 'cancelled' | null;
     activity_data?: number[];
 }
 
@@ -73,6 +74,13 @@ export default function Repositories() {
         fetchDashboard();
     }, [userId]);
 
+    // Status changes are pushed by the server; no need to poll
+    useSyncEvents(userId, (event) => {
+        if (event.type !== 'status') return;
+        setRepos(current => current.map(r => r.clone_url === event.github_repo_url ? { ...r, sync_status: event.status } : r));
+        if (event.status !== 'syncing') fetchDashboard();
+    });
+
     const fetchRepos = async (isRefresh: boolean = false) => {
         try {
             setLoading(true);
@@ -104,12 +112,8 @@ export default function Repositories() {
                 user_id: userId,
                 github_repo_url: repoUrl
             });
-            // Polling or refreshing after a delay
-            setTimeout(() => {
-                fetchRepos();
-                fetchDashboard();
-                setSyncingRepo(null);
-            }, 2000);
+            setRepos(current => current.map(r => r.clone_url === repoUrl ? { ...r, sync_status: 'pending' } : r));
+            setSyncingRepo(null);
         } catch (error) {
             console.error("Failed to trigger sync", error);
             setSyncingRepo(null);
@@ -126,11 +130,7 @@ export default function Repositories() {
             // Update local state for immediate feedback
             setRepos(repos.map(r => ({ ...r, sync_status: repoStatusWaitList(r, 'pending') })));
 
-            setTimeout(() => {
-                fetchRepos();
-                fetchDashboard();
-                setIsBulkSyncing(false);
-            }, 3000);
+            setIsBulkSyncing(false);
         } catch (error) {
             console.error("Failed to trigger bulk sync", error);
             setIsBulkSyncing(false);
@@ -138,8 +138,8 @@ export default function Repositories() {
     };
 
     const repoStatusWaitList = (r: Repo, status: string) => {
-        if (r.sync_status === 'completed' || r.sync_status === 'failed' || r.sync_status === 'syncing') return r.sync_status;
-        return status as 'pending' | 'syncing' | 'completed' | 'failed' | null;
+        if (r.sync_status === 'completed' || r.sync_status === 'up_to_date' || r.sync_status === 'failed' || r.sync_status === 'syncing') return r.sync_status;
+        return status as 'pending' | 'syncing' | 'completed' | 'up_to_date' | 'failed' | 'cancelled' | null;
     }
 
     const filteredRepos = repos.filter(repo =>
@@ -150,8 +150,9 @@ export default function Repositories() {
     const getStatusText = (repo: Repo) => {
         if (syncingRepo === repo.clone_url) return "Syncing...";
         if (repo.sync_status === 'syncing' || repo.sync_status === 'pending') return "Syncing...";
-        if (repo.sync_status === 'completed') return "Completed";
+        if (repo.sync_status === 'completed' || repo.sync_status === 'up_to_date') return "Completed";
         if (repo.sync_status === 'failed') return "Failed";
+        if (repo.sync_status === 'cancelled') return "Cancelled";
         return "Not Mirrored";
     };
 